@@ -0,0 +1,131 @@
+# api/resources.py
+"""
+Field definitions for the catalog API.
+
+A Resource maps each public field either to a column lookup passed to
+.values(), or to a function computing it from a few such columns. Rows are
+built straight from the .values() dicts, without model instances, and only
+the columns behind the requested fields (?fields=) are selected.
+"""
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from ecomstore.api_errors import ApiError
+from products.models import ProductVariantAttribute
+
+
+def _image_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Resource:
+
+    def __init__(self, columns, computed=None, default_fields=None):
+        self.columns = columns
+        # {field: (column lookups it needs, function(row) -> value)}
+        self.computed = computed or {}
+        self.fields = [*columns, *self.computed]
+        self.default_fields = default_fields or self.fields
+
+    def parse_fields(self, value):
+        """The fields requested by a ?fields=a,b,c parameter, or the defaults."""
+        if not value:
+            return list(self.default_fields)
+        fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+        unknown = [field for field in fields if field not in self.columns and field not in self.computed]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.fields)}.")
+        return fields
+
+    def lookups(self, fields, extra=()):
+        """The .values() lookups needed to build `fields`, plus `extra` (e.g. ordering columns)."""
+        lookups = dict.fromkeys(extra)
+        for field in fields:
+            if field in self.columns:
+                lookups[self.columns[field]] = None
+            else:
+                lookups.update(dict.fromkeys(self.computed[field][0]))
+        return list(lookups)
+
+    def serialize(self, rows, fields):
+        data = []
+        for row in rows:
+            item = {}
+            for field in fields:
+                if field in self.columns:
+                    item[field] = row[self.columns[field]]
+                else:
+                    item[field] = self.computed[field][1](row)
+            data.append(item)
+        return data
+
+
+products = Resource(
+    columns={
+        'id': 'id',
+        'name': 'name',
+        'slug': 'slug',
+        'description': 'description',
+        'category': 'category_id',
+        'category_slug': 'category__slug',
+        'category_name': 'category__name',
+        'min_price': 'min_price',
+        'max_price': 'max_price',
+        'total_stock': 'total_stock',
+        'in_stock': 'in_stock',
+        'review_count': 'review_count',
+        'rating_avg': 'rating_avg',
+        'updated_at': 'updated_at',
+    },
+    computed={
+        'url': (['slug'], lambda row: reverse('products:product_detail', args=[row['slug']])),
+        'image': (['image'], lambda row: _image_url(row['image'])),
+        'rating_histogram': (
+            [f'rating_{stars}_count' for stars in range(5, 0, -1)],
+            lambda row: {str(stars): row[f'rating_{stars}_count'] for stars in range(5, 0, -1)},
+        ),
+    },
+    default_fields=['id', 'name', 'slug', 'category', 'min_price', 'max_price', 'in_stock', 'review_count', 'rating_avg', 'url'],
+)
+
+variants = Resource(
+    columns={
+        'id': 'id',
+        'product': 'product_id',
+        'sku': 'sku',
+        'price': 'price',
+        'stock': 'stock',
+        'is_active': 'is_active',
+    },
+    computed={
+        'image': (['image'], lambda row: _image_url(row['image'])),
+        # Filled in by attach_attributes with one extra query for the whole page
+        'attributes': (['id'], lambda row: row['attributes']),
+    },
+    default_fields=['id', 'product', 'sku', 'price', 'stock', 'is_active', 'attributes'],
+)
+
+categories = Resource(
+    columns={
+        'id': 'id',
+        'name': 'name',
+        'slug': 'slug',
+        'description': 'description',
+    },
+    computed={
+        'url': (['slug'], lambda row: reverse('products:category_detail', args=[row['slug']])),
+    },
+    default_fields=['id', 'name', 'slug', 'url'],
+)
+
+
+def attach_attributes(rows):
+    """Sets row['attributes'] = {variation: value} on variant rows, in one query."""
+    by_id = {row['id']: row for row in rows}
+    for row in rows:
+        row['attributes'] = {}
+    for variant_id, variation, value in ProductVariantAttribute.objects.filter(
+        product_variant_id__in=list(by_id),
+    ).order_by('variation__name').values_list('product_variant_id', 'variation__name', 'attribute_value'):
+        by_id[variant_id]['attributes'][variation] = value
+    return rows
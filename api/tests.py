@@ -0,0 +1,118 @@
+# api/tests.py
+import json
+
+from django.test import Client, TestCase
+
+from products.models import Category, Product, ProductVariant, ProductVariantAttribute, Variation
+from products.pagination import encode_cursor
+
+
+class CatalogApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        cls.bags = Category.objects.create(name='Bags', slug='bags')
+        size = Variation.objects.create(name='Size')
+        color = Variation.objects.create(name='Color')
+        cls.products = []
+        for number in range(5):
+            product = Product.objects.create(
+                category=cls.shoes if number % 2 else cls.bags, name=f'Product {number}', slug=f'product-{number}',
+            )
+            for variant_number in range(2):
+                variant = ProductVariant.objects.create(
+                    product=product, sku=f'SKU-{number}-{variant_number}', price=10 + variant_number, stock=3,
+                )
+                ProductVariantAttribute.objects.create(product_variant=variant, variation=size, attribute_value=str(40 + variant_number))
+                ProductVariantAttribute.objects.create(product_variant=variant, variation=color, attribute_value='Red')
+            cls.products.append(product)
+        cls.out_of_stock = Product.objects.create(category=cls.bags, name='Sold out', slug='sold-out')
+
+    def setUp(self):
+        self.client = Client(SERVER_NAME='localhost')
+
+    def get(self, url, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        return response.status_code, json.loads(response.content)
+
+    def test_product_list_is_one_query(self):
+        status, body = self.get('/api/v1/products/', 1, page_size=2)
+        self.assertEqual(status, 200)
+        self.assertEqual([item['name'] for item in body['data']], ['Product 0', 'Product 1'])
+        self.assertEqual(body['data'][0]['min_price'], '10.00')
+        self.assertEqual(body['data'][0]['url'], '/products/product-0/')
+
+    def test_product_list_follows_cursors(self):
+        names = []
+        url, params = '/api/v1/products/', {'page_size': 2}
+        while url:
+            status, body = self.get(url, 1, **params)
+            names += [item['name'] for item in body['data']]
+            url, params = body['next'], {}
+        self.assertEqual(names, [f'Product {number}' for number in range(5)])
+
+    def test_sparse_fields(self):
+        status, body = self.get('/api/v1/products/', 1, fields='id,category_name,rating_histogram')
+        self.assertEqual(set(body['data'][0]), {'id', 'category_name', 'rating_histogram'})
+        self.assertEqual(body['data'][0]['rating_histogram'], {'5': 0, '4': 0, '3': 0, '2': 0, '1': 0})
+
+    def test_unknown_fields_are_rejected(self):
+        status, body = self.get('/api/v1/products/', 0, fields='id,secret')
+        self.assertEqual(status, 400)
+        self.assertIn('secret', body['error'])
+
+    def test_crafted_cursors_are_rejected(self):
+        for cursor in ['garbage', encode_cursor(['x', 'abc']), encode_cursor(['x'])]:
+            with self.subTest(cursor=cursor):
+                status, body = self.get('/api/v1/products/', 0, cursor=cursor)
+                self.assertEqual(status, 400)
+                self.assertEqual(body['error'], 'Invalid cursor.')
+
+    def test_product_list_by_category(self):
+        status, body = self.get('/api/v1/products/', 1, category='shoes', fields='name')
+        self.assertEqual([item['name'] for item in body['data']], ['Product 1', 'Product 3'])
+
+    def test_batched_ids_keep_the_requested_order(self):
+        ids = [self.out_of_stock.pk, self.products[3].pk, 999999, self.products[0].pk]
+        status, body = self.get('/api/v1/products/', 1, ids=','.join(map(str, ids)), fields='id')
+        self.assertEqual([item['id'] for item in body['data']], [self.out_of_stock.pk, self.products[3].pk, self.products[0].pk])
+
+    def test_product_detail_with_variants(self):
+        product = self.products[0]
+        status, body = self.get(f'/api/v1/products/{product.pk}/', 3, include='variants')
+        self.assertEqual(body['data']['name'], 'Product 0')
+        self.assertEqual(len(body['data']['variants']), 2)
+        self.assertEqual(body['data']['variants'][1]['attributes'], {'Color': 'Red', 'Size': '41'})
+
+    def test_product_detail_without_variants_is_one_query(self):
+        status, body = self.get(f'/api/v1/products/{self.products[0].pk}/', 1, fields='name')
+        self.assertEqual(body, {'data': {'name': 'Product 0'}})
+
+    def test_missing_product(self):
+        status, body = self.get('/api/v1/products/999999/', 1)
+        self.assertEqual(status, 404)
+
+    def test_variant_batch_lookup(self):
+        variant_ids = list(ProductVariant.objects.order_by('id').values_list('pk', flat=True)[:6])
+        status, body = self.get('/api/v1/variants/', 2, ids=','.join(map(str, variant_ids)))
+        self.assertEqual([item['id'] for item in body['data']], variant_ids)
+        status, body = self.get('/api/v1/variants/', 1, ids=','.join(map(str, variant_ids)), fields='id,price')
+        self.assertEqual(body['data'][0], {'id': variant_ids[0], 'price': '10.00'})
+
+    def test_variants_of_a_product(self):
+        status, body = self.get('/api/v1/variants/', 2, product=self.products[1].pk)
+        self.assertEqual([item['sku'] for item in body['data']], ['SKU-1-0', 'SKU-1-1'])
+
+    def test_category_list(self):
+        status, body = self.get('/api/v1/categories/', 1)
+        self.assertEqual([item['slug'] for item in body['data']], ['bags', 'shoes'])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.get('/api/v1/products/', 1, page_size=1)
+        self.get('/api/v1/products/', 1, page_size=100)
+        self.get('/api/v1/variants/', 2, product=self.products[0].pk, page_size=100)
+
+    def test_writes_are_not_allowed(self):
+        self.assertEqual(self.client.post('/api/v1/products/').status_code, 405)
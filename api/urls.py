@@ -0,0 +1,12 @@
+# api/urls.py
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('products/', views.product_list, name='product_list'),
+    path('products/<int:pk>/', views.product_detail, name='product_detail'),
+    path('variants/', views.variant_list, name='variant_list'),
+    path('categories/', views.category_list, name='category_list'),
+]
@@ -0,0 +1,145 @@
+# api/views.py
+"""
+Read-only JSON catalog API, version 1 (mounted at /api/v1/).
+
+Every endpoint accepts ?fields= to pick the returned fields. Lists are
+cursor-paginated (?cursor=, ?page_size=) or, with ?ids=1,2,3, return exactly
+those objects in the order asked for. Each endpoint runs a fixed number of
+queries whatever the page size: one per resource, plus one for variant
+attributes when they are requested (see api/tests.py).
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from ecomstore.api_errors import ApiError, error_response
+from products.models import Category, Product, ProductVariant
+from products.pagination import InvalidCursor, get_page_size, page_querystring, paginate_keyset
+from products.views import DEFAULT_PRODUCT_SORT, PRODUCT_LIST_ORDERINGS
+
+from . import resources
+from .resources import attach_attributes
+
+# Most objects one ?ids= batch lookup may ask for
+MAX_IDS = 100
+
+
+def api_view(view):
+    """GET-only JSON view; ApiError becomes an error response."""
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return JsonResponse(view(request, *args, **kwargs))
+        except ApiError as exc:
+            return error_response(exc)
+    return wrapper
+
+
+def _ids(request):
+    """The ids of an ?ids=1,2,3 batch lookup, or None."""
+    value = request.GET.get('ids')
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+    except ValueError:
+        raise ApiError("ids must be a comma-separated list of integers.")
+    if len(ids) > MAX_IDS:
+        raise ApiError(f"At most {MAX_IDS} ids per request.")
+    return ids
+
+
+def _by_ids(queryset, ids, resource, fields):
+    rows = {row['id']: row for row in queryset.filter(pk__in=ids).values(*resource.lookups(fields, extra=['id']))}
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def _page(request, queryset, resource, fields, ordering):
+    """One keyset page of `queryset` as .values() rows, with links to its neighbours."""
+    lookups = resource.lookups(fields, extra=[field.lstrip('-') for field in ordering])
+    try:
+        page = paginate_keyset(
+            queryset.values(*lookups), ordering, request.GET.get('cursor'),
+            get_page_size(request, default=settings.API_PAGE_SIZE, maximum=settings.API_MAX_PAGE_SIZE),
+        )
+    except InvalidCursor:
+        raise ApiError("Invalid cursor.")
+    links = {
+        'next': f'{request.path}?{page_querystring(request, page.next_cursor)}' if page.has_next else None,
+        'previous': f'{request.path}?{page_querystring(request, page.previous_cursor)}' if page.has_previous else None,
+    }
+    return page.object_list, links
+
+
+@api_view
+def product_list(request):
+    """In-stock products, optionally of one ?category=<slug>, sorted like the storefront (?sort=)."""
+    fields = resources.products.parse_fields(request.GET.get('fields'))
+    ids = _ids(request)
+    if ids is not None:
+        # Batch lookups return any product, in stock or not
+        rows = _by_ids(Product.objects.all(), ids, resources.products, fields)
+        return {'data': resources.products.serialize(rows, fields)}
+
+    sort = request.GET.get('sort', DEFAULT_PRODUCT_SORT)
+    if sort not in PRODUCT_LIST_ORDERINGS:
+        raise ApiError(f"Unknown sort. Available: {', '.join(PRODUCT_LIST_ORDERINGS)}.")
+    products = Product.objects.filter(in_stock=True)
+    if request.GET.get('category'):
+        products = products.filter(category__slug=request.GET['category'])
+    rows, links = _page(request, products, resources.products, fields, PRODUCT_LIST_ORDERINGS[sort])
+    return {'data': resources.products.serialize(rows, fields), **links}
+
+
+@api_view
+def product_detail(request, pk):
+    """One product; ?include=variants embeds its variants (?variant_fields= picks their fields)."""
+    fields = resources.products.parse_fields(request.GET.get('fields'))
+    include = set(request.GET.get('include', '').split(','))
+    variant_fields = resources.variants.parse_fields(request.GET.get('variant_fields')) if 'variants' in include else None
+
+    row = Product.objects.filter(pk=pk).values(*resources.products.lookups(fields)).first()
+    if row is None:
+        raise ApiError("Product not found.", status=404)
+    data = resources.products.serialize([row], fields)[0]
+    if variant_fields is not None:
+        variant_rows = list(
+            ProductVariant.objects.filter(product_id=pk).order_by('id').values(*resources.variants.lookups(variant_fields, extra=['id']))
+        )
+        if 'attributes' in variant_fields:
+            attach_attributes(variant_rows)
+        data['variants'] = resources.variants.serialize(variant_rows, variant_fields)
+    return {'data': data}
+
+
+@api_view
+def variant_list(request):
+    """Variants by ?ids= (e.g. to refresh a cart) or of one ?product=<id>; attributes cost one extra query."""
+    fields = resources.variants.parse_fields(request.GET.get('fields'))
+    ids = _ids(request)
+    if ids is not None:
+        rows = _by_ids(ProductVariant.objects.all(), ids, resources.variants, fields)
+        links = {}
+    else:
+        try:
+            product_id = int(request.GET['product'])
+        except (KeyError, ValueError):
+            raise ApiError("Pass ids=<id,...> or product=<id>.")
+        rows, links = _page(request, ProductVariant.objects.filter(product_id=product_id), resources.variants, fields, ('id',))
+    if 'attributes' in fields:
+        attach_attributes(rows)
+    return {'data': resources.variants.serialize(rows, fields), **links}
+
+
+@api_view
+def category_list(request):
+    fields = resources.categories.parse_fields(request.GET.get('fields'))
+    ids = _ids(request)
+    if ids is not None:
+        rows = _by_ids(Category.objects.all(), ids, resources.categories, fields)
+        return {'data': resources.categories.serialize(rows, fields)}
+    rows, links = _page(request, Category.objects.all(), resources.categories, fields, ('name', 'id'))
+    return {'data': resources.categories.serialize(rows, fields), **links}
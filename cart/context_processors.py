@@ -0,0 +1,14 @@
+# cart/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from .storage import get_cart_storage
+
+
+def get_cart_summary(request):
+    """The visitor's cart summary; never creates a cart or a session."""
+    return get_cart_storage(request).summary()
+
+
+def cart_summary(request):
+    """`cart_summary` for the header badge, only looked up if a template uses it."""
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_summary(request))}
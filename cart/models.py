@@ -18,6 +18,9 @@ class Cart(models.Model):
         # Calculate total price of all items in the cart
         return sum(item.get_total() for item in self.items.all())
 
+    def get_total_items(self):
+        return sum(item.quantity for item in self.items.all())
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     # CHANGE: Link to ProductVariant instead of Product
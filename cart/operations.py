@@ -0,0 +1,204 @@
+# cart/operations.py
+"""
+Cart writes as single statements.
+
+Adding a line is an UPDATE ... SET quantity = quantity + n, followed, only
+when the variant isn't in the cart yet, by one INSERT whose variant id and
+price are subqueries on ProductVariant. If two requests insert the same line
+at once, unique_together('cart', 'product_variant') rejects the second
+INSERT and it falls back to the increment, so no quantity is lost.
+Changing a quantity is one UPDATE and removing a line one DELETE, also
+when several lines change at once (set_quantities). Merging
+a whole cart into another (on login) is one upsert for all its lines that
+sums the quantities in the database.
+
+These are the database side of cart storage (see cart/storage.py). The
+cart id is remembered in the session, so none of this has to load the
+Cart, Product or ProductVariant first. Every write drops the cart's cached
+summary (cart/summary.py).
+"""
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, F, Subquery, Value, When
+
+from products.models import ProductVariant
+
+from .models import Cart, CartItem
+from .summary import invalidate_cart_summary
+
+# Session key holding [user id or None, cart id]
+CART_SESSION_KEY = 'cart'
+
+
+def _owner(user):
+    return user.pk if user.is_authenticated else None
+
+
+def _cart_lookup(request, user):
+    if user.is_authenticated:
+        return {'user': user}
+    if not request.session.session_key:
+        request.session.save()
+    return {'session_key': request.session.session_key}
+
+
+def peek_cart_id(request, user=None):
+    """The cart id remembered in the session for the current user (or `user`), or None. Never queries."""
+    cached = request.session.get(CART_SESSION_KEY)
+    if cached and cached[0] == _owner(user or request.user):
+        return cached[1]
+    return None
+
+
+def get_cart_id(request, create=True, user=None):
+    """
+    The id of the visitor's cart (or `user`'s, while logging them in): from
+    the session, else one query (plus an INSERT when `create`ing it).
+    """
+    user = user or request.user
+    cart_id = peek_cart_id(request, user)
+    if cart_id is not None:
+        return cart_id
+    if not create and not user.is_authenticated and not request.session.session_key:
+        # No session, so no cart; don't create a session just to find that out
+        return None
+
+    lookup = _cart_lookup(request, user)
+    cart_id = Cart.objects.filter(**lookup).values_list('pk', flat=True).first()
+    if cart_id is None:
+        if not create:
+            return None
+        try:
+            with transaction.atomic():
+                cart_id = Cart.objects.create(**lookup).pk
+        except IntegrityError:
+            # A concurrent request created it
+            cart_id = Cart.objects.filter(**lookup).values_list('pk', flat=True).get()
+    request.session[CART_SESSION_KEY] = [_owner(user), cart_id]
+    return cart_id
+
+
+def forget_cart(request):
+    """Drops the remembered cart id, e.g. once checkout has deleted the cart."""
+    request.session.pop(CART_SESSION_KEY, None)
+
+
+def variant_queryset(product_id=None, variant_id=None):
+    """The active variant being bought, as a queryset usable in a subquery."""
+    variants = ProductVariant.objects.filter(is_active=True)
+    if product_id is not None:
+        variants = variants.filter(product_id=product_id)
+    if variant_id is not None:
+        variants = variants.filter(pk=variant_id)
+    return variants.order_by('id')[:1]
+
+
+def add_item(cart_id, product_id, variant_id=None, quantity=1):
+    """
+    Adds `quantity` of a product's variant (its first active one when
+    `variant_id` is None; any product's when `product_id` is None) to the
+    cart. Returns False if there is no such active variant. One UPDATE, plus
+    one INSERT for a new line.
+    """
+    variant = variant_queryset(product_id, variant_id)
+    line = CartItem.objects.filter(cart_id=cart_id, product_variant_id=Subquery(variant.values('pk')))
+    if line.update(quantity=F('quantity') + quantity):
+        invalidate_cart_summary(cart_id)
+        return True
+    try:
+        with transaction.atomic():
+            # A missing variant makes both subqueries NULL, which the NOT NULL columns reject
+            CartItem.objects.create(
+                cart_id=cart_id,
+                product_variant_id=Subquery(variant.values('pk')),
+                quantity=quantity,
+                price=Subquery(variant.values('price')),
+            )
+    except IntegrityError:
+        # Either someone added the line in the meantime, or the variant doesn't exist
+        if not line.update(quantity=F('quantity') + quantity):
+            return False
+    invalidate_cart_summary(cart_id)
+    return True
+
+
+def set_quantity(cart_id, variant_id, quantity):
+    """Sets a line's quantity (removing it when `quantity` <= 0). Returns False if it wasn't in the cart."""
+    if quantity <= 0:
+        return remove_item(cart_id, variant_id)
+    if not CartItem.objects.filter(cart_id=cart_id, product_variant_id=variant_id).update(quantity=quantity):
+        return False
+    invalidate_cart_summary(cart_id)
+    return True
+
+
+def set_quantities(cart_id, quantities):
+    """
+    Applies {variant id: quantity} (<= 0 removes the line) in one
+    transaction: one UPDATE for all new quantities and one DELETE for all
+    removals. Returns False, changing nothing, if any line isn't in the cart.
+    """
+    lines = CartItem.objects.filter(cart_id=cart_id)
+    updates = {variant_id: quantity for variant_id, quantity in quantities.items() if quantity > 0}
+    removals = [variant_id for variant_id, quantity in quantities.items() if quantity <= 0]
+    with transaction.atomic():
+        changed = 0
+        if updates:
+            changed += lines.filter(product_variant_id__in=list(updates)).update(quantity=Case(
+                *[When(product_variant_id=variant_id, then=Value(quantity)) for variant_id, quantity in updates.items()],
+            ))
+        if removals:
+            changed += lines.filter(product_variant_id__in=removals).delete()[0]
+        if changed != len(quantities):
+            transaction.set_rollback(True)
+            return False
+    invalidate_cart_summary(cart_id)
+    return True
+
+
+def remove_item(cart_id, variant_id):
+    """Deletes a line in one DELETE. Returns False if it wasn't in the cart."""
+    deleted, _ = CartItem.objects.filter(cart_id=cart_id, product_variant_id=variant_id).delete()
+    if not deleted:
+        return False
+    invalidate_cart_summary(cart_id)
+    return True
+
+
+def _merge_sql(connection, cart_id, lines):
+    """
+    The single upsert adding `lines` to a cart, as (sql, params). PostgreSQL
+    and SQLite name the conflicting key (ON CONFLICT); MySQL can't, and
+    updates on any duplicate key (ON DUPLICATE KEY UPDATE).
+    """
+    quote = connection.ops.quote_name
+    table = quote(CartItem._meta.db_table)
+    columns = ', '.join(quote(column) for column in ('cart_id', 'product_variant_id', 'quantity', 'price'))
+    rows = ', '.join(['(%s, %s, %s, %s)'] * len(lines))
+    params = [
+        value
+        for variant_id, (quantity, price) in lines.items()
+        for value in (cart_id, variant_id, quantity, price)
+    ]
+    quantity = quote('quantity')
+    # Lines already in the cart keep their price and only get the quantities summed
+    if connection.features.supports_update_conflicts_with_target:
+        conflict = (
+            f'ON CONFLICT ({quote("cart_id")}, {quote("product_variant_id")}) '
+            f'DO UPDATE SET {quantity} = {table}.{quantity} + EXCLUDED.{quantity}'
+        )
+    else:
+        conflict = f'ON DUPLICATE KEY UPDATE {quantity} = {quantity} + VALUES({quantity})'
+    return f'INSERT INTO {table} ({columns}) VALUES {rows} {conflict}', params
+
+
+def merge_lines(cart_id, lines):
+    """
+    Adds {variant id: (quantity, price)} to a cart in one upsert, however
+    many lines there are: new lines are inserted and the quantities of lines
+    already in the cart are summed by the database, so nothing has to be
+    read or locked first.
+    """
+    connection = connections[router.db_for_write(CartItem)]
+    with connection.cursor() as cursor:
+        cursor.execute(*_merge_sql(connection, cart_id, lines))
+    transaction.on_commit(lambda: invalidate_cart_summary(cart_id), using=connection.alias)
@@ -0,0 +1,12 @@
+# cart/signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .storage import merge_anonymous_cart
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    # Logins outside a request (e.g. scripts) have no anonymous cart to bring along
+    if request is not None and hasattr(request, 'session'):
+        merge_anonymous_cart(request, user)
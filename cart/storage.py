@@ -0,0 +1,259 @@
+# cart/storage.py
+"""
+Where a visitor's cart lives.
+
+Signed-in shoppers always keep their cart in the database (Cart/CartItem,
+written by cart/operations.py). Anonymous visitors use the backend named by
+CART_STORAGE_BACKEND:
+
+- SessionCartStorage (the default) keeps the lines in the session, so
+  browsing, or opening an empty cart, never creates a Cart row or even a
+  session. With SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+  the cart lives entirely in a signed cookie.
+- DatabaseCartStorage keeps them in a Cart keyed by the session key.
+
+Either way the lines become Order/OrderItem rows at checkout, and on login
+they are merged into the shopper's own cart (merge_anonymous_cart). Every
+change also invalidates the visitor's cached catalog pages, whose header
+shows the cart badge.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from ecomstore.conditional import personal_state_changed
+from products.models import ProductVariant
+
+from .models import Cart, CartItem
+from .operations import (
+    CART_SESSION_KEY, add_item, forget_cart, get_cart_id, merge_lines, peek_cart_id, remove_item, set_quantities,
+    set_quantity, variant_queryset,
+)
+from .summary import EMPTY_SUMMARY, cart_summary_for, invalidate_cart_summary
+
+
+class CartStorage:
+    """
+    One visitor's cart. Writes return False when there was nothing to
+    change (an unknown variant, a line not in the cart).
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def _changed(self, changed=True):
+        """Passes a write's result through, invalidating the visitor's cached pages if it changed the cart."""
+        if changed:
+            personal_state_changed(self.request)
+        return changed
+
+    def add(self, product_id, variant_id=None, quantity=1):
+        """
+        Adds `quantity` of a product's variant (its first active one when
+        `variant_id` is None; any product's when `product_id` is None).
+        """
+        raise NotImplementedError
+
+    def set_quantity(self, variant_id, quantity):
+        """Sets a line's quantity; 0 or less removes it."""
+        raise NotImplementedError
+
+    def set_quantities(self, quantities):
+        """Applies {variant id: quantity} all together, or not at all if any line isn't in the cart."""
+        raise NotImplementedError
+
+    def remove(self, variant_id):
+        raise NotImplementedError
+
+    def items(self, variant_ids=None):
+        """
+        The lines (only those of `variant_ids`, if given) as CartItems, unsaved
+        ones for carts outside the database, with variant and product loaded.
+        """
+        raise NotImplementedError
+
+    def summary(self):
+        """{'item_count', 'subtotal'}, as cheaply as the backend allows."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class DatabaseCartStorage(CartStorage):
+
+    def add(self, product_id, variant_id=None, quantity=1):
+        cart_id = get_cart_id(self.request)
+        added = add_item(cart_id, product_id, variant_id, quantity)
+        if not added and not Cart.objects.filter(pk=cart_id).exists():
+            # The remembered cart is gone (e.g. checked out in another tab); start a new one
+            forget_cart(self.request)
+            added = add_item(get_cart_id(self.request), product_id, variant_id, quantity)
+        return self._changed(added)
+
+    def set_quantity(self, variant_id, quantity):
+        cart_id = get_cart_id(self.request, create=False)
+        return self._changed(bool(cart_id) and set_quantity(cart_id, variant_id, quantity))
+
+    def set_quantities(self, quantities):
+        cart_id = get_cart_id(self.request, create=False)
+        return self._changed(bool(cart_id) and set_quantities(cart_id, quantities))
+
+    def remove(self, variant_id):
+        cart_id = get_cart_id(self.request, create=False)
+        return self._changed(bool(cart_id) and remove_item(cart_id, variant_id))
+
+    def items(self, variant_ids=None):
+        cart_id = get_cart_id(self.request, create=False)
+        if not cart_id:
+            return []
+        items = CartItem.objects.filter(cart_id=cart_id).select_related('product_variant__product').order_by('id')
+        if variant_ids is not None:
+            items = items.filter(product_variant_id__in=list(variant_ids))
+        return list(items)
+
+    def summary(self):
+        # Only carts already remembered in the session; anything else would cost a query on every page
+        cart_id = peek_cart_id(self.request)
+        return cart_summary_for(cart_id) if cart_id else EMPTY_SUMMARY
+
+    def clear(self):
+        cart_id = get_cart_id(self.request, create=False)
+        if cart_id:
+            Cart.objects.filter(pk=cart_id).delete()
+            transaction.on_commit(lambda: invalidate_cart_summary(cart_id))
+            self._changed()
+        forget_cart(self.request)
+
+
+class SessionCartStorage(CartStorage):
+    """Lines kept in the session as {variant id: [quantity, price when added]}."""
+
+    session_key = 'cart_lines'
+
+    def _lines(self):
+        return self.request.session.get(self.session_key, {})
+
+    def _save(self, lines):
+        if lines:
+            self.request.session[self.session_key] = lines
+        elif self.session_key in self.request.session:
+            del self.request.session[self.session_key]
+        else:
+            return
+        self._changed()
+
+    def add(self, product_id, variant_id=None, quantity=1):
+        variant = variant_queryset(product_id, variant_id).values_list('pk', 'price').first()
+        if variant is None:
+            return False
+        lines = self._lines()
+        key = str(variant[0])
+        if key in lines:
+            lines[key][0] += quantity
+        else:
+            lines[key] = [quantity, str(variant[1])]
+        self._save(lines)
+        return True
+
+    def set_quantity(self, variant_id, quantity):
+        if quantity <= 0:
+            return self.remove(variant_id)
+        lines = self._lines()
+        if str(variant_id) not in lines:
+            return False
+        lines[str(variant_id)][0] = quantity
+        self._save(lines)
+        return True
+
+    def set_quantities(self, quantities):
+        lines = self._lines()
+        if any(str(variant_id) not in lines for variant_id in quantities):
+            return False
+        for variant_id, quantity in quantities.items():
+            if quantity > 0:
+                lines[str(variant_id)][0] = quantity
+            else:
+                del lines[str(variant_id)]
+        self._save(lines)
+        return True
+
+    def remove(self, variant_id):
+        lines = self._lines()
+        if lines.pop(str(variant_id), None) is None:
+            return False
+        self._save(lines)
+        return True
+
+    def items(self, variant_ids=None):
+        lines = self._lines()
+        if variant_ids is not None:
+            wanted = {str(variant_id) for variant_id in variant_ids}
+            lines = {pk: line for pk, line in lines.items() if pk in wanted}
+        if not lines:
+            return []
+        variants = ProductVariant.objects.select_related('product').in_bulk([int(pk) for pk in lines])
+        return [
+            CartItem(product_variant=variants[int(pk)], quantity=quantity, price=Decimal(price))
+            for pk, (quantity, price) in lines.items()
+            # Variants deleted since they were added just drop out
+            if int(pk) in variants
+        ]
+
+    def summary(self):
+        lines = self._lines().values()
+        if not lines:
+            return EMPTY_SUMMARY
+        return {
+            'item_count': sum(quantity for quantity, price in lines),
+            'subtotal': sum((quantity * Decimal(price) for quantity, price in lines), Decimal('0.00')),
+        }
+
+    def clear(self):
+        self._save({})
+
+
+def get_cart_storage(request):
+    """The storage of the visitor's cart: the database when signed in, else CART_STORAGE_BACKEND."""
+    if request.user.is_authenticated:
+        return DatabaseCartStorage(request)
+    return import_string(settings.CART_STORAGE_BACKEND)(request)
+
+
+def merge_anonymous_cart(request, user):
+    """
+    Moves the cart a visitor filled before signing in into their own
+    database cart, summing the quantities of variants in both. Runs on
+    login (cart/signals.py), while the session still holds the anonymous
+    cart. Costs the same few queries for any
+    cart size, and does nothing the second time.
+    """
+    session = request.session
+    lines = {
+        int(variant_id): (quantity, Decimal(price))
+        for variant_id, (quantity, price) in session.get(SessionCartStorage.session_key, {}).items()
+    }
+    # A cart from DatabaseCartStorage, remembered with no owner
+    remembered = session.get(CART_SESSION_KEY)
+    anonymous_cart_id = remembered[1] if remembered and remembered[0] is None else None
+    if anonymous_cart_id:
+        for variant_id, quantity, price in CartItem.objects.filter(cart_id=anonymous_cart_id).values_list(
+            'product_variant_id', 'quantity', 'price',
+        ):
+            lines[variant_id] = (lines.get(variant_id, (0, price))[0] + quantity, price)
+    if lines:
+        # Variants deleted or withdrawn since they were added are dropped
+        active = set(ProductVariant.objects.filter(pk__in=list(lines), is_active=True).values_list('pk', flat=True))
+        lines = {variant_id: line for variant_id, line in lines.items() if variant_id in active}
+
+    forget_cart(request)
+    # Also remembers the shopper's cart for the header badge
+    cart_id = get_cart_id(request, create=bool(lines), user=user)
+    with transaction.atomic():
+        if lines:
+            merge_lines(cart_id, lines)
+        if anonymous_cart_id:
+            Cart.objects.filter(pk=anonymous_cart_id, user__isnull=True).delete()
+    session.pop(SessionCartStorage.session_key, None)
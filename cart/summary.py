@@ -0,0 +1,44 @@
+# cart/summary.py
+"""
+Item count and subtotal of the visitor's cart, for the header badge.
+
+The summary of each cart is cached under its id and dropped by every cart
+write (cart/operations.py) and by checkout; the next read recomputes it
+with one aggregate query. Visitors without a remembered cart get an empty
+summary without touching the database or the cache.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+from .models import CartItem
+
+EMPTY_SUMMARY = {'item_count': 0, 'subtotal': Decimal('0.00')}
+
+# Safety net only: every cart write drops the cached summary right away
+CACHE_TIMEOUT = 60 * 60
+
+
+def _key(cart_id):
+    return f'cart:summary:{cart_id}'
+
+
+def cart_summary_for(cart_id):
+    """{'item_count', 'subtotal'} of a cart: from the cache, else one aggregate query."""
+    summary = cache.get(_key(cart_id))
+    if summary is None:
+        totals = CartItem.objects.filter(cart_id=cart_id).aggregate(
+            item_count=Sum('quantity'), subtotal=Sum(F('quantity') * F('price')),
+        )
+        summary = {
+            'item_count': totals['item_count'] or 0,
+            # Some backends drop the decimal places of a SUM
+            'subtotal': Decimal(totals['subtotal'] or 0).quantize(EMPTY_SUMMARY['subtotal']),
+        }
+        cache.set(_key(cart_id), summary, CACHE_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(cart_id):
+    cache.delete(_key(cart_id))
@@ -1,3 +1,390 @@
-from django.test import TestCase
+# cart/tests.py
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from checkout.models import Order
+from products.models import Category, Product, ProductActivity, ProductVariant
+
+from .context_processors import get_cart_summary
+from .models import Cart, CartItem
+from .operations import _merge_sql, add_item, remove_item, set_quantity
+
+
+class CartTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.product = Product.objects.create(category=category, name='Runner', slug='runner')
+        cls.small = ProductVariant.objects.create(product=cls.product, sku='RUN-40', price=10, stock=5)
+        cls.large = ProductVariant.objects.create(product=cls.product, sku='RUN-44', price=12, stock=5)
+        cls.other = Product.objects.create(category=category, name='Boot', slug='boot')
+
+    def quantities(self, cart_id):
+        return dict(CartItem.objects.filter(cart_id=cart_id).values_list('product_variant_id', 'quantity'))
+
+    def assertStatements(self, count):
+        # TestCase wraps each test in a transaction, which turns atomic() blocks into savepoints; don't count those
+        context = self
+
+        class Statements(CaptureQueriesContext):
+            def __exit__(self, *exc_info):
+                super().__exit__(*exc_info)
+                statements = [query['sql'] for query in self.captured_queries if 'SAVEPOINT' not in query['sql']]
+                context.assertEqual(len(statements), count, '\n'.join(statements))
+
+        return Statements(connection)
+
+
+class CartOperationTests(CartTestCase):
+
+    def setUp(self):
+        self.cart = Cart.objects.create(session_key='test-session')
+
+    def test_new_line_is_an_update_and_an_insert(self):
+        with self.assertStatements(2):
+            self.assertTrue(add_item(self.cart.pk, self.product.pk, self.large.pk, 2))
+        item = CartItem.objects.get(cart=self.cart)
+        self.assertEqual((item.product_variant_id, item.quantity, item.price), (self.large.pk, 2, 12))
+
+    def test_existing_line_is_incremented_in_one_statement(self):
+        add_item(self.cart.pk, self.product.pk, self.large.pk, 2)
+        with self.assertStatements(1):
+            self.assertTrue(add_item(self.cart.pk, self.product.pk, self.large.pk, 3))
+        self.assertEqual(self.quantities(self.cart.pk), {self.large.pk: 5})
+
+    def test_concurrent_insert_falls_back_to_the_increment(self):
+        add_item(self.cart.pk, self.product.pk, self.small.pk, 1)
+        # As if another request inserted the line between our UPDATE and INSERT
+        update = QuerySet.update
+        calls = []
+
+        def update_missing_the_row_once(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_missing_the_row_once):
+            self.assertTrue(add_item(self.cart.pk, self.product.pk, self.small.pk, 4))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.quantities(self.cart.pk), {self.small.pk: 5})
+
+    def test_default_variant_is_the_first_active_one(self):
+        self.small.is_active = False
+        self.small.save()
+        self.assertTrue(add_item(self.cart.pk, self.product.pk))
+        self.assertEqual(self.quantities(self.cart.pk), {self.large.pk: 1})
+
+    def test_unknown_or_foreign_variant_is_rejected(self):
+        self.assertFalse(add_item(self.cart.pk, self.other.pk, self.small.pk))
+        self.assertFalse(add_item(self.cart.pk, self.other.pk))
+        self.assertEqual(self.quantities(self.cart.pk), {})
+
+    def test_set_quantity_and_remove(self):
+        add_item(self.cart.pk, self.product.pk, self.small.pk, 1)
+        with self.assertStatements(1):
+            self.assertTrue(set_quantity(self.cart.pk, self.small.pk, 7))
+        self.assertEqual(self.quantities(self.cart.pk), {self.small.pk: 7})
+        with self.assertStatements(1):
+            self.assertTrue(remove_item(self.cart.pk, self.small.pk))
+        self.assertFalse(set_quantity(self.cart.pk, self.small.pk, 2))
+        self.assertFalse(remove_item(self.cart.pk, self.small.pk))
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.DatabaseCartStorage')
+class CartViewTests(CartTestCase):
+    # Statements run by adding to and updating a line already in the cart: reading and saving
+    # the session, plus one cart write
+    statements_per_add = 3
+    statements_per_update = 3
+
+    def setUp(self):
+        self.client = Client(SERVER_NAME='localhost')
+
+    def add(self, **data):
+        return self.client.post(f'/cart/add/{self.product.pk}/', data)
+
+    def lines(self):
+        return {item.product_variant_id: item.quantity for item in self.client.get('/cart/').context['cart_items']}
+
+    def test_add_posts_the_chosen_variant(self):
+        self.assertRedirects(self.add(variant_id=self.large.pk, quantity=2), '/cart/', fetch_redirect_response=False)
+        self.add(variant_id=self.large.pk)
+        self.add()
+        self.assertEqual(self.lines(), {self.large.pk: 3, self.small.pk: 1})
+
+    def test_unknown_variant_is_not_added(self):
+        self.client.post(f'/cart/add/{self.other.pk}/', {'variant_id': self.small.pk})
+        self.assertEqual(self.lines(), {})
+
+    def test_update_and_remove_by_variant(self):
+        self.add(variant_id=self.large.pk)
+        self.add(variant_id=self.small.pk)
+        self.client.post(f'/cart/update/{self.large.pk}/', {'quantity': 4})
+        self.assertEqual(self.lines(), {self.large.pk: 4, self.small.pk: 1})
+        self.client.post(f'/cart/update/{self.large.pk}/', {'quantity': 0})
+        self.client.post(f'/cart/remove/{self.small.pk}/')
+        self.assertEqual(self.lines(), {})
+
+    @override_settings(PRODUCT_VIEW_FLUSH_ON_REQUEST=False)
+    def test_views_cost_a_fixed_number_of_statements(self):
+        self.add(variant_id=self.large.pk)
+        # The popularity count stays in the cache
+        with self.assertStatements(self.statements_per_add):
+            self.add(variant_id=self.large.pk, quantity=2)
+        with self.assertStatements(self.statements_per_update):
+            self.client.post(f'/cart/update/{self.large.pk}/', {'quantity': 4})
+        self.assertFalse(ProductActivity.objects.exists())
+
+    def test_cart_changes_revalidate_cached_pages(self):
+        # Catalog pages show the cart badge, so a 304 must not survive a cart change.
+        # The first visit only sets the CSRF cookie, which the ETag covers.
+        self.client.get('/products/products/')
+        etag = self.client.get('/products/products/').headers['ETag']
+        self.assertEqual(self.client.get('/products/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.add(variant_id=self.large.pk)
+        response = self.client.get('/products/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.client.post(f'/cart/remove/{self.small.pk}/')
+        self.assertEqual(self.client.get('/products/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(f'/cart/remove/{self.large.pk}/')
+        self.assertEqual(self.client.get('/products/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_checkout_turns_the_cart_into_an_order(self):
+        self.add(variant_id=self.large.pk, quantity=2)
+        self.add(variant_id=self.small.pk)
+        response = self.client.post('/checkout/', {
+            'first_name': 'Ada', 'last_name': 'Obi', 'email': 'ada@example.com', 'same_as_shipping': 'on',
+            'shipping_address_line1': '1 Marina', 'shipping_city': 'Lagos', 'shipping_state': 'Lagos',
+            'shipping_zip_code': '100001', 'shipping_country': 'Nigeria',
+        })
+        order = Order.objects.get(pk=json.loads(response.content)['order_id'])
+        self.assertEqual(order.total_price, 34)
+        self.assertEqual(sorted(order.items.values_list('quantity', 'product_price')), [(1, 10), (2, 12)])
+        self.assertEqual(self.lines(), {})
+        self.assertEqual(Cart.objects.count(), 0)
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.SessionCartStorage')
+class SessionCartViewTests(CartViewTests):
+    # Adding reads the variant's price; the lines themselves are only written with the session
+    statements_per_add = 3
+    statements_per_update = 2
+
+    def test_lines_stay_out_of_the_database(self):
+        self.add(variant_id=self.large.pk, quantity=2)
+        self.assertEqual(self.lines(), {self.large.pk: 2})
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 0)
+
+    def test_empty_cart_page_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_summary_is_read_from_the_session(self):
+        self.add(variant_id=self.large.pk, quantity=2)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.client.session
+        request.session.keys()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(request), {'item_count': 2, 'subtotal': 24})
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.DatabaseCartStorage')
+class StaleCartTests(TransactionTestCase):
+    # Foreign keys are only checked on commit, so this needs real transactions
+
+    def test_checked_out_cart_is_replaced(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='Runner', slug='runner')
+        variant = ProductVariant.objects.create(product=product, sku='RUN-40', price=10, stock=5)
+        client = Client(SERVER_NAME='localhost')
+        client.post(f'/cart/add/{product.pk}/', {'variant_id': variant.pk})
+        Cart.objects.all().delete()
+        client.post(f'/cart/add/{product.pk}/', {'variant_id': variant.pk})
+        cart_id = client.session['cart'][1]
+        self.assertEqual(list(CartItem.objects.filter(cart_id=cart_id).values_list('product_variant_id', 'quantity')), [(variant.pk, 1)])
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.DatabaseCartStorage')
+class CartSummaryTests(CartTestCase):
+
+    def setUp(self):
+        # Cart ids are reused across tests; don't let a cached summary outlive its test
+        cache.clear()
+        self.client = Client(SERVER_NAME='localhost')
+
+    def request(self):
+        """A request carrying the test client's (already loaded) session."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.client.session
+        request.session.keys()
+        return request
+
+    def test_no_cart_costs_nothing(self):
+        request = self.request()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(request), {'item_count': 0, 'subtotal': 0})
+
+    def test_summary_is_cached_until_the_cart_changes(self):
+        self.client.post(f'/cart/add/{self.product.pk}/', {'variant_id': self.large.pk, 'quantity': 2})
+        self.client.post(f'/cart/add/{self.product.pk}/', {'variant_id': self.small.pk})
+        request = self.request()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart_summary(request), {'item_count': 3, 'subtotal': 34})
+        with self.assertNumQueries(0):
+            get_cart_summary(request)
+        self.client.post(f'/cart/update/{self.large.pk}/', {'quantity': 5})
+        self.assertEqual(get_cart_summary(request), {'item_count': 6, 'subtotal': 70})
+        self.client.post(f'/cart/remove/{self.large.pk}/')
+        self.assertEqual(get_cart_summary(request), {'item_count': 1, 'subtotal': 10})
+
+    def test_header_badge(self):
+        self.client.post(f'/cart/add/{self.product.pk}/', {'variant_id': self.small.pk, 'quantity': 4})
+        self.assertContains(self.client.get('/cart/'), '<span class="cart-badge">4</span>', html=True)
+
+
+class LoginMergeTests(CartTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(SERVER_NAME='localhost')
+        self.user = User.objects.create_user('ada', password='secret')
+
+    def add(self, variant, quantity=1):
+        self.client.post(f'/cart/add/{variant.product_id}/', {'variant_id': variant.pk, 'quantity': quantity})
+
+    def user_lines(self):
+        return self.quantities(Cart.objects.get(user=self.user).pk)
+
+    def test_session_cart_is_merged_into_the_user_cart(self):
+        user_cart = Cart.objects.create(user=self.user)
+        add_item(user_cart.pk, self.product.pk, self.large.pk, 2)
+        self.add(self.large, 3)
+        self.add(self.small)
+        self.client.login(username='ada', password='secret')
+        self.assertEqual(self.user_lines(), {self.large.pk: 5, self.small.pk: 1})
+        # The badge already knows the merged cart
+        self.assertContains(self.client.get('/cart/'), '<span class="cart-badge">6</span>', html=True)
+
+    @override_settings(CART_STORAGE_BACKEND='cart.storage.DatabaseCartStorage')
+    def test_database_cart_is_merged_and_deleted(self):
+        self.add(self.small, 2)
+        self.client.login(username='ada', password='secret')
+        self.assertEqual(self.user_lines(), {self.small.pk: 2})
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_merging_twice_changes_nothing(self):
+        self.add(self.small, 2)
+        self.client.login(username='ada', password='secret')
+        self.client.logout()
+        self.client.login(username='ada', password='secret')
+        self.assertEqual(self.user_lines(), {self.small.pk: 2})
+
+    def test_withdrawn_variants_are_dropped(self):
+        self.add(self.small)
+        self.add(self.large)
+        ProductVariant.objects.filter(pk=self.small.pk).update(is_active=False)
+        self.client.login(username='ada', password='secret')
+        self.assertEqual(self.user_lines(), {self.large.pk: 1})
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def login_queries(variants):
+            client = Client(SERVER_NAME='localhost')
+            for variant in variants:
+                client.post(f'/cart/add/{variant.product_id}/', {'variant_id': variant.pk})
+            with CaptureQueriesContext(connection) as queries:
+                client.login(username='ada', password='secret')
+            client.logout()
+            return len(queries)
+
+        Cart.objects.create(user=self.user)
+        more = [ProductVariant.objects.create(product=self.other, sku=f'BOOT-{size}', price=20, stock=1) for size in range(20)]
+        self.assertEqual(login_queries([self.small]), login_queries(more))
+
+    def test_mysql_merges_on_any_duplicate_key(self):
+        # MySQL can't name the conflicting columns, so the upsert mustn't either
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            sql, params = _merge_sql(connection, 7, {self.small.pk: (2, self.small.price)})
+        self.assertNotIn('ON CONFLICT', sql)
+        self.assertTrue(sql.endswith('ON DUPLICATE KEY UPDATE "quantity" = "quantity" + VALUES("quantity")'))
+        self.assertEqual(params, [7, self.small.pk, 2, self.small.price])
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.DatabaseCartStorage')
+class CartApiTests(CartTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(SERVER_NAME='localhost')
+
+    def post(self, action, body, status=200):
+        response = self.client.post(f'/cart/api/{action}/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, status, response.content)
+        return json.loads(response.content)
+
+    def test_add_returns_the_line_and_totals(self):
+        self.post('add', {'variant_id': self.small.pk})
+        body = self.post('add', {'variant_id': self.large.pk, 'quantity': 2})
+        self.assertEqual(body, {
+            'lines': [{
+                'variant_id': self.large.pk, 'product_id': self.product.pk, 'name': 'Runner', 'sku': 'RUN-44',
+                'quantity': 2, 'price': '12.00', 'total': '24.00',
+            }],
+            'summary': {'item_count': 3, 'subtotal': '34.00'},
+        })
+
+    def test_update_and_remove(self):
+        self.post('add', {'variant_id': self.small.pk})
+        self.post('add', {'variant_id': self.large.pk})
+        body = self.post('update', {'variant_id': self.small.pk, 'quantity': 4})
+        self.assertEqual((body['lines'][0]['quantity'], body['summary']['item_count']), (4, 5))
+        body = self.post('remove', {'variant_id': self.small.pk})
+        self.assertEqual(body, {'lines': [{'variant_id': self.small.pk, 'quantity': 0}], 'summary': {'item_count': 1, 'subtotal': '12.00'}})
+        self.post('remove', {'variant_id': self.small.pk}, status=404)
+
+    def test_batch_applies_every_change(self):
+        self.post('add', {'variant_id': self.small.pk})
+        self.post('add', {'variant_id': self.large.pk})
+        body = self.post('batch', {'lines': [
+            {'variant_id': self.small.pk, 'quantity': 0}, {'variant_id': self.large.pk, 'quantity': 3},
+        ]})
+        self.assertEqual([line['quantity'] for line in body['lines']], [0, 3])
+        self.assertEqual(body['summary'], {'item_count': 3, 'subtotal': '36.00'})
+
+    def test_batch_is_all_or_nothing(self):
+        self.post('add', {'variant_id': self.small.pk})
+        self.post('batch', {'lines': [
+            {'variant_id': self.small.pk, 'quantity': 5}, {'variant_id': self.large.pk, 'quantity': 1},
+        ]}, status=404)
+        self.assertEqual(self.post('update', {'variant_id': self.small.pk, 'quantity': 1})['summary']['item_count'], 1)
+
+    def test_bad_requests(self):
+        self.assertIn('variant_id', self.post('add', {}, status=400)['error'])
+        self.assertIn('integer', self.post('add', {'variant_id': 'x'}, status=400)['error'])
+        self.post('add', {'variant_id': self.small.pk, 'product_id': self.other.pk}, status=404)
+        self.post('update', {'variant_id': self.small.pk, 'quantity': -1}, status=400)
+        self.post('batch', {'lines': []}, status=400)
+        self.assertEqual(self.client.get('/cart/api/add/').status_code, 405)
+
+    def test_form_encoded_bodies_work_too(self):
+        response = self.client.post('/cart/api/add/', {'variant_id': self.small.pk, 'quantity': 2})
+        self.assertEqual(json.loads(response.content)['summary']['item_count'], 2)
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.SessionCartStorage')
+class SessionCartApiTests(CartApiTests):
+    pass
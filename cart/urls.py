@@ -6,6 +6,11 @@ app_name = 'cart'  # Namespace for cart URLs
 urlpatterns = [
     path('', views.cart_detail, name='cart_detail'),
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
-    path('remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('update/<int:product_id>/', views.update_cart_item, name='update_cart_item'),
+    path('remove/<int:variant_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('update/<int:variant_id>/', views.update_cart_item, name='update_cart_item'),
+    # JSON endpoints: same changes, answered with the changed lines and totals
+    path('api/add/', views.api_add, name='api_add'),
+    path('api/update/', views.api_update, name='api_update'),
+    path('api/remove/', views.api_remove, name='api_remove'),
+    path('api/batch/', views.api_batch, name='api_batch'),
 ]
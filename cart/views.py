@@ -1,99 +1,180 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.shortcuts import render, redirect
 from django.views.decorators.http import require_POST
-from products.models import Product, ProductVariant
-from .models import Cart, CartItem
+from ecomstore.api_errors import ApiError, error_response
+from products.copurchase import also_bought
+from products.counters import record_cart_add
+from .storage import get_cart_storage
 from django.contrib import messages
 
-def _get_or_create_cart(request):
-    cart = None
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.save()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+# Most lines one JSON batch update may change
+API_MAX_LINES = 100
+
+def _posted_int(request, name, default=None):
+    try:
+        return int(request.POST[name])
+    except (KeyError, ValueError):
+        return default
 
 @require_POST
 def add_to_cart(request, product_id):
-    # Get the product by product_id
-    product = get_object_or_404(Product, id=product_id)
+    # The variant picked on the product page; product cards post none and get the first active one
+    variant_id = _posted_int(request, 'variant_id')
+    quantity = max(_posted_int(request, 'quantity', 1), 1)
 
-    # Pick the first variant of this product (customize this logic if needed)
-    variant = product.variants.first()
-    if not variant:
+    if not get_cart_storage(request).add(product_id, variant_id, quantity):
         messages.error(request, "Sorry, this product has no available variants to add.")
-        return redirect('products:product_detail', product_id=product_id)
-
-    quantity = int(request.POST.get('quantity', 1))
-    cart = _get_or_create_cart(request)
-
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product_variant=variant)
-        cart_item.quantity += quantity
-        cart_item.save()
-        messages.success(request, f"Increased quantity of {variant.product.name} in your cart.")
-    except CartItem.DoesNotExist:
-        CartItem.objects.create(cart=cart, product_variant=variant, quantity=quantity, price=variant.price)
-        messages.success(request, f"Added {variant.product.name} to your cart.")
+        return redirect('cart:cart_detail')
 
+    # Buffered in the cache for the time-decayed popularity score (see products/counters.py)
+    record_cart_add(product_id, quantity)
+    messages.success(request, "Added to your cart.")
     return redirect('cart:cart_detail')
 
 @require_POST
-def remove_from_cart(request, product_id):
-    # Get the product by product_id
-    product = get_object_or_404(Product, id=product_id)
-
-    # Get the first variant (or handle if no variant exists)
-    variant = product.variants.first()
-    if not variant:
-        messages.error(request, f"No variant found for product ID {product_id}.")
-        return redirect('cart:cart_detail')
-
-    cart = _get_or_create_cart(request)
-
-    # Attempt to remove the cart item
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product_variant=variant)
-        product_name = cart_item.product_variant.product.name
-        cart_item.delete()
-        messages.info(request, f"Removed {product_name} from your cart.")
-    except CartItem.DoesNotExist:
-        messages.error(request, f"Item for product ID {product_id} not found in your cart.")
-
+def remove_from_cart(request, variant_id):
+    if get_cart_storage(request).remove(variant_id):
+        messages.info(request, "Removed the item from your cart.")
+    else:
+        messages.error(request, "That item is not in your cart.")
     return redirect('cart:cart_detail')
 
 @require_POST
-def update_cart_item(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    variant = product.variants.first()
-    if not variant:
-        messages.error(request, "Product variant not found.")
+def update_cart_item(request, variant_id):
+    quantity = _posted_int(request, 'quantity')
+    if quantity is None:
+        messages.error(request, "Please enter a quantity.")
         return redirect('cart:cart_detail')
 
-    new_quantity = int(request.POST.get('quantity', 1))
-    if new_quantity <= 0:
-        return remove_from_cart(request, product_id)
-
-    cart = _get_or_create_cart(request)
-
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product_variant=variant)
-        cart_item.quantity = new_quantity
-        cart_item.save()
-        messages.success(request, f"Updated quantity of {variant.product.name} to {new_quantity}.")
-    except CartItem.DoesNotExist:
-        messages.error(request, "Product not found in your cart.")
-
+    if not get_cart_storage(request).set_quantity(variant_id, quantity):
+        messages.error(request, "That item is not in your cart.")
+    elif quantity <= 0:
+        messages.info(request, "Removed the item from your cart.")
+    else:
+        messages.success(request, f"Updated the quantity to {quantity}.")
     return redirect('cart:cart_detail')
 
 def cart_detail(request):
-    cart = _get_or_create_cart(request)
+    # Reads only: an empty cart creates neither a Cart row nor a session
+    storage = get_cart_storage(request)
+    items = storage.items()
+    # Recommendations for the whole cart, from the precomputed co-purchase lists
+    cart_product_ids = dict.fromkeys(item.product_variant.product_id for item in items)
     context = {
-        'cart': cart,
+        'cart_items': items,
+        'cart_summary': storage.summary(),
+        'also_bought': also_bought(list(cart_product_ids)),
         'site_name': 'Modern Fashion',
         'page_title': 'Your Shopping Cart',
     }
-    return render(request, 'cart/cart_detail.html', context)
\ No newline at end of file
+    return render(request, 'cart/cart_detail.html', context)
+
+
+# JSON endpoints for scripts (cart/urls.py: api/...). Each answers with just the
+# lines it changed and the new totals, instead of a redirect to the full cart page.
+
+def cart_api_view(view):
+    """POST-only JSON view; the body (JSON, or form-encoded) is passed as `data`. ApiError becomes an error response."""
+    @require_POST
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            if request.content_type == 'application/json':
+                try:
+                    data = json.loads(request.body or b'{}')
+                except ValueError:
+                    raise ApiError("The body is not valid JSON.")
+                if not isinstance(data, dict):
+                    raise ApiError("The body must be a JSON object.")
+            else:
+                data = request.POST
+            return JsonResponse(view(request, data, *args, **kwargs))
+        except ApiError as exc:
+            return error_response(exc)
+    return wrapper
+
+def _int(data, name, default=None, minimum=None):
+    value = data.get(name, default)
+    if value is None:
+        raise ApiError(f"{name} is required.")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"{name} must be an integer.")
+    if minimum is not None and value < minimum:
+        raise ApiError(f"{name} must be at least {minimum}.")
+    return value
+
+def _changes(storage, variant_ids):
+    """The response: the given lines as they are now (quantity 0 once removed) and the cart totals."""
+    items = {item.product_variant_id: item for item in storage.items(variant_ids)}
+    lines = []
+    for variant_id in variant_ids:
+        item = items.get(variant_id)
+        if item is None:
+            lines.append({'variant_id': variant_id, 'quantity': 0})
+            continue
+        lines.append({
+            'variant_id': variant_id,
+            'product_id': item.product_variant.product_id,
+            'name': item.product_variant.product.name,
+            'sku': item.product_variant.sku,
+            'quantity': item.quantity,
+            'price': str(item.price),
+            'total': str(item.get_total()),
+        })
+    summary = storage.summary()
+    return {'lines': lines, 'summary': {'item_count': summary['item_count'], 'subtotal': str(summary['subtotal'])}}
+
+@cart_api_view
+def api_add(request, data):
+    """{"variant_id", "quantity"?, "product_id"?}: adds to the line (quantity defaults to 1)."""
+    variant_id = _int(data, 'variant_id')
+    product_id = _int(data, 'product_id') if data.get('product_id') is not None else None
+    quantity = _int(data, 'quantity', default=1, minimum=1)
+    storage = get_cart_storage(request)
+    if not storage.add(product_id, variant_id, quantity):
+        raise ApiError("That variant is not available.", status=404)
+    response = _changes(storage, [variant_id])
+    # Buffered in the cache for the time-decayed popularity score (see products/counters.py)
+    record_cart_add(response['lines'][0]['product_id'], quantity)
+    return response
+
+@cart_api_view
+def api_update(request, data):
+    """{"variant_id", "quantity"}: sets the line's quantity; 0 removes it."""
+    variant_id = _int(data, 'variant_id')
+    storage = get_cart_storage(request)
+    if not storage.set_quantity(variant_id, _int(data, 'quantity', minimum=0)):
+        raise ApiError("That item is not in your cart.", status=404)
+    return _changes(storage, [variant_id])
+
+@cart_api_view
+def api_remove(request, data):
+    """{"variant_id"}: removes the line."""
+    variant_id = _int(data, 'variant_id')
+    storage = get_cart_storage(request)
+    if not storage.remove(variant_id):
+        raise ApiError("That item is not in your cart.", status=404)
+    return _changes(storage, [variant_id])
+
+@cart_api_view
+def api_batch(request, data):
+    """{"lines": [{"variant_id", "quantity"}, ...]}: sets several quantities in one transaction, all or none."""
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        raise ApiError("lines must be a non-empty list of {variant_id, quantity} objects.")
+    if len(lines) > API_MAX_LINES:
+        raise ApiError(f"At most {API_MAX_LINES} lines per request.")
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ApiError("lines must be a non-empty list of {variant_id, quantity} objects.")
+        quantities[_int(line, 'variant_id')] = _int(line, 'quantity', minimum=0)
+    storage = get_cart_storage(request)
+    if not storage.set_quantities(quantities):
+        raise ApiError("Some of these items are not in your cart; nothing was changed.", status=404)
+    return _changes(storage, list(quantities))
@@ -8,23 +8,11 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from decouple import config
-from cart.models import Cart, CartItem
+from cart.storage import get_cart_storage
 from products.models import Product
 from .models import Order, OrderItem
 from .forms import CheckoutForm
 
-def _get_or_create_cart(request):
-    cart = None
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.save()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
-
 @csrf_exempt
 def create_paystack_payment(request):
     if request.method == "POST":
@@ -54,9 +42,10 @@ def create_paystack_payment(request):
         return JsonResponse({'error': 'Failed to initialize payment'}, status=500)
 
 def checkout_page(request):
-    cart = _get_or_create_cart(request)
+    storage = get_cart_storage(request)
+    cart_items = storage.items()
 
-    if not cart.items.exists():
+    if not cart_items:
         messages.warning(request, "Your cart is empty. Please add items before checking out.")
         return redirect('cart:cart_detail')
 
@@ -82,32 +71,34 @@ def checkout_page(request):
                     billing_state=form.cleaned_data['shipping_state'] if form.cleaned_data.get('same_as_shipping') else form.cleaned_data['billing_state'],
                     billing_zip_code=form.cleaned_data['shipping_zip_code'] if form.cleaned_data.get('same_as_shipping') else form.cleaned_data['billing_zip_code'],
                     billing_country=form.cleaned_data['shipping_country'] if form.cleaned_data.get('same_as_shipping') else form.cleaned_data['billing_country'],
-                    total_price=cart.get_total_price(),
+                    total_price=sum(item.get_total() for item in cart_items),
                     status='pending',
                 )
 
-                for cart_item in cart.items.all():
-                    OrderItem.objects.create(
+                OrderItem.objects.bulk_create([
+                    OrderItem(
                         order=order,
                         product=cart_item.product_variant.product,
                         product_name=cart_item.product_variant.product.name,
                         product_price=cart_item.price,
                         quantity=cart_item.quantity,
                     )
+                    for cart_item in cart_items
+                ])
 
                 # Store order_id in session to use in payment
                 request.session['order_id'] = order.id
 
                 # Clear the cart after creating the order (post-payment will be handled in success view)
-                cart.items.all().delete()
-                cart.delete()
+                storage.clear()
 
                 return JsonResponse({'success': True, 'order_id': order.id})
 
         else:
             messages.error(request, "Please correct the errors in the form.")
             return render(request, 'checkout/checkout_page.html', {
-                'cart': cart,
+                'cart_items': cart_items,
+                'cart_summary': storage.summary(),
                 'form': form,
                 'site_name': 'Excellent Fashion Wares',
                 'page_title': 'Checkout',
@@ -122,7 +113,8 @@ def checkout_page(request):
         form = CheckoutForm(initial=initial_data)
 
     context = {
-        'cart': cart,
+        'cart_items': cart_items,
+        'cart_summary': storage.summary(),
         'form': form,
         'site_name': 'Excellent Fashion Wares',
         'page_title': 'Checkout',
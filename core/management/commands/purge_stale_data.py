@@ -0,0 +1,65 @@
+# core/management/commands/purge_stale_data.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.purge import BATCH_PAUSE, BATCH_SIZE, HISTORY_TARGETS, purge, stale_querysets
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired sessions, abandoned anonymous carts and long-pending unpaid orders, in small "
+        "throttled batches. Activity older than the popularity window is only deleted when asked for."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='*', metavar='target',
+            help=(
+                f"Only purge these ({', '.join(stale_querysets())}; "
+                f"default: all but {', '.join(HISTORY_TARGETS)})."
+            ),
+        )
+        parser.add_argument(
+            '--include-history', action='store_true',
+            help=f"Also purge {', '.join(HISTORY_TARGETS)} by default.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only count the stale rows.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help=f"Rows deleted per transaction (default: {BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            '--pause', type=float,
+            help=f"Seconds to sleep between batches (default: {BATCH_PAUSE}).",
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        querysets = stale_querysets()
+        unknown = set(options['targets']) - set(querysets)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}. Available: {', '.join(querysets)}.")
+        targets = options['targets'] or [
+            name for name in querysets if options['include_history'] or name not in HISTORY_TARGETS
+        ]
+
+        for name in targets:
+            started = time.monotonic()
+            if options['dry_run']:
+                count = querysets[name].count()
+                self.stdout.write(f"{name}: {count} stale rows ({time.monotonic() - started:.2f}s)")
+                continue
+
+            def progress(batches, deleted, name=name):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{name}: batch {batches}, {sum(deleted.values())} rows deleted so far")
+
+            deleted, batches = purge(querysets[name], options['batch_size'], options['pause'], progress)
+            elapsed = time.monotonic() - started
+            tables = ', '.join(f"{label} {count}" for label, count in deleted.items()) or "nothing to delete"
+            self.stdout.write(self.style.SUCCESS(f"{name}: {tables} in {batches} batches, {elapsed:.2f}s"))
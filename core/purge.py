@@ -0,0 +1,82 @@
+# core/purge.py
+"""
+Garbage collection of rows nothing reads any more (`manage.py purge_stale_data`).
+
+Each target is a queryset of stale rows. It is deleted in small batches:
+the next BATCH_SIZE primary keys past the previous batch are read,
+then deleted, re-checking the staleness filter, in their own short
+transaction. Between batches the purge sleeps BATCH_PAUSE seconds, so
+it can run at peak hours without holding long locks or flooding replication.
+Rows that cascade (cart lines, order lines) go with their batch.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from cart.models import Cart
+from checkout.models import Order
+from products.models import ProductActivity
+from search.models import SearchQuery
+
+BATCH_SIZE = 500
+# Only purged when asked for: popularity and search suggestions read these
+# rows, and keeping them lets POPULARITY_WINDOW_DAYS grow without losing history
+HISTORY_TARGETS = ('product_activity', 'search_queries')
+# Seconds between batches, to keep locks short and replicas caught up
+BATCH_PAUSE = 0.2
+
+
+def stale_querysets(now=None):
+    """
+    {target name: queryset of its stale rows}, in the order they are purged.
+    The HISTORY_TARGETS are listed too, but aren't purged by default.
+    """
+    now = now or timezone.now()
+    popularity_window = now - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+    live_session = Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gt=now)
+    return {
+        'sessions': Session.objects.filter(expire_date__lte=now),
+        # Anonymous carts can only be reached through their session; signed-in carts are kept
+        'carts': Cart.objects.filter(
+            user__isnull=True, updated_at__lt=now - timedelta(days=settings.PURGE_CART_DAYS),
+        ).exclude(Exists(live_session)),
+        'pending_orders': Order.objects.filter(
+            status='pending', created_at__lt=now - timedelta(days=settings.PURGE_PENDING_ORDER_DAYS),
+        ),
+        # Activity older than the popularity window; see HISTORY_TARGETS
+        'product_activity': ProductActivity.objects.filter(day__lt=timezone.localdate(popularity_window)),
+        'search_queries': SearchQuery.objects.filter(last_searched_at__lt=popularity_window),
+    }
+
+
+def purge(queryset, batch_size=None, pause=None, progress=None):
+    """
+    Deletes the rows of `queryset` batch by batch. Returns
+    ({model label: rows deleted, cascades included}, number of batches).
+    """
+    batch_size = batch_size or BATCH_SIZE
+    pause = BATCH_PAUSE if pause is None else pause
+    keys = queryset.order_by('pk').values_list('pk', flat=True)
+    deleted = {}
+    batches = 0
+    last_pk = None
+    while True:
+        batch = list((keys if last_pk is None else keys.filter(pk__gt=last_pk))[:batch_size])
+        if not batch:
+            return deleted, batches
+        if batches:
+            time.sleep(pause)
+        with transaction.atomic():
+            # Still stale? A cart may have been touched since the batch was read
+            _, counts = queryset.filter(pk__in=batch).delete()
+        for label, count in counts.items():
+            deleted[label] = deleted.get(label, 0) + count
+        batches += 1
+        last_pk = batch[-1]
+        if progress:
+            progress(batches, deleted)
@@ -1,3 +1,84 @@
+# core/tests.py
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+from checkout.models import Order
+from products.models import Category, Product, ProductActivity, ProductVariant
+
+from .purge import purge, stale_querysets
+
+
+class PurgeStaleDataTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='Runner', slug='runner')
+        cls.variant = ProductVariant.objects.create(product=product, sku='RUN-40', price=10, stock=5)
+
+    def setUp(self):
+        self.long_ago = timezone.now() - timedelta(days=90)
+        self.live_session = SessionStore()
+        self.live_session.create()
+
+    def cart(self, session_key, user=None):
+        cart = Cart.objects.create(session_key=session_key, user=user)
+        CartItem.objects.create(cart=cart, product_variant=self.variant, quantity=1, price=10)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=self.long_ago)
+        return cart
+
+    def order(self, status):
+        order = Order.objects.create(
+            first_name='Ada', last_name='Obi', email='ada@example.com', status=status, total_price=10,
+            shipping_address_line1='1 Marina', shipping_city='Lagos', shipping_state='Lagos', shipping_zip_code='1',
+            billing_address_line1='1 Marina', billing_city='Lagos', billing_state='Lagos', billing_zip_code='1',
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=self.long_ago)
+        return order
+
+    def test_only_stale_rows_are_deleted(self):
+        expired = SessionStore()
+        expired.create()
+        Session.objects.filter(session_key=expired.session_key).update(expire_date=self.long_ago)
+        abandoned = self.cart('gone')
+        kept_cart = self.cart(self.live_session.session_key)
+        paid = self.order('submitted')
+        unpaid = self.order('pending')
+
+        querysets = stale_querysets()
+        self.assertEqual(list(querysets['sessions'].values_list('pk', flat=True)), [expired.session_key])
+        self.assertEqual(list(querysets['carts']), [abandoned])
+        self.assertEqual(list(querysets['pending_orders']), [unpaid])
+
+        deleted, batches = purge(querysets['carts'], pause=0)
+        self.assertEqual(deleted, {'cart.CartItem': 1, 'cart.Cart': 1})
+        self.assertEqual(list(Cart.objects.all()), [kept_cart])
+        purge(querysets['pending_orders'], pause=0)
+        self.assertEqual(list(Order.objects.all()), [paid])
+
+    def test_batches(self):
+        for number in range(5):
+            self.cart(f'gone-{number}')
+        deleted, batches = purge(stale_querysets()['carts'], batch_size=2, pause=0)
+        self.assertEqual((deleted['cart.Cart'], batches), (5, 3))
+
+    def test_dry_run_deletes_nothing(self):
+        self.cart('gone')
+        out = StringIO()
+        call_command('purge_stale_data', 'carts', dry_run=True, stdout=out)
+        self.assertIn('carts: 1 stale rows', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 1)
 
-# Create your tests here.
+    def test_activity_is_only_purged_when_asked_for(self):
+        ProductActivity.objects.create(product=self.variant.product, day=timezone.localdate(self.long_ago), views=3)
+        call_command('purge_stale_data', pause=0, stdout=StringIO())
+        self.assertEqual(ProductActivity.objects.count(), 1)
+        call_command('purge_stale_data', pause=0, include_history=True, stdout=StringIO())
+        self.assertEqual(ProductActivity.objects.count(), 0)
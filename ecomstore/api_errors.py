@@ -0,0 +1,19 @@
+# ecomstore/api_errors.py
+"""
+The error type shared by the project's JSON endpoints (the catalog API in
+api/ and the cart endpoints in cart/), so neither app depends on the other.
+"""
+from django.http import JsonResponse
+
+
+class ApiError(ValueError):
+    """A bad request parameter; reported to the client as a 400 response."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_response(exc):
+    """The JSON body and status an ApiError is reported with."""
+    return JsonResponse({'error': str(exc)}, status=exc.status)
@@ -0,0 +1,47 @@
+# ecomstore/commit_batches.py
+"""
+Work deferred until the current transaction commits, batched per connection.
+
+Saving a product in the admin fires signals for the product and every
+inline variant and attribute; each wants the product re-indexed once the
+transaction commits. A CommitBatch collects those keys and hands them to
+its callback in one call, on commit:
+
+    reindex = CommitBatch(index_products)
+    reindex.add(product.pk)
+
+Keys are kept per thread, like Django's database connections, so one
+request's commit never takes (and drops) keys queued by another request's
+still-open transaction. Each add() registers its own on_commit callback and
+the first one to run takes every pending key. Keys added in a transaction
+that is rolled back stay pending until the thread's next commit, which
+costs at most one unneeded call.
+"""
+import threading
+
+from django.db import transaction
+
+
+class CommitBatch:
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._local = threading.local()
+
+    def _pending(self):
+        if not hasattr(self._local, 'keys'):
+            self._local.keys = set()
+        return self._local.keys
+
+    def add(self, *keys):
+        """Queues `keys` for the callback once the current transaction commits (right away outside one)."""
+        self._pending().update(keys)
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        """Calls the callback with every key pending in this thread, if any."""
+        pending = self._pending()
+        if pending:
+            keys = set(pending)
+            pending.clear()
+            self.callback(keys)
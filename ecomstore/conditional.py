@@ -0,0 +1,56 @@
+# ecomstore/conditional.py
+"""
+Conditional GET (ETag / 304 Not Modified) for catalog pages.
+
+Views compute a validator from cheap version markers before doing any real
+work: the catalog version (bumped on every product, variant, category and
+review change, see ecomstore/page_cache.py), and for a single product its
+updated_at and cache_version. When the client's If-None-Match still
+matches, the view answers 304 without querying the catalog or rendering.
+
+Pages carry the personalised header and a CSRF token, so the validator also
+covers the user, their CSRF secret and a per-session counter that code
+changing what the header shows (e.g. the cart badge) bumps with
+personal_state_changed(), and responses are marked private. Reading it costs
+nothing beyond the session the auth middleware loads anyway. A cart changed
+from another of the shopper's sessions shows up there once the page itself
+changes.
+Only ETags are sent: stock and review changes deliberately leave
+updated_at alone, so a Last-Modified date would miss them.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+# Session key of the counter bumped by personal_state_changed()
+PAGE_STATE_SESSION_KEY = 'page_state'
+
+
+def page_etag(request, *parts):
+    """A strong ETag over `parts` and whoever is asking."""
+    # A first visit has no CSRF cookie yet, so its ETag won't match the next one; that costs one extra 200
+    personal = (request.user.pk, request.META.get('CSRF_COOKIE'), request.session.get(PAGE_STATE_SESSION_KEY))
+    digest = hashlib.md5(repr((*parts, *personal)).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def personal_state_changed(request):
+    """Invalidates the visitor's cached pages after a change to something every page shows them."""
+    request.session[PAGE_STATE_SESSION_KEY] = request.session.get(PAGE_STATE_SESSION_KEY, 0) + 1
+
+
+def not_modified(request, etag):
+    """A 304 response if the client already has the page with this ETag, else None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    return with_validator(response, etag) if response is not None else None
+
+
+def with_validator(response, etag):
+    """Adds the ETag to a fresh response; browsers revalidate it on every visit."""
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,124 @@
+# ecomstore/db_routers.py
+"""
+Read-replica routing.
+
+Reads are sent to one of the DATABASE_REPLICAS only while serving a
+read-only request of a catalog-style view (products, preview, wishlist,
+analytics, api - see REPLICA_VIEW_APPS). Everything else stays on the
+primary ('default'):
+
+- all writes, and every read after the first write of a request;
+- reads inside a transaction (atomic block);
+- cart, checkout, account and admin views, and any non-GET request;
+- models of PRIMARY_APPS (sessions, carts), whatever the view;
+- code running outside a request (management commands, shells, threads).
+
+A user who writes something is pinned to the primary for
+DATABASE_PRIMARY_STICKY_SECONDS (stored in their session), so they read
+their own writes even when the replicas lag behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Session key holding the time until which the user is pinned to the primary
+PIN_SESSION_KEY = '_db_primary_until'
+
+# Apps whose views may read from a replica on GET/HEAD requests
+REPLICA_VIEW_APPS = {'products', 'preview', 'wishlist', 'analytics', 'api'}
+
+# Apps whose models are always read from the primary
+PRIMARY_APPS = {'sessions', 'cart'}
+
+# Writes that don't pin the user to the primary: session saves happen on nearly
+# every request, and log records and search statistics are never read back by the user
+UNTRACKED_WRITE_APPS = {'sessions', 'django_db_logger', 'search'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allows (or forbids) replica reads for the code inside the block."""
+    enabled_token = _replica_reads.set(enabled)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(enabled_token)
+        _wrote.reset(wrote_token)
+
+
+def pin_to_primary():
+    """Sends every further read of the current request to the primary."""
+    _replica_reads.set(False)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        if (
+            not _replica_reads.get()
+            or model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            # Explicitly, so that objects loaded from a replica don't drag their related reads there
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in UNTRACKED_WRITE_APPS:
+            _wrote.set(True)
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class PrimaryPinningMiddleware:
+    """
+    Enables replica reads for safe requests to the views of
+    REPLICA_VIEW_APPS, unless the user wrote something within the
+    last DATABASE_PRIMARY_STICKY_SECONDS. Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with replica_reads(False):
+            response = self.get_response(request)
+            wrote = wrote_to_primary()
+        if wrote and hasattr(request, 'session'):
+            request.session[PIN_SESSION_KEY] = time.time() + settings.DATABASE_PRIMARY_STICKY_SECONDS
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in ('GET', 'HEAD')
+            and view_func.__module__.split('.')[0] in REPLICA_VIEW_APPS
+            and request.session.get(PIN_SESSION_KEY, 0) < time.time()
+        ):
+            _replica_reads.set(True)
+        return None
@@ -0,0 +1,185 @@
+# ecomstore/page_cache.py
+"""
+Full-response cache for high-traffic catalog pages (the homepage and the
+products index).
+
+Pages are always rendered as an anonymous visitor and stored with a soft
+TTL. Past the soft TTL the stale copy keeps being served while exactly one
+worker (whoever takes the cache lock) re-renders it in a background
+thread, so an expiry under load never sends every worker to the database
+at once. Only a hard miss renders inline, and even then the other workers
+wait briefly for the lock holder instead of rendering too.
+
+The lock and the pages live in the default cache, so all of this is only
+shared between workers when that cache is (Redis, Memcached, ...). With
+LocMemCache every process has its own copy and its own lock: single-flight
+then holds per process, and each process renders each page once per expiry.
+
+Any catalog or stock change bumps a catalog version (see bump_catalog_version,
+called from products/signals.py); a copy rendered under an older version
+is treated as stale.
+
+Everything personal lives between <!--personal:NAME--> markers in
+base.html. Those fragments (account links, cart badge, logout form) are
+re-rendered for every request and stitched into the cached HTML, and CSRF
+tokens are stored as a placeholder and replaced by the visitor's own token.
+"""
+import logging
+import re
+import threading
+import time
+import uuid
+from functools import wraps
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'page_cache:catalog_version'
+CSRF_PLACEHOLDER = 'CSRFTOKENPLACEHOLDER'
+# How long a render may hold the lock, and how long a miss waits for someone else's render
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+
+# Marker name in base.html -> template rendered per request for it
+PERSONAL_FRAGMENTS = {
+    'header_actions': '_header_actions.html',
+    'nav_account': '_nav_account.html',
+}
+
+_CSRF_INPUT = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_FRAGMENT = re.compile(r'<!--personal:(\w+)-->.*?<!--/personal:\1-->', re.DOTALL)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Marks every cached page as stale; they are re-rendered on their next request."""
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _keys(name):
+    return f'page_cache:{name}:entry', f'page_cache:{name}:lock'
+
+
+def _anonymous_request(request):
+    """
+    A fresh GET for the same URL from a visitor with no cookies, session or
+    messages, so nothing of the current visitor (or of a request that has
+    already been answered, for background refreshes) ends up in the page.
+    """
+    anonymous = RequestFactory().get(
+        request.path_info, secure=request.is_secure(),
+        HTTP_HOST=request.get_host(), SCRIPT_NAME=request.META.get('SCRIPT_NAME', ''),
+    )
+    anonymous.user = AnonymousUser()
+    anonymous.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    anonymous.resolver_match = request.resolver_match
+    return anonymous
+
+
+def _render_entry(view, request, args, kwargs):
+    """Renders the view as an anonymous visitor; returns a cache entry, or None if it isn't cacheable."""
+    version = get_catalog_version()
+    response = view(_anonymous_request(request), *args, **kwargs)
+    if response.status_code != 200 or response.streaming:
+        return None
+    return {
+        'content': _CSRF_INPUT.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset)),
+        'content_type': response['Content-Type'],
+        'version': version,
+        'fresh_until': time.time() + settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
+def _store(entry_key, entry):
+    if entry is not None:
+        cache.set(entry_key, entry, settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT)
+
+
+def _refresh_in_background(view, request, args, kwargs, entry_key, lock_key):
+    def refresh():
+        try:
+            _store(entry_key, _render_entry(view, request, args, kwargs))
+        except Exception:
+            logger.exception("Background refresh of %s failed", entry_key)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _wait_for_entry(entry_key, lock_key):
+    """Polls for the entry another worker is rendering; gives up when its lock is released or after the wait limit."""
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(entry_key)
+        if entry is not None or cache.get(lock_key) is None:
+            return entry
+    return None
+
+
+def _personalize(request, entry):
+    def fragment(match):
+        template_name = PERSONAL_FRAGMENTS.get(match.group(1))
+        if template_name is None:
+            return match.group(0)
+        html = render_to_string(template_name, request=request)
+        return f'<!--personal:{match.group(1)}-->{html}<!--/personal:{match.group(1)}-->'
+
+    content = _FRAGMENT.sub(fragment, entry['content'])
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+    return HttpResponse(content, content_type=entry['content_type'])
+
+
+def cached_page(name):
+    """
+    Serves a view from the full-page cache. Only plain GET/HEAD requests
+    without a query string are cached; anything else goes straight to the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.GET:
+                return view(request, *args, **kwargs)
+
+            entry_key, lock_key = _keys(name)
+            entry = cache.get(entry_key)
+            if entry is not None:
+                stale = entry['fresh_until'] < time.time() or entry['version'] != get_catalog_version()
+                if stale and cache.add(lock_key, 1, LOCK_TIMEOUT):
+                    _refresh_in_background(view, request, args, kwargs, entry_key, lock_key)
+                return _personalize(request, entry)
+
+            # Hard miss: one worker renders, the others wait for its result
+            if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                try:
+                    entry = _render_entry(view, request, args, kwargs)
+                    _store(entry_key, entry)
+                finally:
+                    cache.delete(lock_key)
+            else:
+                entry = _wait_for_entry(entry_key, lock_key)
+            if entry is None:
+                return view(request, *args, **kwargs)
+            return _personalize(request, entry)
+        return wrapper
+    return decorator
@@ -61,11 +61,14 @@ INSTALLED_APPS = [
     'crispy_forms',
     'core',
     'analytics',  # Your app name
+    'search',  # Inverted-index product search
+    'api',  # Read-only JSON catalog API (/api/v1/)
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'ecomstore.db_routers.PrimaryPinningMiddleware',  # Read-replica routing (see DATABASE_REPLICAS)
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -90,6 +93,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.static', # <-- ADD THIS LINE
                 'ecomstore.context_processors.site_name',
+                'cart.context_processors.cart_summary',
             ],
         },
     },
@@ -115,6 +119,31 @@ DATABASES = {
     }
 }
 
+# Read replicas: add their aliases to DATABASES and list them here, e.g.
+#     DATABASES['replica'] = {**DATABASES['default'], 'HOST': 'replica-1.internal'}
+#     DATABASE_REPLICAS = ['replica']
+# See ecomstore/db_routers.py for which reads are sent to them.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['ecomstore.db_routers.ReplicaRouter']
+DATABASE_PRIMARY_STICKY_SECONDS = 5  # after writing, a user reads from the primary this long
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Derived catalog structures (facet bitmaps, etc.) are shared between workers
+# through this cache. LocMemCache is per-process; use a shared backend such as
+# Redis or Memcached when running more than one worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecomstore',
+    }
+}
+
+# Cached catalog pages (ecomstore/page_cache.py) are fresh for PAGE_CACHE_TIMEOUT seconds, then served stale while re-rendered
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE_TIMEOUT = 60 * 10
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -164,6 +193,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Sitemaps and the product feed, written by `manage.py build_feeds`; serve them as static files
+FEEDS_URL = MEDIA_URL + 'feeds/'
+FEEDS_ROOT = os.path.join(MEDIA_ROOT, 'feeds')
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -266,6 +299,38 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 SITE_NAME = 'Excellent Fashion Wares'
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')  # absolute links in sitemaps and feeds
 
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY')
-PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY')
\ No newline at end of file
+PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY')
+
+# Catalog
+PRODUCTS_PAGE_SIZE = 24
+PRODUCTS_MAX_PAGE_SIZE = 96  # largest ?page_size= honoured
+REVIEWS_PAGE_SIZE = 10  # later pages load on scroll
+SEARCH_RESULTS_LIMIT = 48  # ranked results per search
+AUTOCOMPLETE_RESULTS = 8  # suggestions per keystroke
+RELATED_PRODUCTS_SHOWN = 4
+COPURCHASE_SHOWN = 4  # "customers also bought", from `manage.py compute_copurchases`
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Buffered product views are flushed by the next request, or by `manage.py flush_product_views --loop` (needs a shared cache)
+PRODUCT_VIEW_FLUSH_INTERVAL = 60  # seconds
+PRODUCT_VIEW_FLUSH_ON_REQUEST = True
+
+# `manage.py compute_popularity`: activity halves in weight every HALF_LIFE_DAYS and is dropped after WINDOW_DAYS
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WINDOW_DAYS = 60
+POPULARITY_WEIGHTS = {'view': 1, 'cart_add': 5, 'sale': 20}
+
+# Products per sitemap file and feed block (sitemaps allow up to 50,000 URLs)
+FEED_BLOCK_SIZE = 10000
+FEED_CURRENCY = 'NGN'
+
+# Anonymous visitors' carts; 'cart.storage.DatabaseCartStorage' keeps a Cart row per visitor instead
+CART_STORAGE_BACKEND = 'cart.storage.SessionCartStorage'
+
+# `manage.py purge_stale_data` deletes anonymous carts left this many days, and orders pending this long
+PURGE_CART_DAYS = 30
+PURGE_PENDING_ORDER_DAYS = 30
@@ -0,0 +1,55 @@
+# ecomstore/test_settings.py
+"""
+Settings for running the test suite locally:
+
+    python manage.py test --settings=ecomstore.test_settings
+
+SQLite files stand in for the MySQL primary and its read replica, so every
+test goes through the replica routing in ecomstore/db_routers.py. The
+replica is a test mirror of the primary, as a replica that has caught up
+would be. A second, lagging replica holds rows of its own, so the routing
+tests can tell where a read went. The files live in the system temp
+directory, not in the checkout.
+"""
+import os
+import tempfile
+
+os.environ.setdefault('PAYSTACK_PUBLIC_KEY', 'pk_test_dummy')
+os.environ.setdefault('PAYSTACK_SECRET_KEY', 'sk_test_dummy')
+
+from .settings import *  # noqa: E402,F401,F403
+
+TEST_DB_DIR = tempfile.gettempdir()
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(TEST_DB_DIR, 'ecomstore_test_primary.sqlite3'),
+        'TEST': {'NAME': os.path.join(TEST_DB_DIR, 'ecomstore_test_primary.sqlite3')},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(TEST_DB_DIR, 'ecomstore_test_primary.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+    'lagging_replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(TEST_DB_DIR, 'ecomstore_test_replica.sqlite3'),
+        'TEST': {'NAME': os.path.join(TEST_DB_DIR, 'ecomstore_test_replica.sqlite3')},
+    },
+}
+DATABASE_REPLICAS = ['replica']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecomstore-tests',
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+}
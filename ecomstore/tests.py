@@ -0,0 +1,224 @@
+# ecomstore/tests.py
+import re
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.middleware.csrf import _does_token_match, get_token
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from cart.models import Cart
+from products.models import Category, Product, RelatedProducts
+
+from . import page_cache
+from .commit_batches import CommitBatch
+from .db_routers import PIN_SESSION_KEY, PrimaryPinningMiddleware, replica_reads, wrote_to_primary
+from .upserts import bulk_upsert
+
+
+def _view(module, write=False):
+    """A view from `module` that reports where a Product read would go, optionally writing first."""
+    def view(request):
+        if write:
+            Category.objects.create(name='Written', slug='written')
+        return HttpResponse(router.db_for_read(Product))
+    view.__module__ = module
+    return view
+
+
+@override_settings(DATABASE_REPLICAS=['lagging_replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Runs against a replica with rows of its own (see ecomstore/test_settings.py)."""
+    databases = {'default', 'lagging_replica'}
+
+    def setUp(self):
+        # Only the replica has this product, so where it is found tells where the read went
+        category = Category.objects.using('lagging_replica').create(name='Replica only', slug='replica-only')
+        Product.objects.using('lagging_replica').create(
+            category=category, name='Replica product', slug='replica-product', in_stock=True,
+        )
+
+    def _request(self, view, method='GET', session=None):
+        request = RequestFactory().generic(method, '/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        if session:
+            request.session.update(session)
+
+        def get_response(request):
+            return middleware.process_view(request, view, (), {}) or view(request)
+
+        middleware = PrimaryPinningMiddleware(get_response)
+        response = middleware(request)
+        return response.content.decode(), request.session
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertFalse(Product.objects.filter(slug='replica-product').exists())
+
+    def test_catalog_reads_use_the_replica(self):
+        with replica_reads():
+            self.assertTrue(Product.objects.filter(slug='replica-product').exists())
+
+    def test_primary_apps_are_never_read_from_the_replica(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Cart), 'default')
+
+    def test_reads_inside_transactions_use_the_primary(self):
+        with replica_reads(), transaction.atomic():
+            self.assertFalse(Product.objects.filter(slug='replica-product').exists())
+
+    def test_a_write_pins_the_rest_of_the_request(self):
+        with replica_reads():
+            Category.objects.create(name='New', slug='new')
+            self.assertTrue(wrote_to_primary())
+            self.assertFalse(Product.objects.filter(slug='replica-product').exists())
+
+    def test_safe_catalog_request_reads_from_the_replica(self):
+        self.assertEqual(self._request(_view('products.views'))[0], 'lagging_replica')
+
+    def test_cart_and_checkout_views_stay_on_the_primary(self):
+        self.assertEqual(self._request(_view('cart.views'))[0], 'default')
+        self.assertEqual(self._request(_view('checkout.views'))[0], 'default')
+
+    def test_unsafe_requests_stay_on_the_primary(self):
+        self.assertEqual(self._request(_view('products.views'), method='POST')[0], 'default')
+
+    def test_writing_pins_the_session_to_the_primary(self):
+        _, session = self._request(_view('products.views', write=True))
+        self.assertGreater(session[PIN_SESSION_KEY], time.time())
+        self.assertEqual(self._request(_view('products.views'), session=dict(session))[0], 'default')
+
+    def test_pin_expires(self):
+        session = {PIN_SESSION_KEY: time.time() - 1}
+        self.assertEqual(self._request(_view('products.views'), session=session)[0], 'lagging_replica')
+
+    def test_product_listing_is_served_from_the_replica(self):
+        response = Client(SERVER_NAME='localhost').get('/products/products/')
+        self.assertContains(response, 'Replica product')
+
+
+class MirroredReplicaTests(TransactionTestCase):
+    """The suite's own replica mirrors the primary, so views read committed rows through the router."""
+    databases = {'default', 'replica'}
+
+    def test_product_listing_reads_the_mirror(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.create(category=category, name='Runner', slug='runner', in_stock=True)
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = Client(SERVER_NAME='localhost').get('/products/products/')
+        self.assertContains(response, 'Runner')
+        self.assertTrue(replica_queries)
+
+
+class UpsertTests(TestCase):
+
+    def upsert(self, product, candidate_ids):
+        with CaptureQueriesContext(connection) as queries:
+            bulk_upsert(RelatedProducts, [RelatedProducts(product=product, candidate_ids=candidate_ids)], ['product'], ['candidate_ids'])
+        return queries[-1]['sql']
+
+    def test_unique_fields_only_go_to_backends_that_take_them(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        runner = Product.objects.create(category=category, name='Runner', slug='runner')
+        boot = Product.objects.create(category=category, name='Boot', slug='boot')
+        self.assertIn('ON CONFLICT("product_id")', self.upsert(runner, [1]))
+        self.assertEqual(self.upsert(runner, [2]).count('ON CONFLICT'), 1)
+        # MySQL names no conflict target (ON DUPLICATE KEY UPDATE); SQLite then writes a plain INSERT
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertNotIn('ON CONFLICT', self.upsert(boot, [3]))
+        self.assertEqual(dict(RelatedProducts.objects.values_list('product', 'candidate_ids')), {runner.pk: [2], boot.pk: [3]})
+
+
+class CommitBatchTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.batch = CommitBatch(self.calls.append)
+
+    def test_keys_are_handed_over_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(1)
+            self.batch.add(2, 1)
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{1, 2}])
+
+    def test_rolled_back_keys_go_with_the_next_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.batch.add(1)
+                transaction.set_rollback(True)
+        self.assertEqual(self.calls, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(2)
+        self.assertEqual(self.calls, [{1, 2}])
+
+    def test_keys_are_kept_per_thread(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(1)
+            # Another request's thread, outside a transaction, runs its callback right away
+            thread = threading.Thread(target=self.batch.add, args=(2,))
+            thread.start()
+            thread.join()
+            self.assertEqual(self.calls, [{2}])
+        self.assertEqual(self.calls, [{2}, {1}])
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.renders = []
+        self.user = User.objects.create_user('ada')
+
+        @page_cache.cached_page('test')
+        def view(request):
+            self.renders.append(request)
+            return HttpResponse(f'<p>{len(self.renders)}</p><input name="csrfmiddlewaretoken" value="{get_token(request)}">')
+        self.view = view
+
+    def request(self, **extra):
+        request = RequestFactory().get('/', HTTP_COOKIE='sessionid=abc', **extra)
+        SessionMiddleware(lambda request: None).process_request(request)
+        request.session['cart_lines'] = {'1': [1, '10.00']}
+        request.user = self.user
+        return request
+
+    def assertRenderedAnonymously(self, request):
+        self.assertFalse(request.user.is_authenticated)
+        self.assertEqual((dict(request.COOKIES), dict(request.session)), ({}, {}))
+
+    def test_pages_are_rendered_once_as_an_anonymous_visitor(self):
+        first, second = self.request(), self.request()
+        self.view(first)
+        response = self.view(second)
+        self.assertEqual(len(self.renders), 1)
+        self.assertRenderedAnonymously(self.renders[0])
+        # Each visitor gets their own CSRF token in the shared page
+        token = re.search(r'value="([^"]+)"', response.content.decode()).group(1)
+        self.assertTrue(_does_token_match(token, second.META['CSRF_COOKIE']))
+        self.assertFalse(_does_token_match(token, first.META['CSRF_COOKIE']))
+
+    def test_query_strings_and_posts_skip_the_cache(self):
+        self.view(self.request(QUERY_STRING='page=2'))
+        self.view(RequestFactory().post('/'))
+        self.assertEqual(len(self.renders), 2)
+
+    def test_stale_pages_are_served_while_one_worker_refreshes(self):
+        self.view(self.request())
+        page_cache.bump_catalog_version()
+        with mock.patch.object(page_cache.threading, 'Thread') as thread:
+            responses = [self.view(self.request()) for _ in range(3)]
+        # Everyone gets the stale copy, and only the lock holder starts a refresh
+        self.assertEqual([response.content[:8] for response in responses], [b'<p>1</p>'] * 3)
+        self.assertEqual(thread.call_count, 1)
+
+        with mock.patch.object(page_cache, 'connections'):
+            thread.call_args.kwargs['target']()
+        self.assertRenderedAnonymously(self.renders[1])
+        self.assertContains(self.view(self.request()), '<p>2</p>')
+        self.assertEqual(len(self.renders), 2)
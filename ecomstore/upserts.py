@@ -0,0 +1,22 @@
+# ecomstore/upserts.py
+"""
+bulk_create() upserts that run on every supported database.
+
+PostgreSQL and SQLite need the unique fields a conflict is detected on
+(INSERT ... ON CONFLICT (...) DO UPDATE). MySQL can't name them: its
+INSERT ... ON DUPLICATE KEY UPDATE fires on any unique key, and Django
+raises NotSupportedError when unique_fields are passed there.
+"""
+from django.db import connections, router
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=None):
+    """Inserts `objs`, updating `update_fields` of the rows already present under `unique_fields`."""
+    connection = connections[router.db_for_write(model)]
+    return model._default_manager.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=unique_fields if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=update_fields,
+    )
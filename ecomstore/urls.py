@@ -70,6 +70,9 @@ urlpatterns = [
     path('', include('core.urls')), # Contact form URL
 
     path('analytics/', include('analytics.urls')),
+
+    # Read-only JSON catalog API
+    path('api/v1/', include('api.urls', namespace='api')),
 ]
 
 if settings.DEBUG:
@@ -14,3 +14,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecomstore.settings')
 
 application = get_wsgi_application()
+
+# Load the search-as-you-type index before the first request needs it
+import logging  # noqa: E402
+
+from search.autocomplete import warm_index  # noqa: E402
+
+try:
+    warm_index()
+except Exception:
+    # Suggestions stay empty until the index can be built; the site itself still works
+    logging.getLogger(__name__).exception("Could not load the autocomplete index at startup")
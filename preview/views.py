@@ -2,12 +2,14 @@
 from django.shortcuts import render
 from products.models import Product, Category  # <--- Import Category model
 from django.db.models import Q  # <--- Import Q for filtering if needed
+from ecomstore.page_cache import cached_page
 
 # Create your views here.
 
+@cached_page('home')
 def home(request):
     # Fetch products that are overall available (have at least one active, in-stock variant)
-    products = Product.objects.filter(variants__is_active=True, variants__stock__gt=0).distinct()
+    products = Product.objects.filter(in_stock=True).select_related('category')
     products = products.order_by('-created_at')[:8]  # Show 8 latest available products
 
     # Fetch all categories
@@ -43,6 +43,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         'category',              # CORRECTED: Filter by 'category' (ForeignKey field)
+        'in_stock',              # Denormalized availability flag
         'created_at',            # CORRECTED: Filter by creation date
         'updated_at',            # CORRECTED: Filter by update date
         # You can also filter by variant properties, e.g.:
@@ -50,7 +51,10 @@ class ProductAdmin(admin.ModelAdmin):
         # 'variants__stock',       # Filter by stock (e.g., products with variants where stock is > 0)
     ]
     prepopulated_fields = {'slug': ('name',)}
+    # Counted by products/counters.py; Product.save() leaves it alone
+    readonly_fields = ('view_count',)
     search_fields = ('name', 'description')
+    list_select_related = ('category',)
     # Removed filter_horizontal = ('categories',) - this was incorrect for a ForeignKey
     # Removed other old list_display/list_filter fields that no longer exist on Product
 
@@ -59,11 +63,14 @@ class ProductAdmin(admin.ModelAdmin):
 
     # --- Custom methods for list_display to show variant-derived info ---
 
-    @admin.display(description='Price Range')
+    # These read the denormalized summary columns on Product (kept in sync by
+    # products/signals.py), so the changelist never aggregates variants per row.
+
+    @admin.display(description='Price Range', ordering='min_price')
     def display_price_range(self, obj):
         """Displays the min-max price range of active variants, or a single price if only one."""
-        min_price = obj.get_min_variant_price()
-        max_price = obj.get_max_variant_price()
+        min_price = obj.min_price
+        max_price = obj.max_price
 
         if min_price is None:
             return "N/A" # No active variants with a price
@@ -71,16 +78,15 @@ class ProductAdmin(admin.ModelAdmin):
             return f"${min_price:.2f}"
         return f"${min_price:.2f} - ${max_price:.2f}"
 
-    @admin.display(description='Total Stock')
+    @admin.display(description='Total Stock', ordering='total_stock')
     def display_total_stock(self, obj):
         """Displays the sum of stock from all active variants."""
-        total_stock = obj.get_total_stock()
-        return total_stock if total_stock is not None else 0
+        return obj.total_stock
 
-    @admin.display(boolean=True, description='Overall Available?')
+    @admin.display(boolean=True, description='Overall Available?', ordering='in_stock')
     def is_available_status(self, obj):
         """Checks if the product has at least one active variant with stock > 0."""
-        return obj.is_available() # This calls the method we added to the Product model
+        return obj.in_stock
 
 
 # 4. Register the new Variation model (e.g., Size, Color)
@@ -0,0 +1,48 @@
+# products/card_cache.py
+"""
+Fragment cache for product cards (templates/products/_product_card.html).
+
+Each rendered card is cached under the product's id and cache_version, so a
+change to the product, its variants or its reviews simply moves it to a new
+key (see bump_cache_versions in products/models.py) and nothing has to be
+deleted. A page of cards costs one cache.get_many(); only the misses are
+rendered and written back with one cache.set_many().
+
+Cards contain an add-to-cart form, so they are rendered with a placeholder
+instead of the CSRF token and the visitor's own token is substituted on the
+way out.
+"""
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'products/_product_card.html'
+CACHE_KEY = 'product_card:{product_id}:{version}'
+# Keys carry Product.cache_version, so this only bounds how long unused cards linger
+CACHE_TIMEOUT = 60 * 60 * 24
+CSRF_PLACEHOLDER = 'CSRFTOKENPLACEHOLDER'
+
+
+def _key(product):
+    return CACHE_KEY.format(product_id=product.pk, version=product.cache_version)
+
+
+def render_cards(products, request=None):
+    """Returns [(product, html)] for the given products, in order."""
+    products = list(products)
+    if not products:
+        return []
+    cached = cache.get_many([_key(product) for product in products])
+
+    missing = {}
+    for product in products:
+        key = _key(product)
+        if key not in cached and key not in missing:
+            missing[key] = render_to_string(CARD_TEMPLATE, {'product': product, 'csrf_token': CSRF_PLACEHOLDER})
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+        cached.update(missing)
+
+    token = get_token(request) if request is not None else ''
+    return [(product, mark_safe(cached[_key(product)].replace(CSRF_PLACEHOLDER, token))) for product in products]
@@ -0,0 +1,343 @@
+# products/catalog_io.py
+"""
+Streaming catalog import/export (see the import_catalog and export_catalog
+management commands).
+
+A catalog file has one row per variant, in CSV or JSON Lines:
+
+    product_slug, product_name, description, category_slug, category_name,
+    sku, price, stock, is_active, attributes
+
+`attributes` is "Color=Red;Size=M" in CSV and an object in JSONL. A row
+with an empty sku describes a product without touching its variants, so
+variants must have a sku to be imported.
+
+Rows are read lazily and written in chunks: every chunk is matched against
+the database by product slug and variant sku with a few IN queries, then
+written with bulk_create/bulk_update in one transaction. Bulk writes don't
+fire model signals, so the derived data that the signals normally maintain
+(variant summaries, search index, facets, card versions, ...) is refreshed
+once per chunk instead of once per row.
+
+Imports are upserts: attribute values present in the file are created or
+updated, attributes missing from a row are left alone.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from ecomstore.page_cache import bump_catalog_version
+from search import autocomplete
+from search.engine import index_products
+
+from . import facets, related, variant_matrix
+from .models import (
+    Category, Product, ProductVariant, ProductVariantAttribute, Variation,
+    bump_cache_versions, refresh_variant_summaries,
+)
+
+FIELDS = [
+    'product_slug', 'product_name', 'description', 'category_slug', 'category_name',
+    'sku', 'price', 'stock', 'is_active', 'attributes',
+]
+FORMATS = ('csv', 'jsonl')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+class CatalogFormatError(ValueError):
+    """A row of the catalog file can't be imported; carries its line number."""
+
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+def guess_format(path):
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+# --- Reading -----------------------------------------------------------------
+
+def _parse_attributes(value):
+    if isinstance(value, dict):
+        return {str(name).strip(): str(attribute).strip() for name, attribute in value.items()}
+    attributes = {}
+    for pair in (value or '').split(';'):
+        if pair.strip():
+            name, _, attribute = pair.partition('=')
+            attributes[name.strip()] = attribute.strip()
+    return attributes
+
+
+def _clean_row(line, raw):
+    row = {field: raw.get(field) for field in FIELDS}
+    for field in FIELDS:
+        if isinstance(row[field], str):
+            row[field] = row[field].strip()
+
+    row['product_slug'] = row['product_slug'] or slugify(row['product_name'] or '')
+    if not row['product_slug']:
+        raise CatalogFormatError(line, "product_slug or product_name is required.")
+    row['category_slug'] = row['category_slug'] or slugify(row['category_name'] or '')
+    if not row['category_slug']:
+        raise CatalogFormatError(line, "category_slug or category_name is required.")
+    row['product_name'] = row['product_name'] or row['product_slug']
+    row['category_name'] = row['category_name'] or row['category_slug']
+    row['description'] = row['description'] or ''
+    row['sku'] = row['sku'] or None
+
+    if row['sku']:
+        try:
+            row['price'] = Decimal(str(row['price']))
+            row['stock'] = int(row['stock'] or 0)
+        except (InvalidOperation, TypeError, ValueError):
+            raise CatalogFormatError(line, f"invalid price or stock for sku {row['sku']!r}.")
+        if row['stock'] < 0:
+            raise CatalogFormatError(line, f"negative stock for sku {row['sku']!r}.")
+        is_active = row['is_active']
+        row['is_active'] = True if is_active in (None, '') else str(is_active).lower() in TRUE_VALUES
+        row['attributes'] = _parse_attributes(row['attributes'])
+    return row
+
+
+def read_rows(fh, fmt):
+    """Yields (line number, cleaned row) from an open catalog file, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(fh)
+        for raw in reader:
+            yield reader.line_num, _clean_row(reader.line_num, raw)
+    else:
+        for line, text in enumerate(fh, start=1):
+            if not text.strip():
+                continue
+            try:
+                raw = json.loads(text)
+            except ValueError:
+                raise CatalogFormatError(line, "invalid JSON.")
+            yield line, _clean_row(line, raw)
+
+
+# --- Importing ---------------------------------------------------------------
+
+def _upsert_categories(rows):
+    wanted = {}
+    for row in rows:
+        wanted.setdefault(row['category_slug'], row['category_name'])
+    existing = Category.objects.in_bulk(list(wanted), field_name='slug')
+    Category.objects.bulk_create(
+        [Category(slug=slug, name=name) for slug, name in wanted.items() if slug not in existing],
+        ignore_conflicts=True,
+    )
+    categories = dict(Category.objects.filter(slug__in=list(wanted)).values_list('slug', 'id'))
+    missing = set(wanted) - set(categories)
+    if missing:
+        raise ValueError(f"Could not create categories {sorted(missing)} (is the name already taken?)")
+    return categories
+
+
+def _upsert_products(rows, categories, now):
+    wanted = {}
+    for row in rows:
+        wanted[row['product_slug']] = row  # the last row of a product wins
+    existing = Product.objects.in_bulk(list(wanted), field_name='slug')
+
+    to_create = []
+    to_update = []
+    previous_category_ids = set()
+    for slug, row in wanted.items():
+        values = {
+            'name': row['product_name'],
+            'description': row['description'],
+            'category_id': categories[row['category_slug']],
+        }
+        product = existing.get(slug)
+        if product is None:
+            to_create.append(Product(slug=slug, **values))
+        elif any(getattr(product, field) != value for field, value in values.items()):
+            previous_category_ids.add(product.category_id)
+            for field, value in values.items():
+                setattr(product, field, value)
+            product.updated_at = now
+            to_update.append(product)
+
+    Product.objects.bulk_create(to_create, batch_size=500)
+    Product.objects.bulk_update(to_update, ['name', 'description', 'category_id', 'updated_at'], batch_size=500)
+    return dict(Product.objects.filter(slug__in=list(wanted)).values_list('slug', 'id')), previous_category_ids
+
+
+def _variations(rows):
+    names = {name for row in rows if row['sku'] for name in row['attributes']}
+    existing = dict(Variation.objects.filter(name__in=names).values_list('name', 'id'))
+    if names - set(existing):
+        Variation.objects.bulk_create([Variation(name=name) for name in names - set(existing)], ignore_conflicts=True)
+        existing = dict(Variation.objects.filter(name__in=names).values_list('name', 'id'))
+    return existing
+
+
+def _upsert_variants(rows, products):
+    wanted = {}
+    for row in rows:
+        if row['sku']:
+            wanted[row['sku']] = row
+    if not wanted:
+        return {}, set()
+    existing = ProductVariant.objects.in_bulk(list(wanted), field_name='sku')
+
+    to_create = []
+    to_update = []
+    previous_product_ids = set()
+    for sku, row in wanted.items():
+        values = {
+            'product_id': products[row['product_slug']],
+            'price': row['price'],
+            'stock': row['stock'],
+            'is_active': row['is_active'],
+        }
+        variant = existing.get(sku)
+        if variant is None:
+            to_create.append(ProductVariant(sku=sku, **values))
+        elif any(getattr(variant, field) != value for field, value in values.items()):
+            previous_product_ids.add(variant.product_id)
+            for field, value in values.items():
+                setattr(variant, field, value)
+            to_update.append(variant)
+
+    ProductVariant.objects.bulk_create(to_create, batch_size=500)
+    ProductVariant.objects.bulk_update(to_update, ['product_id', 'price', 'stock', 'is_active'], batch_size=500)
+    return dict(ProductVariant.objects.filter(sku__in=list(wanted)).values_list('sku', 'id')), previous_product_ids
+
+
+def _upsert_attributes(rows, variants, variations):
+    wanted = {}
+    for row in rows:
+        if row['sku']:
+            for name, value in row['attributes'].items():
+                wanted[(variants[row['sku']], variations[name])] = value
+    if not wanted:
+        return
+    existing = {
+        (attribute.product_variant_id, attribute.variation_id): attribute
+        for attribute in ProductVariantAttribute.objects.filter(product_variant_id__in=set(variants.values()))
+    }
+
+    to_create = []
+    to_update = []
+    for (variant_id, variation_id), value in wanted.items():
+        attribute = existing.get((variant_id, variation_id))
+        if attribute is None:
+            to_create.append(ProductVariantAttribute(product_variant_id=variant_id, variation_id=variation_id, attribute_value=value))
+        elif attribute.attribute_value != value:
+            attribute.attribute_value = value
+            to_update.append(attribute)
+
+    ProductVariantAttribute.objects.bulk_create(to_create, batch_size=1000)
+    ProductVariantAttribute.objects.bulk_update(to_update, ['attribute_value'], batch_size=1000)
+
+
+def import_chunk(rows):
+    """
+    Writes one chunk of cleaned rows in a single transaction, then refreshes
+    the derived data of the products it touched. Returns (product ids, category ids).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        categories = _upsert_categories(rows)
+        products, previous_category_ids = _upsert_products(rows, categories, now)
+        variations = _variations(rows)
+        variants, previous_product_ids = _upsert_variants(rows, products)
+        _upsert_attributes(rows, variants, variations)
+        # Includes products that a variant was moved away from
+        product_ids = set(products.values()) | previous_product_ids
+        # Products moved out of a category leave stale related-products lists behind there too
+        category_ids = set(categories.values()) | previous_category_ids
+        refresh_variant_summaries(product_ids)
+        bump_cache_versions(product_ids)
+
+    index_products(product_ids)
+    facets.refresh_products(product_ids)
+    variant_matrix.invalidate(product_ids)
+    autocomplete.refresh_products(product_ids)
+    return product_ids, category_ids
+
+
+def finish_import(category_ids):
+    """
+    Work that only needs doing once per import: category suggestions and the
+    cached catalog pages. The categories' related products are queued for
+    `rebuild_related_products --stale` rather than rebuilt here, so a failed
+    rebuild can't fail an import whose rows are already committed.
+    """
+    related.schedule_rebuild(*category_ids)
+    autocomplete.refresh_categories(category_ids)
+    bump_catalog_version()
+
+
+# --- Exporting ---------------------------------------------------------------
+
+def export_rows(chunk_size=1000):
+    """Yields catalog rows for every product and variant, reading the catalog in primary-key chunks."""
+    last_pk = 0
+    while True:
+        products = list(
+            Product.objects.filter(pk__gt=last_pk).order_by('pk').values(
+                'id', 'slug', 'name', 'description', 'category__slug', 'category__name',
+            )[:chunk_size]
+        )
+        if not products:
+            return
+        last_pk = products[-1]['id']
+
+        variants = {}
+        for variant in ProductVariant.objects.filter(product_id__in=[product['id'] for product in products]).order_by('id').values(
+            'id', 'product_id', 'sku', 'price', 'stock', 'is_active',
+        ):
+            variant['attributes'] = {}
+            variants.setdefault(variant['product_id'], []).append(variant)
+        by_id = {variant['id']: variant for product_variants in variants.values() for variant in product_variants}
+        for variant_id, name, value in ProductVariantAttribute.objects.filter(product_variant_id__in=list(by_id)).order_by(
+            'variation__name',
+        ).values_list('product_variant_id', 'variation__name', 'attribute_value'):
+            by_id[variant_id]['attributes'][name] = value
+
+        for product in products:
+            base = {
+                'product_slug': product['slug'],
+                'product_name': product['name'],
+                'description': product['description'],
+                'category_slug': product['category__slug'],
+                'category_name': product['category__name'],
+            }
+            product_variants = variants.get(product['id'])
+            if not product_variants:
+                yield {**base, 'sku': None, 'price': None, 'stock': None, 'is_active': None, 'attributes': {}}
+            for variant in product_variants or ():
+                yield {
+                    **base,
+                    'sku': variant['sku'],
+                    'price': variant['price'],
+                    'stock': variant['stock'],
+                    'is_active': variant['is_active'],
+                    'attributes': variant['attributes'],
+                }
+
+
+def write_rows(rows, fh, fmt):
+    """Writes catalog rows to an open file as they come; returns the number written."""
+    written = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(fh, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            attributes = ';'.join(f'{name}={value}' for name, value in row['attributes'].items())
+            writer.writerow({**row, 'attributes': attributes, 'is_active': '' if row['is_active'] is None else int(row['is_active'])})
+            written += 1
+    else:
+        for row in rows:
+            fh.write(json.dumps({**row, 'price': None if row['price'] is None else str(row['price'])}) + '\n')
+            written += 1
+    return written
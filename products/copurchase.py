@@ -0,0 +1,141 @@
+# products/copurchase.py
+"""
+"Customers also bought" recommendations.
+
+An offline job (`manage.py compute_copurchases`) streams paid order lines
+in (order, line) order and, chunk by chunk, turns them into a sparse
+order-by-product incidence matrix B. B.T @ B then counts, for every pair of
+products, the orders containing both; the chunks' counts are summed into
+one sparse product-by-product matrix. Memory depends on the number of
+co-purchased pairs, not on the number of order lines.
+
+Counts are normalised to cosine similarity (count / sqrt(orders of a *
+orders of b)) so best-sellers don't top every list, and the best
+NEIGHBORS per product are stored in CoPurchase. Pages read
+them with one primary-key lookup.
+
+NumPy and SciPy are only needed by the offline job.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from ecomstore.page_cache import bump_catalog_version
+from ecomstore.upserts import bulk_upsert
+
+from .models import CoPurchase, Product
+from .popularity import PAID_ORDER_STATUSES
+
+# Neighbors stored per product; COPURCHASE_SHOWN of them are shown
+NEIGHBORS = 12
+
+
+def _order_lines(chunk_size):
+    """Yields lists of (order_id, product_id) lines, never splitting an order across two lists."""
+    # Imported here: checkout depends on products, not the other way round
+    from checkout.models import OrderItem
+
+    lines = OrderItem.objects.filter(
+        product__isnull=False, order__status__in=PAID_ORDER_STATUSES,
+    ).order_by('order_id', 'id').values_list('order_id', 'product_id')
+
+    last_order_id = 0
+    while True:
+        rows = list(lines.filter(order_id__gt=last_order_id)[:chunk_size])
+        if not rows:
+            return
+        if len(rows) == chunk_size:
+            # The last order may continue past the page; leave it for the next one
+            complete = [row for row in rows if row[0] != rows[-1][0]]
+            # ... unless it fills the whole page on its own
+            rows = complete or list(lines.filter(order_id=rows[-1][0]))
+        last_order_id = rows[-1][0]
+        yield rows
+
+
+def co_occurrence_matrix(chunk_size=50000, progress=None):
+    """Returns (matrix, order counts) where matrix[a, b] is the number of paid orders containing both a and b."""
+    import numpy as np
+    from scipy import sparse
+
+    size = (Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    total = sparse.csr_matrix((size, size), dtype=np.int64)
+    lines_read = 0
+    for chunk in _order_lines(chunk_size):
+        lines = np.asarray(chunk, dtype=np.int64)
+        # Renumber the chunk's orders 0..n-1 to get the incidence matrix rows
+        _, order_rows = np.unique(lines[:, 0], return_inverse=True)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(lines), dtype=np.int64), (order_rows, lines[:, 1])),
+            shape=(order_rows.max() + 1, size),
+        )
+        # Several lines of the same product in one order count once
+        incidence.data[:] = 1
+        total = total + (incidence.T @ incidence).tocsr()
+        lines_read += len(lines)
+        if progress:
+            progress(lines_read)
+    orders_per_product = total.diagonal().astype(np.float64)
+    total.setdiag(0)
+    total.eliminate_zeros()
+    return total, orders_per_product
+
+
+def top_neighbors(matrix, orders_per_product, k):
+    """Yields (product_id, [neighbor ids, best first]) from the co-occurrence matrix."""
+    import numpy as np
+
+    for product_id in np.flatnonzero(np.diff(matrix.indptr)):
+        start, end = matrix.indptr[product_id], matrix.indptr[product_id + 1]
+        neighbors = matrix.indices[start:end]
+        scores = matrix.data[start:end] / np.sqrt(orders_per_product[product_id] * orders_per_product[neighbors])
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        # Highest score first; the lower product id wins ties so results are stable
+        ranked = best[np.lexsort((neighbors[best], -scores[best]))]
+        yield int(product_id), [int(neighbor) for neighbor in neighbors[ranked]]
+
+
+def rebuild_copurchases(chunk_size=50000, batch_size=1000, progress=None):
+    """Recomputes every product's co-purchase neighbors. Returns the number of products with neighbors."""
+    matrix, orders_per_product = co_occurrence_matrix(chunk_size, progress)
+    existing_ids = set(Product.objects.values_list('pk', flat=True))
+    rows = [
+        CoPurchase(product_id=product_id, neighbor_ids=[pk for pk in neighbor_ids if pk in existing_ids])
+        for product_id, neighbor_ids in top_neighbors(matrix, orders_per_product, NEIGHBORS)
+        if product_id in existing_ids
+    ]
+    with transaction.atomic():
+        CoPurchase.objects.exclude(product_id__in=[row.product_id for row in rows]).delete()
+        bulk_upsert(CoPurchase, rows, unique_fields=['product'], update_fields=['neighbor_ids', 'updated_at'], batch_size=batch_size)
+    # Product pages show the recommendations; make their ETags change
+    bump_catalog_version()
+    return len(rows)
+
+
+def also_bought(product_ids, count=None, exclude=()):
+    """
+    Up to `count` in-stock products bought together with any of `product_ids`
+    (one product on the detail page, the whole cart on the cart page): one
+    indexed lookup for the neighbor lists plus one query for the products.
+    """
+    count = count or settings.COPURCHASE_SHOWN
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    neighbor_lists = dict(CoPurchase.objects.filter(product_id__in=product_ids).values_list('product_id', 'neighbor_ids'))
+    skip = set(product_ids) | set(exclude)
+
+    # Interleave the lists rank by rank so every product in a cart contributes
+    picked = []
+    lists = [neighbor_lists[pk] for pk in product_ids if pk in neighbor_lists]
+    for rank in range(max((len(neighbors) for neighbors in lists), default=0)):
+        for neighbors in lists:
+            if rank < len(neighbors) and neighbors[rank] not in skip:
+                skip.add(neighbors[rank])
+                picked.append(neighbors[rank])
+
+    products = Product.objects.filter(pk__in=picked, in_stock=True).select_related('category').in_bulk()
+    return [products[pk] for pk in picked if pk in products][:count]
@@ -0,0 +1,162 @@
+# products/counters.py
+"""
+Buffered product view and cart-add counting.
+
+A page view or cart add only increments a counter in the cache. Counters
+are bucketed into fixed time windows of PRODUCT_VIEW_FLUSH_INTERVAL seconds;
+once a window is closed nothing writes to it any more, so a flush can read
+it, apply one `view_count = view_count + n` UPDATE per viewed product, add
+the window's views and cart adds to the daily ProductActivity rows that feed
+popularity, and drop it without losing concurrent increments.
+
+Flushing is driven by the `flush_product_views` management command
+(run it with --loop as a worker), and optionally piggybacks on requests
+when PRODUCT_VIEW_FLUSH_ON_REQUEST is set. The command can only see the
+counters if the default cache is shared between processes (Redis,
+Memcached, ...). With LocMemCache every web process buffers its own counts,
+so the command refuses to run and PRODUCT_VIEW_FLUSH_ON_REQUEST is what
+writes them.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product
+from .popularity import record_activity
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'product_counters'
+# The counters kept per product, named after their ProductActivity fields
+COUNTERS = ('views', 'cart_adds')
+FLUSHED_KEY = f'{PREFIX}:flushed'
+LOCK_KEY = f'{PREFIX}:flush_lock'
+
+# Windows are kept around long enough for a slow or restarted worker to catch up
+RETAINED_WINDOWS = 60
+
+
+def buffer_is_shared():
+    """False when each process buffers its own counts, which only its own requests can flush."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def _interval():
+    return max(1, int(settings.PRODUCT_VIEW_FLUSH_INTERVAL))
+
+
+def _timeout():
+    return _interval() * (RETAINED_WINDOWS + 2)
+
+
+def _current_window():
+    return int(time.time() // _interval())
+
+
+def _incr(key):
+    """cache.incr() that creates the key when missing."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, _timeout()):
+            return 1
+        return cache.incr(key)
+
+
+def _count(counter, product_id, amount=1):
+    """Adds `amount` to one of a product's counters. Never touches the database unless an inline flush is due."""
+    window = _current_window()
+    count_key = f'{PREFIX}:{window}:{counter}:{product_id}'
+    try:
+        cache.incr(count_key, amount)
+    except ValueError:
+        if cache.add(count_key, amount, _timeout()):
+            # First count of this product in the window: register it so the flush can find it
+            slot = _incr(f'{PREFIX}:{window}:size')
+            cache.set(f'{PREFIX}:{window}:slot:{slot}', (counter, product_id), _timeout())
+        else:
+            cache.incr(count_key, amount)
+
+    if getattr(settings, 'PRODUCT_VIEW_FLUSH_ON_REQUEST', False):
+        flushed = cache.get(FLUSHED_KEY)
+        if flushed is None or flushed < window - 2:
+            flush_views()
+
+
+def record_view(product_id):
+    """Counts one view of a product."""
+    _count('views', product_id)
+
+
+def record_cart_add(product_id, quantity=1):
+    """Counts a cart add of `quantity` items of a product; feeds the popularity score."""
+    _count('cart_adds', product_id, quantity)
+
+
+def _read_window(window):
+    """Returns ({counter: Counter per product}, keys to delete) for one closed window."""
+    size = cache.get(f'{PREFIX}:{window}:size') or 0
+    slot_keys = [f'{PREFIX}:{window}:slot:{slot}' for slot in range(1, size + 1)]
+    slots = list(cache.get_many(slot_keys).values())
+    count_keys = {f'{PREFIX}:{window}:{counter}:{product_id}': (counter, product_id) for counter, product_id in slots}
+    counts = {counter: Counter() for counter in COUNTERS}
+    for key, count in cache.get_many(list(count_keys)).items():
+        counter, product_id = count_keys[key]
+        counts[counter][product_id] += count
+    return counts, [f'{PREFIX}:{window}:size', *slot_keys, *count_keys]
+
+
+def flush_views():
+    """
+    Writes the buffered counts of every closed window: views to
+    Product.view_count, views and cart adds to the daily activity.
+    Returns the number of views flushed, or None if another flush is running.
+
+    The window just before the current one is left alone as a grace period
+    for requests that computed their window right before it closed.
+    """
+    if not cache.add(LOCK_KEY, 1, _interval() * 5):
+        return None
+    try:
+        current = _current_window()
+        last_flushed = cache.get(FLUSHED_KEY)
+        first = current - RETAINED_WINDOWS if last_flushed is None else max(last_flushed + 1, current - RETAINED_WINDOWS)
+        windows = range(first, current - 1)
+        if not windows:
+            return 0
+
+        views = Counter()
+        by_day = defaultdict(lambda: {counter: Counter() for counter in COUNTERS})
+        stale_keys = []
+        for window in windows:
+            counts, keys = _read_window(window)
+            views.update(counts['views'])
+            day = by_day[timezone.localdate(datetime.fromtimestamp(window * _interval(), tz=dt_timezone.utc))]
+            for counter, per_product in counts.items():
+                day[counter].update(per_product)
+            stale_keys.extend(keys)
+
+        # One UPDATE per product; a queryset update leaves updated_at untouched
+        with transaction.atomic():
+            for product_id, count in views.items():
+                Product.objects.filter(pk=product_id).update(view_count=F('view_count') + count)
+            # Daily counts feed the time-decayed popularity score
+            for day, counts in by_day.items():
+                record_activity(day, **counts)
+
+        cache.delete_many(stale_keys)
+        cache.set(FLUSHED_KEY, windows[-1], None)
+        flushed = sum(views.values())
+        if flushed:
+            logger.info("Flushed %d product views for %d products", flushed, len(views))
+        return flushed
+    finally:
+        cache.delete(LOCK_KEY)
@@ -0,0 +1,177 @@
+# products/facets.py
+"""
+Attribute facets (Size, Color, ...) for the catalog listing and search.
+
+For every attribute value we keep the set of products that have an active,
+in-stock variant with that value, encoded as a bitmap (a Python int whose
+bit N is set when product id N is in the set). Filtering is then a handful
+of bitwise ANDs/ORs and facet badge counts are popcounts, all in memory.
+
+The index is a SharedSnapshot: workers keep it in memory, share it through
+the cache and patch it incrementally when variants or stock change.
+"""
+from django.utils.text import slugify
+
+from .models import Product, ProductVariantAttribute
+from .snapshots import SharedSnapshot
+
+# Query-string prefix of facet filters, e.g. ?attr_size=M&attr_color=Red
+PARAM_PREFIX = 'attr_'
+
+
+def _build_index():
+    values = {}
+    for variation, value, product_id in ProductVariantAttribute.objects.filter(
+        product_variant__is_active=True,
+        product_variant__stock__gt=0,
+        product_variant__product__in_stock=True,
+    ).values_list('variation__name', 'attribute_value', 'product_variant__product_id').iterator(chunk_size=2000):
+        by_value = values.setdefault(variation, {})
+        by_value[value] = by_value.get(value, 0) | (1 << product_id)
+
+    categories = {}
+    everything = 0
+    for product_id, category_id in Product.objects.filter(in_stock=True).values_list('id', 'category_id').iterator(chunk_size=2000):
+        bit = 1 << product_id
+        categories[category_id] = categories.get(category_id, 0) | bit
+        everything |= bit
+
+    return {'values': values, 'categories': categories, 'all': everything}
+
+
+_snapshot = SharedSnapshot('facets', _build_index)
+
+
+def get_index():
+    return _snapshot.get()
+
+
+def rebuild_index():
+    return _snapshot.publish(_build_index())
+
+
+def refresh_products(product_ids):
+    """Re-reads the given products from the database and patches their bits in the shared index."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    memberships = {}
+    for variation, value, product_id in ProductVariantAttribute.objects.filter(
+        product_variant__product_id__in=product_ids,
+        product_variant__is_active=True,
+        product_variant__stock__gt=0,
+        product_variant__product__in_stock=True,
+    ).values_list('variation__name', 'attribute_value', 'product_variant__product_id'):
+        memberships.setdefault(product_id, set()).add((variation, value))
+    in_stock = dict(Product.objects.filter(pk__in=product_ids, in_stock=True).values_list('id', 'category_id'))
+
+    mask = 0
+    for product_id in product_ids:
+        mask |= 1 << product_id
+
+    def apply(index):
+        values = {}
+        for variation, by_value in index['values'].items():
+            values[variation] = {value: bitmap & ~mask for value, bitmap in by_value.items() if bitmap & ~mask}
+        for product_id, pairs in memberships.items():
+            for variation, value in pairs:
+                by_value = values.setdefault(variation, {})
+                by_value[value] = by_value.get(value, 0) | (1 << product_id)
+        values = {variation: by_value for variation, by_value in values.items() if by_value}
+
+        categories = {category_id: bitmap & ~mask for category_id, bitmap in index['categories'].items()}
+        everything = index['all'] & ~mask
+        for product_id, category_id in in_stock.items():
+            bit = 1 << product_id
+            categories[category_id] = categories.get(category_id, 0) | bit
+            everything |= bit
+        return {'values': values, 'categories': categories, 'all': everything}
+
+    _snapshot.update(apply)
+
+
+def invalidate():
+    _snapshot.invalidate()
+
+
+def bitmap_to_ids(bitmap):
+    """Product ids whose bit is set, ascending."""
+    bits = bin(bitmap)[:1:-1]  # least significant bit first
+    return [position for position, bit in enumerate(bits) if bit == '1']
+
+
+def ids_to_bitmap(product_ids):
+    bitmap = 0
+    for product_id in product_ids:
+        bitmap |= 1 << product_id
+    return bitmap
+
+
+def contains(bitmap, product_id):
+    return bool(bitmap >> product_id & 1)
+
+
+def parse_filters(query_dict, index):
+    """
+    Returns {variation name: set of selected values} from ?attr_<slug>=<value>
+    parameters, ignoring anything that isn't a known variation or value.
+    """
+    by_slug = {slugify(variation): variation for variation in index['values']}
+    selected = {}
+    for key in query_dict:
+        if not key.startswith(PARAM_PREFIX):
+            continue
+        variation = by_slug.get(key[len(PARAM_PREFIX):])
+        if variation is None:
+            continue
+        values = {value for value in query_dict.getlist(key) if value in index['values'][variation]}
+        if values:
+            selected[variation] = values
+    return selected
+
+
+def matching(index, selected, base, skip=None):
+    """base AND (OR of the selected values) for every selected variation except `skip`."""
+    result = base
+    for variation, values in selected.items():
+        if variation == skip:
+            continue
+        union = 0
+        for value in values:
+            union |= index['values'][variation][value]
+        result &= union
+    return result
+
+
+def base_bitmap(index, category=None):
+    """All in-stock products, or those of one category."""
+    if category is not None:
+        return index['categories'].get(category.pk, 0)
+    return index['all']
+
+
+def facet_counts(index, selected, base):
+    """
+    Builds the facet sidebar: for each variation, every value with the number
+    of products it would match given the other active filters. Values that
+    would match nothing are left out.
+    """
+    facets = []
+    for variation in sorted(index['values']):
+        within = matching(index, selected, base, skip=variation)
+        options = []
+        for value, bitmap in sorted(index['values'][variation].items()):
+            count = (within & bitmap).bit_count()
+            if count:
+                options.append({
+                    'value': value,
+                    'count': count,
+                    'selected': value in selected.get(variation, ()),
+                })
+        if options:
+            facets.append({
+                'name': variation,
+                'param': PARAM_PREFIX + slugify(variation),
+                'options': options,
+            })
+    return facets
@@ -0,0 +1,307 @@
+# products/feeds.py
+"""
+Sitemaps and the product feed, written as gzip files under FEEDS_ROOT and
+served from FEEDS_URL like any other static file (see `manage.py build_feeds`).
+
+    sitemap.xml                     sitemap index
+    sitemap-pages.xml.gz            home page, listings and categories
+    sitemap-products-<block>.xml.gz products whose id falls in the block
+    products.xml.gz                 Google Shopping RSS feed, one item per active variant
+    products.csv.gz                 the same feed as CSV
+
+Products are split into blocks of FEED_BLOCK_SIZE consecutive ids. One
+aggregate query fingerprints every block (count, id sum, newest updated_at
+and sum of cache_version, which moves with variant, stock, review and
+category changes); only blocks whose fingerprint changed since the last
+run are regenerated. Each block streams its rows with iterator() straight
+into gzip, so memory stays flat however large the catalog is (MySQL can't
+stream, so there one block's rows are the most ever held at once).
+
+The feeds are assembled without recompressing anything: a gzip file may
+consist of several members, so a feed is a header member, the stored
+per-block members and a footer member copied one after the other.
+Attribute-only edits don't move the fingerprints; run with --full
+occasionally (e.g. nightly) to catch them.
+"""
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Floor
+from django.urls import reverse
+
+from .models import Category, Product, ProductVariant, ProductVariantAttribute
+
+# Bump when the output format changes, to force a full rebuild
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+BLOCKS_DIR = 'blocks'
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+GOOGLE_NS = 'http://base.google.com/ns/1.0'
+
+# Variation names (lowercased) that map onto Google Shopping attributes
+FEED_ATTRIBUTES = {'color': 'color', 'colour': 'color', 'size': 'size', 'material': 'material', 'pattern': 'pattern'}
+
+CSV_COLUMNS = [
+    'id', 'item_group_id', 'title', 'description', 'link', 'image_link', 'price',
+    'availability', 'product_type', 'color', 'size', 'material', 'pattern',
+]
+
+
+def _absolute(path):
+    return settings.SITE_URL.rstrip('/') + '/' + path.lstrip('/')
+
+
+def _product_url_template():
+    """The absolute product URL with a {slug} placeholder; reverse() per row is the slowest part of a build."""
+    return _absolute(reverse('products:product_detail', args=['slug-placeholder'])).replace('slug-placeholder', '{slug}')
+
+
+def _path(*parts):
+    return os.path.join(settings.FEEDS_ROOT, *parts)
+
+
+def _block_range(block):
+    size = settings.FEED_BLOCK_SIZE
+    return block * size, (block + 1) * size
+
+
+class _AtomicGzip:
+    """A text gzip file written to a temporary name and moved into place on success."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+
+    def __enter__(self):
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8', newline='')
+        return self.file
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+
+# --- Fingerprints ------------------------------------------------------------
+
+def block_fingerprints():
+    """{block: fingerprint} for every block that has products, in one aggregate query."""
+    rows = Product.objects.annotate(block=Floor(F('id') / settings.FEED_BLOCK_SIZE)).values('block').annotate(
+        count=Count('id'), id_sum=Sum('id'), updated=Max('updated_at'), versions=Sum('cache_version'),
+    ).order_by('block')
+    return {
+        # int(): MySQL returns SUM() and FLOOR() as decimals
+        int(row['block']): [row['count'], int(row['id_sum']), row['updated'].isoformat(), int(row['versions'])]
+        for row in rows
+    }
+
+
+def _load_manifest():
+    try:
+        with open(_path(MANIFEST_NAME)) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION or manifest.get('block_size') != settings.FEED_BLOCK_SIZE:
+        return None
+    return manifest
+
+
+def _save_manifest(blocks):
+    tmp_path = _path(f'{MANIFEST_NAME}.tmp')
+    with open(tmp_path, 'w') as fh:
+        json.dump({'format': FORMAT_VERSION, 'block_size': settings.FEED_BLOCK_SIZE, 'blocks': blocks}, fh)
+    os.replace(tmp_path, _path(MANIFEST_NAME))
+
+
+# --- Sitemaps ----------------------------------------------------------------
+
+def _url_entry(url, lastmod=None):
+    lastmod = f'<lastmod>{lastmod.date().isoformat()}</lastmod>' if lastmod else ''
+    return f'<url><loc>{escape(url)}</loc>{lastmod}</url>\n'
+
+
+def write_pages_sitemap():
+    with _AtomicGzip(_path('sitemap-pages.xml.gz')) as fh:
+        fh.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        fh.write(_url_entry(_absolute(reverse('home'))))
+        fh.write(_url_entry(_absolute(reverse('products:product_list_all'))))
+        for slug, updated_at in Category.objects.order_by('id').values_list('slug', 'updated_at').iterator(chunk_size=2000):
+            fh.write(_url_entry(_absolute(reverse('products:category_detail', args=[slug])), updated_at))
+        fh.write('</urlset>\n')
+
+
+def write_products_sitemap(block, chunk_size):
+    start, end = _block_range(block)
+    products = Product.objects.filter(id__gte=start, id__lt=end).order_by('id').values_list('slug', 'updated_at')
+    product_url = _product_url_template()
+    with _AtomicGzip(_path(f'sitemap-products-{block}.xml.gz')) as fh:
+        fh.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        for slug, updated_at in products.iterator(chunk_size=chunk_size):
+            fh.write(_url_entry(product_url.format(slug=slug), updated_at))
+        fh.write('</urlset>\n')
+
+
+def write_sitemap_index(blocks):
+    feeds_url = settings.FEEDS_URL.rstrip('/') + '/'
+    entries = [('sitemap-pages.xml.gz', None)]
+    entries += [(f'sitemap-products-{block}.xml.gz', fingerprint[2]) for block, fingerprint in sorted(blocks.items(), key=lambda item: int(item[0]))]
+    tmp_path = _path('sitemap.xml.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        fh.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n')
+        for name, lastmod in entries:
+            lastmod = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+            fh.write(f'<sitemap><loc>{escape(_absolute(feeds_url + name))}</loc>{lastmod}</sitemap>\n')
+        fh.write('</sitemapindex>\n')
+    os.replace(tmp_path, _path('sitemap.xml'))
+
+
+# --- Product feed ------------------------------------------------------------
+
+def _feed_items(block, chunk_size):
+    """Yields one dict per active variant of the block's products, reading attributes per chunk."""
+    start, end = _block_range(block)
+    product_url = _product_url_template()
+    variants = ProductVariant.objects.filter(
+        product_id__gte=start, product_id__lt=end, is_active=True,
+    ).order_by('id').values(
+        'id', 'sku', 'price', 'stock', 'image', 'product_id',
+        'product__name', 'product__slug', 'product__description', 'product__image', 'product__category__name',
+    ).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(variants, chunk_size))
+        if not chunk:
+            return
+        attributes = {}
+        for variant_id, name, value in ProductVariantAttribute.objects.filter(
+            product_variant_id__in=[variant['id'] for variant in chunk],
+        ).order_by('variation__name').values_list('product_variant_id', 'variation__name', 'attribute_value'):
+            attributes.setdefault(variant_id, {})[name] = value
+
+        for variant in chunk:
+            variant_attributes = attributes.get(variant['id'], {})
+            image = variant['image'] or variant['product__image']
+            item = {
+                'id': variant['sku'] or f"variant-{variant['id']}",
+                'item_group_id': str(variant['product_id']),
+                'title': ' - '.join([variant['product__name'], *variant_attributes.values()]),
+                'description': variant['product__description'] or variant['product__name'],
+                'link': product_url.format(slug=variant['product__slug']),
+                'image_link': _absolute(default_storage.url(image)) if image else '',
+                'price': f"{variant['price']} {settings.FEED_CURRENCY}",
+                'availability': 'in_stock' if variant['stock'] > 0 else 'out_of_stock',
+                'product_type': variant['product__category__name'],
+            }
+            for name, value in variant_attributes.items():
+                google_name = FEED_ATTRIBUTES.get(name.lower())
+                if google_name:
+                    item[google_name] = value
+            yield item
+
+
+def _xml_item(item):
+    fields = ''.join(
+        f'<g:{name}>{escape(item[name])}</g:{name}>'
+        for name in CSV_COLUMNS if name not in ('title', 'description', 'link') and item.get(name)
+    )
+    return (
+        f"<item><title>{escape(item['title'])}</title><link>{escape(item['link'])}</link>"
+        f"<description>{escape(item['description'])}</description>{fields}</item>\n"
+    )
+
+
+def write_feed_block(block, chunk_size):
+    """Writes the block's feed items as standalone gzip members, XML and CSV, for later concatenation."""
+    with _AtomicGzip(_path(BLOCKS_DIR, f'feed-{block}.xml.gz')) as xml_fh:
+        with _AtomicGzip(_path(BLOCKS_DIR, f'feed-{block}.csv.gz')) as csv_fh:
+            writer = csv.DictWriter(csv_fh, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            for item in _feed_items(block, chunk_size):
+                xml_fh.write(_xml_item(item))
+                writer.writerow(item)
+
+
+def _write_member(fh, text):
+    fh.write(gzip.compress(text.encode('utf-8')))
+
+
+def assemble_feeds(blocks):
+    """Concatenates header, block and footer gzip members into products.xml.gz and products.csv.gz."""
+    ordered = sorted((int(block) for block in blocks))
+    header = (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0" xmlns:g="{GOOGLE_NS}">\n<channel>\n'
+        f'<title>{escape(settings.SITE_NAME)}</title><link>{escape(_absolute("/"))}</link>'
+        f'<description>{escape(settings.SITE_NAME)} products</description>\n'
+    )
+    for extension, head, foot in (
+        ('xml', header, '</channel>\n</rss>\n'),
+        ('csv', ','.join(CSV_COLUMNS) + '\r\n', ''),
+    ):
+        tmp_path = _path(f'products.{extension}.gz.tmp')
+        with open(tmp_path, 'wb') as fh:
+            _write_member(fh, head)
+            for block in ordered:
+                with open(_path(BLOCKS_DIR, f'feed-{block}.{extension}.gz'), 'rb') as block_fh:
+                    shutil.copyfileobj(block_fh, fh)
+            if foot:
+                _write_member(fh, foot)
+        os.replace(tmp_path, _path(f'products.{extension}.gz'))
+
+
+# --- Build -------------------------------------------------------------------
+
+BLOCK_FILE_RE = re.compile(r'^(?:sitemap-products|feed)-(\d+)\.(?:xml|csv)\.gz$')
+
+
+def _remove_stale_blocks(blocks):
+    """Deletes the files of blocks that no longer have products (or came from another block size)."""
+    removed = set()
+    for directory in (_path(), _path(BLOCKS_DIR)):
+        for name in os.listdir(directory):
+            match = BLOCK_FILE_RE.match(name)
+            if match and int(match.group(1)) not in blocks:
+                os.remove(os.path.join(directory, name))
+                removed.add(int(match.group(1)))
+    return removed
+
+
+def build_feeds(full=False, chunk_size=2000, progress=None):
+    """
+    Brings the sitemaps and feeds up to date, regenerating only the blocks
+    whose products changed (all of them with `full`). Returns
+    {'rebuilt': n, 'unchanged': n, 'removed': n}.
+    """
+    os.makedirs(_path(BLOCKS_DIR), exist_ok=True)
+    manifest = None if full else _load_manifest()
+    previous = {int(block): fingerprint for block, fingerprint in (manifest or {}).get('blocks', {}).items()}
+    current = block_fingerprints()
+
+    rebuilt = 0
+    for block, fingerprint in current.items():
+        if previous.get(block) == fingerprint:
+            continue
+        write_products_sitemap(block, chunk_size)
+        write_feed_block(block, chunk_size)
+        rebuilt += 1
+        if progress:
+            progress(block)
+    removed = _remove_stale_blocks(current)
+
+    write_pages_sitemap()
+    write_sitemap_index(current)
+    assemble_feeds(current)
+    _save_manifest({str(block): fingerprint for block, fingerprint in current.items()})
+    return {'rebuilt': rebuilt, 'unchanged': len(current) - rebuilt, 'removed': len(removed)}
@@ -0,0 +1,36 @@
+# products/management/commands/build_feeds.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.feeds import build_feeds
+
+
+class Command(BaseCommand):
+    help = "Writes the sitemaps and the product feed (XML and CSV) for the products that changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="Regenerate every block, not only those whose products changed.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Rows fetched per database round trip (default: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        started = time.monotonic()
+
+        def progress(block):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Rebuilt block {block}")
+
+        stats = build_feeds(full=options['full'], chunk_size=options['chunk_size'], progress=progress)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Feeds written in {elapsed:.1f}s: {stats['rebuilt']} blocks rebuilt, "
+            f"{stats['unchanged']} unchanged, {stats['removed']} removed."
+        ))
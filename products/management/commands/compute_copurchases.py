@@ -0,0 +1,38 @@
+# products/management/commands/compute_copurchases.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.copurchase import rebuild_copurchases
+
+
+class Command(BaseCommand):
+    help = "Recomputes the \"customers also bought\" recommendations of every product from paid orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help="Order lines read per query (default: 50000). Bounds the memory used per chunk.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Products written per statement (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError("compute_copurchases needs numpy and scipy: pip install numpy scipy")
+
+        started = time.monotonic()
+        stored = rebuild_copurchases(
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            progress=lambda lines: self.stdout.write(f"{lines} order lines read", ending='\r') if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Co-purchases stored for {stored} products in {elapsed:.1f}s."))
@@ -0,0 +1,25 @@
+# products/management/commands/compute_popularity.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.popularity import update_popularity
+from search import autocomplete
+
+
+class Command(BaseCommand):
+    help = "Recomputes the time-decayed popularity score of every product from recent views, cart adds and sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Products updated per statement (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        scored = update_popularity(batch_size=options['batch_size'])
+        # Suggestions are ranked by popularity; this also picks up newly frequent search queries
+        autocomplete.rebuild_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Popularity computed for {scored} products in {elapsed:.1f}s."))
@@ -0,0 +1,32 @@
+# products/management/commands/export_catalog.py
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.catalog_io import FORMATS, export_rows, guess_format, write_rows
+
+
+class Command(BaseCommand):
+    help = "Exports every product and variant to a CSV or JSONL catalog file that import_catalog can read back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file (default: standard output).")
+        parser.add_argument('--format', choices=FORMATS, help="File format (default: guessed from the extension, csv for stdout).")
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Products read per query (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else guess_format(path))
+        started = time.monotonic()
+        rows = export_rows(chunk_size=max(1, options['chunk_size']))
+        if path == '-':
+            write_rows(rows, sys.stdout, fmt)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as fh:
+            written = write_rows(rows, fh, fmt)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} rows to {path} in {elapsed:.1f}s."))
@@ -0,0 +1,33 @@
+# products/management/commands/flush_product_views.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.counters import buffer_is_shared, flush_views
+
+
+class Command(BaseCommand):
+    help = "Writes buffered product views and cart adds to the database in batched updates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running and flush every PRODUCT_VIEW_FLUSH_INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        if not buffer_is_shared():
+            raise CommandError(
+                "The default cache is per process (LocMemCache), so this command can't see the views buffered "
+                "by the web processes. Use a shared cache, or set PRODUCT_VIEW_FLUSH_ON_REQUEST."
+            )
+        while True:
+            flushed = flush_views()
+            if flushed is None:
+                self.stdout.write("Another flush is in progress; skipping.")
+            elif flushed or options['verbosity'] > 1:
+                self.stdout.write(f"Flushed {flushed} product views.")
+            if not options['loop']:
+                break
+            time.sleep(settings.PRODUCT_VIEW_FLUSH_INTERVAL)
@@ -0,0 +1,101 @@
+# products/management/commands/import_catalog.py
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_io import FORMATS, CatalogFormatError, finish_import, guess_format, import_chunk, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports products and variants from a CSV or JSONL catalog file, matching on product slug and "
+        "variant sku. Rows are written in chunked transactions and an interrupted import resumes from "
+        "its checkpoint file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file to import.")
+        parser.add_argument('--format', choices=FORMATS, help="File format (default: guessed from the extension).")
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Rows written per transaction (default: 1000).",
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help="Checkpoint file recording progress (default: <path>.checkpoint).",
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help="Ignore an existing checkpoint and import the whole file again.",
+        )
+
+    def _load_checkpoint(self, checkpoint_path, source):
+        try:
+            with open(checkpoint_path) as fh:
+                checkpoint = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            raise CommandError(f"Unreadable checkpoint {checkpoint_path}; remove it or pass --restart.")
+        if checkpoint.get('source') != source:
+            raise CommandError(f"{checkpoint_path} belongs to another import; remove it or pass --restart.")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint_path, checkpoint):
+        # Write-then-rename, so a crash never leaves a half-written checkpoint
+        temporary_path = f'{checkpoint_path}.tmp'
+        with open(temporary_path, 'w') as fh:
+            json.dump(checkpoint, fh)
+        os.replace(temporary_path, checkpoint_path)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        chunk_size = max(1, options['chunk_size'])
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        source = {'path': os.path.abspath(path), 'size': os.path.getsize(path)}
+
+        checkpoint = None if options['restart'] else self._load_checkpoint(checkpoint_path, source)
+        if checkpoint is None:
+            checkpoint = {'source': source, 'rows': 0, 'category_ids': []}
+        elif checkpoint['rows']:
+            self.stdout.write(f"Resuming after row {checkpoint['rows']}.")
+        category_ids = set(checkpoint['category_ids'])
+
+        started = time.monotonic()
+        imported = 0
+        chunk = []
+
+        def write_chunk():
+            nonlocal imported
+            _, chunk_category_ids = import_chunk(chunk)
+            imported += len(chunk)
+            category_ids.update(chunk_category_ids)
+            checkpoint['rows'] += len(chunk)
+            checkpoint['category_ids'] = sorted(category_ids)
+            self._save_checkpoint(checkpoint_path, checkpoint)
+            rate = imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"Imported {checkpoint['rows']} rows ({rate:.0f} rows/s)...")
+            chunk.clear()
+
+        try:
+            with open(path, newline='', encoding='utf-8') as fh:
+                for position, (line, row) in enumerate(read_rows(fh, fmt)):
+                    if position < checkpoint['rows']:
+                        continue
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        write_chunk()
+                if chunk:
+                    write_chunk()
+        except (CatalogFormatError, ValueError) as exc:
+            raise CommandError(f"Import stopped after row {checkpoint['rows']}: {exc}")
+
+        finish_import(category_ids)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} rows from {path} in {elapsed:.1f}s."))
+        self.stdout.write(f"Queued related products of {len(category_ids)} categories for `rebuild_related_products --stale`.")
@@ -0,0 +1,40 @@
+# products/management/commands/rebuild_related_products.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.related import rebuild_all, rebuild_stale
+
+
+class Command(BaseCommand):
+    help = "Recomputes the precomputed related-products lists for every category, or only the queued ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale', action='store_true',
+            help="Only rebuild categories queued by price, stock and category changes.",
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="With --stale: keep running and rebuild queued categories every --interval seconds.",
+        )
+        parser.add_argument(
+            '--interval', type=int, default=60,
+            help="Seconds between passes with --loop (default: 60).",
+        )
+
+    def handle(self, *args, **options):
+        if not options['stale']:
+            total = rebuild_all(progress=lambda done: self.stdout.write(f"Rebuilt {done} categories...") if options['verbosity'] > 1 else None)
+            self.stdout.write(self.style.SUCCESS(f"Related products rebuilt for {total} categories."))
+            return
+
+        while True:
+            started = time.monotonic()
+            total = rebuild_stale()
+            if total or options['verbosity'] > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(self.style.SUCCESS(f"Related products rebuilt for {total} queued categories in {elapsed:.1f}s."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
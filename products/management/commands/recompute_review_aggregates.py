@@ -0,0 +1,26 @@
+# products/management/commands/recompute_review_aggregates.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.models import recompute_review_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored review count, average and star histogram of products from their reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'product_ids', nargs='*', type=int,
+            help="Only recompute these products (default: all products).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of products updated per batch (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = recompute_review_aggregates(options['product_ids'] or None, batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Review aggregates recomputed for {total} products in {elapsed:.1f}s."))
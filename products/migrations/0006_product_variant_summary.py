@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+def backfill_variant_summary(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    rows = ProductVariant.objects.filter(is_active=True).values('product_id').annotate(
+        min_price=models.Min('price'),
+        max_price=models.Max('price'),
+        total_stock=models.Sum('stock'),
+        in_stock_count=models.Count('id', filter=models.Q(stock__gt=0)),
+        active_variant_count=models.Count('id'),
+    ).order_by()
+    for row in rows:
+        Product.objects.filter(pk=row['product_id']).update(
+            min_price=row['min_price'],
+            max_price=row['max_price'],
+            total_stock=row['total_stock'] or 0,
+            in_stock=row['in_stock_count'] > 0,
+            active_variant_count=row['active_variant_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='active_variant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_variant_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_variant_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'name', 'id'], name='products_pr_in_stoc_336156_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'in_stock', 'name', 'id'], name='products_pr_categor_391aa9_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProducts',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related_candidates', serialize=False, to='products.product')),
+                ('candidate_ids', models.JSONField(default=list, help_text='Ranked ids of related products.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'related products',
+                'verbose_name_plural': 'related products',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_relatedproducts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
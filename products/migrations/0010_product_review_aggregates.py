@@ -0,0 +1,78 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:12
+
+from django.db import migrations, models
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    rows = Review.objects.values('product_id').annotate(
+        review_count=models.Count('id'),
+        rating_sum=models.Sum('rating'),
+        rating_1_count=models.Count('id', filter=models.Q(rating=1)),
+        rating_2_count=models.Count('id', filter=models.Q(rating=2)),
+        rating_3_count=models.Count('id', filter=models.Q(rating=3)),
+        rating_4_count=models.Count('id', filter=models.Q(rating=4)),
+        rating_5_count=models.Count('id', filter=models.Q(rating=5)),
+    ).order_by()
+    for row in rows:
+        product_id = row.pop('product_id')
+        Product.objects.filter(pk=product_id).update(
+            rating_avg=round(row['rating_sum'] / row['review_count'], 2),
+            **row,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'rating_avg', 'review_count', 'id'], name='products_pr_in_stoc_5950e4_idx'),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
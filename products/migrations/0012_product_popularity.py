@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_review_pagination_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('cart_adds', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'product activity',
+                'verbose_name_plural': 'product activity',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'popularity', 'id'], name='products_pr_in_stoc_0d6269_idx'),
+        ),
+        migrations.AddField(
+            model_name='productactivity',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='products.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productactivity',
+            index=models.Index(fields=['day'], name='products_pr_day_81562e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productactivity',
+            unique_together={('product', 'day')},
+        ),
+    ]
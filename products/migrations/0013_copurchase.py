@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='co_purchases', serialize=False, to='products.product')),
+                ('neighbor_ids', models.JSONField(default=list, help_text='Ranked ids of products bought together with this one.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'co-purchase',
+                'verbose_name_plural': 'co-purchases',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_copurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleRelatedCategory',
+            fields=[
+                ('category_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'stale related-products category',
+                'verbose_name_plural': 'stale related-products categories',
+            },
+        ),
+    ]
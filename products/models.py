@@ -1,5 +1,8 @@
 # products/models.py
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models.functions import Cast, Round
 from django.urls import reverse  # Used for get_absolute_url later for SEO
 from django.utils.text import slugify  # For creating slugs from names
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -57,10 +60,45 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     view_count = models.PositiveIntegerField(default=0)  # New field to track views
 
+    # Denormalized summary of the product's variants, kept in sync by the
+    # ProductVariant signals in products/signals.py (see refresh_variant_summary).
+    # Listing pages and the admin read these instead of aggregating per row.
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, db_index=True, editable=False)
+    active_variant_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Review aggregates, maintained incrementally by the Review signals in
+    # products/signals.py (see apply_review_changes) so pages never aggregate reviews
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Time-decayed blend of recent views, cart adds and sales, recomputed
+    # periodically by `manage.py compute_popularity` (see products/popularity.py)
+    popularity = models.FloatField(default=0, editable=False)
+
+    # Bumped whenever anything shown on the product card changes; part of the
+    # card fragment cache key (see products/card_cache.py)
+    cache_version = models.PositiveIntegerField(default=1, editable=False)
+
     class Meta:
         ordering = ('name',)
         indexes = [
             models.Index(fields=['id', 'slug']),
+            # Keyset pagination of the in-stock listing, overall and per category
+            models.Index(fields=['in_stock', 'name', 'id']),
+            models.Index(fields=['category', 'in_stock', 'name', 'id']),
+            # ... and sorted by rating
+            models.Index(fields=['in_stock', 'rating_avg', 'review_count', 'id']),
+            # ... and by popularity (also the homepage "popular" block)
+            models.Index(fields=['in_stock', 'popularity', 'id']),
         ]
 
     def __str__(self):
@@ -69,9 +107,23 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('products:product_detail', kwargs={'slug': self.slug})
 
+    # Columns kept up to date by queryset updates (F() increments, bulk refreshes), never by
+    # editing a product. Saving an instance loaded before one of those updates would write
+    # the old values back, so saves of existing products leave them out.
+    MAINTAINED_FIELDS = frozenset([
+        'view_count', 'min_price', 'max_price', 'total_stock', 'in_stock', 'active_variant_count',
+        'review_count', 'rating_sum', 'rating_avg', 'rating_1_count', 'rating_2_count', 'rating_3_count',
+        'rating_4_count', 'rating_5_count', 'popularity', 'cache_version',
+    ])
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def get_min_variant_price(self):
@@ -92,6 +144,26 @@ class Product(models.Model):
     def is_available(self):
         return self.variants.filter(is_active=True, stock__gt=0).exists()
 
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent of reviews)] from 5 stars down to 1."""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            histogram.append((stars, count, round(count * 100 / self.review_count) if self.review_count else 0))
+        return histogram
+
+    def refresh_variant_summary(self):
+        """
+        Recomputes the denormalized price/stock summary from the active variants
+        with a single aggregate query and writes it back with a queryset update,
+        so updated_at is left alone. Returns the new values.
+        """
+        summary = refresh_variant_summaries([self.pk]).get(self.pk, EMPTY_VARIANT_SUMMARY)
+        for field, value in summary.items():
+            setattr(self, field, value)
+        return summary
+
 
 class Variation(models.Model):
     name = models.CharField(max_length=50, unique=True, help_text="e.g., Size, Color, Material")
@@ -161,8 +233,204 @@ class Review(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a product's reviews, newest first
+            models.Index(fields=['product', 'created_at', 'id']),
+        ]
         verbose_name = 'review'
         verbose_name_plural = 'reviews'
 
     def __str__(self):
-        return f"{self.user.username}'s review for {self.product.name} ({self.rating} stars)"
\ No newline at end of file
+        return f"{self.user.username}'s review for {self.product.name} ({self.rating} stars)"
+
+
+class RelatedProducts(models.Model):
+    """
+    Precomputed "related products" candidates for a product: other in-stock
+    products of the same category, best match first. Maintained by
+    products/related.py so the detail page needs a single primary-key lookup.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='related_candidates')
+    candidate_ids = models.JSONField(default=list, help_text="Ranked ids of related products.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'related products'
+        verbose_name_plural = 'related products'
+
+    def __str__(self):
+        return f"Related products for product {self.product_id}"
+
+
+class StaleRelatedCategory(models.Model):
+    """
+    A category whose related-products lists need rebuilding, queued by
+    products/related.py. A plain id rather than a foreign key, so queueing
+    never conflicts with the category being deleted.
+    """
+    category_id = models.PositiveIntegerField(primary_key=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'stale related-products category'
+        verbose_name_plural = 'stale related-products categories'
+
+    def __str__(self):
+        return f"Related products of category {self.category_id} to rebuild"
+
+
+class CoPurchase(models.Model):
+    """
+    Products most often bought together with a product, best first.
+    Recomputed offline from paid orders by products/copurchase.py.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='co_purchases')
+    neighbor_ids = models.JSONField(default=list, help_text="Ranked ids of products bought together with this one.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'co-purchase'
+        verbose_name_plural = 'co-purchases'
+
+    def __str__(self):
+        return f"Co-purchases of product {self.product_id}"
+
+
+class ProductActivity(models.Model):
+    """
+    Per-product, per-day counts of the signals that feed Product.popularity.
+    Views arrive from the buffered view flush, cart adds from the cart.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='activity')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    cart_adds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+        verbose_name = 'product activity'
+        verbose_name_plural = 'product activity'
+
+    def __str__(self):
+        return f"Activity of product {self.product_id} on {self.day}"
+
+
+EMPTY_VARIANT_SUMMARY = {
+    'min_price': None,
+    'max_price': None,
+    'total_stock': 0,
+    'in_stock': False,
+    'active_variant_count': 0,
+}
+
+
+def refresh_variant_summaries(product_ids):
+    """
+    Recomputes the variant summary for several products at once: one grouped
+    aggregate over ProductVariant plus one UPDATE per product.
+    Returns a dict of {product_id: summary}.
+    """
+    product_ids = set(product_ids)
+    summaries = {pk: dict(EMPTY_VARIANT_SUMMARY) for pk in product_ids}
+    rows = ProductVariant.objects.filter(
+        product_id__in=product_ids, is_active=True
+    ).values('product_id').annotate(
+        min_price=models.Min('price'),
+        max_price=models.Max('price'),
+        total_stock=models.Sum('stock'),
+        in_stock_count=models.Count('id', filter=models.Q(stock__gt=0)),
+        active_variant_count=models.Count('id'),
+    ).order_by()
+
+    for row in rows:
+        summaries[row['product_id']] = {
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+            'total_stock': row['total_stock'] or 0,
+            'in_stock': row['in_stock_count'] > 0,
+            'active_variant_count': row['active_variant_count'],
+        }
+
+    for pk, summary in summaries.items():
+        Product.objects.filter(pk=pk).update(**summary)
+    return summaries
+
+
+def bump_cache_versions(product_ids):
+    """Invalidates the cached fragments of the given products with one UPDATE (updated_at is untouched)."""
+    product_ids = set(product_ids)
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).update(cache_version=models.F('cache_version') + 1)
+
+
+RATING_FIELDS = ['review_count', 'rating_sum', 'rating_avg'] + [f'rating_{stars}_count' for stars in range(1, 6)]
+
+
+def _refresh_rating_averages(product_ids):
+    Product.objects.filter(pk__in=product_ids).update(rating_avg=models.Case(
+        models.When(review_count=0, then=models.Value(0)),
+        default=Round(Cast('rating_sum', models.FloatField()) / models.F('review_count'), 2),
+        output_field=models.FloatField(),
+    ))
+
+
+def apply_review_changes(changes):
+    """
+    Applies review additions and removals to the stored aggregates.
+    `changes` is an iterable of (product_id, rating, +1 or -1); editing a
+    review is the removal of its old rating plus the addition of the new one.
+    Counters move with F() increments, so concurrent reviews don't overwrite
+    each other, and the average is recomputed from them in a second UPDATE.
+    """
+    deltas = {}
+    for product_id, rating, sign in changes:
+        delta = deltas.setdefault(product_id, {'review_count': 0, 'rating_sum': 0})
+        delta['review_count'] += sign
+        delta['rating_sum'] += sign * rating
+        field = f'rating_{rating}_count'
+        delta[field] = delta.get(field, 0) + sign
+
+    with transaction.atomic():
+        for product_id, delta in deltas.items():
+            updates = {field: models.F(field) + value for field, value in delta.items() if value}
+            if updates:
+                Product.objects.filter(pk=product_id).update(**updates)
+        _refresh_rating_averages(deltas)
+
+
+def recompute_review_aggregates(product_ids=None, batch_size=500):
+    """
+    Recomputes the review aggregates from the reviews table, for the given
+    products or for every product. Returns the number of products updated.
+    """
+    products = Product.objects.order_by('pk')
+    if product_ids is not None:
+        products = products.filter(pk__in=set(product_ids))
+
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk).only('pk')[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        rows = {
+            row['product_id']: row
+            for row in Review.objects.filter(product_id__in=[product.pk for product in batch]).values('product_id').annotate(
+                review_count=models.Count('id'),
+                rating_sum=models.Sum('rating'),
+                **{f'rating_{stars}_count': models.Count('id', filter=models.Q(rating=stars)) for stars in range(1, 6)},
+            ).order_by()
+        }
+        for product in batch:
+            row = rows.get(product.pk, {})
+            for field in RATING_FIELDS:
+                setattr(product, field, row.get(field, 0))
+            product.rating_avg = round(Decimal(product.rating_sum) / product.review_count, 2) if product.review_count else 0
+        with transaction.atomic():
+            Product.objects.bulk_update(batch, RATING_FIELDS)
+            bump_cache_versions([product.pk for product in batch])
+        updated += len(batch)
@@ -0,0 +1,207 @@
+# products/pagination.py
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its first and last
+row. The next page is "rows strictly after the last key" and the previous
+page is "rows strictly before the first key", so every page is a single
+index range scan of `page_size + 1` rows no matter how deep it is.
+"""
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Rows read at a time when a page is filtered in Python
+KEEP_BATCH_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps full microsecond precision on datetimes, which DjangoJSONEncoder truncates to milliseconds."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction=NEXT):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (values, direction) from a cursor string, raising InvalidCursor if it's garbage."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = data['v'], data['d']
+    except (ValueError, TypeError, KeyError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+def _split(ordering):
+    """('-rating_avg', 'id') -> [('rating_avg', True), ('id', False)]"""
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def _reverse(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def _key_of(item, fields):
+    if isinstance(item, dict):
+        return [item[name] for name, _ in fields]
+    return [getattr(item, name) for name, _ in fields]
+
+
+def _cursor_values(model, fields, values):
+    """
+    The cursor's values converted by their model fields. A cursor is client
+    input, so a well-formed one may still carry values of the wrong type.
+    """
+    if len(values) != len(fields):
+        raise InvalidCursor(values)
+    try:
+        values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+    except (ValidationError, ValueError, TypeError) as exc:
+        raise InvalidCursor(values) from exc
+    if None in values:
+        raise InvalidCursor(values)
+    return values
+
+
+def _beyond(model, fields, values, forward):
+    """
+    Builds the row-value comparison "(f1, f2, ...) > (v1, v2, ...)" (or < when
+    going backwards), honouring the direction of each ordering field.
+    """
+    values = _cursor_values(model, fields, values)
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        after = (not descending) if forward else descending
+        clause = Q(**{f'{name}__gt' if after else f'{name}__lt': values[i]})
+        for j, (prev_name, _) in enumerate(fields[:i]):
+            clause &= Q(**{prev_name: values[j]})
+        condition |= clause
+    return condition
+
+
+class KeysetPage:
+    """One page of results plus the cursors to reach its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _take(queryset, ordering, count, keep=None):
+    """
+    The first `count` rows of `queryset` in `ordering`. With `keep`, rows it
+    rejects are skipped, reading on along the same keyset a batch at a time.
+    """
+    if keep is None:
+        return list(queryset.order_by(*ordering)[:count])
+    fields = _split(ordering)
+    batch_size = max(count * 4, KEEP_BATCH_SIZE)
+    rows = []
+    batch = queryset.order_by(*ordering)
+    while True:
+        chunk = list(batch[:batch_size])
+        rows.extend(row for row in chunk if keep(row))
+        if len(rows) >= count or len(chunk) < batch_size:
+            return rows[:count]
+        batch = queryset.filter(_beyond(queryset.model, fields, _key_of(chunk[-1], fields), forward=True)).order_by(*ordering)
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=None, keep=None):
+    """
+    Returns a KeysetPage of `queryset` ordered by `ordering`, which must end
+    with a unique field (e.g. ('name', 'id')) so that keys are total. Rows
+    failing `keep`, a predicate applied in Python, are left out.
+    An unreadable cursor raises InvalidCursor.
+    """
+    page_size = page_size or settings.PRODUCTS_PAGE_SIZE
+    fields = _split(ordering)
+
+    if not cursor:
+        rows = _take(queryset, ordering, page_size + 1, keep)
+        next_cursor = encode_cursor(_key_of(rows[page_size - 1], fields)) if len(rows) > page_size else None
+        return KeysetPage(rows[:page_size], next_cursor=next_cursor)
+
+    values, direction = decode_cursor(cursor)
+    if direction == NEXT:
+        rows = _take(queryset.filter(_beyond(queryset.model, fields, values, forward=True)), ordering, page_size + 1, keep)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(_key_of(rows[-1], fields)) if has_more else None
+        previous_cursor = encode_cursor(_key_of(rows[0], fields), PREVIOUS) if rows else None
+    else:
+        rows = _take(queryset.filter(_beyond(queryset.model, fields, values, forward=False)), _reverse(ordering), page_size + 1, keep)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        previous_cursor = encode_cursor(_key_of(rows[0], fields), PREVIOUS) if has_more else None
+        next_cursor = encode_cursor(_key_of(rows[-1], fields)) if rows else None
+    return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def get_page_size(request, default=None, maximum=None):
+    """Reads ?page_size= from the request, clamped to [1, PRODUCTS_MAX_PAGE_SIZE]."""
+    default = default or settings.PRODUCTS_PAGE_SIZE
+    maximum = maximum or settings.PRODUCTS_MAX_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def page_querystring(request, cursor):
+    """The current query string with `cursor` swapped in, for next/previous links."""
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return params.urlencode()
+
+
+def sort_querystring(request, sort):
+    """The current query string re-sorted by `sort`, starting again from the first page."""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params['sort'] = sort
+    return params.urlencode()
@@ -0,0 +1,102 @@
+# products/popularity.py
+"""
+Time-decayed product popularity.
+
+Views and cart adds are buffered in the cache (products/counters.py) and
+flushed into per-product, per-day ProductActivity rows; sales come from paid OrderItems. A periodic batch job
+(`manage.py compute_popularity`) blends them into Product.popularity:
+
+    popularity = sum over days of weight * count * 0.5 ** (age in days / half-life)
+
+so a best-seller from last season fades out instead of staying on top
+forever. Only the last POPULARITY_WINDOW_DAYS are read; older activity has
+decayed to practically nothing. Listings then read the top N straight off
+the (in_stock, popularity, id) index.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ecomstore.page_cache import bump_catalog_version
+
+from .models import Product, ProductActivity
+
+# Orders whose items count as sales
+PAID_ORDER_STATUSES = ('submitted', 'processed')
+
+
+def record_activity(day, views=None, cart_adds=None):
+    """
+    Adds counts to the day's activity rows; `views` and `cart_adds` map
+    product ids to increments. One UPDATE per product, plus an INSERT for
+    products without a row for that day yet.
+    """
+    increments = defaultdict(dict)
+    for field, counts in (('views', views), ('cart_adds', cart_adds)):
+        for product_id, count in (counts or {}).items():
+            if count:
+                increments[product_id][field] = count
+
+    for product_id, fields in increments.items():
+        updates = {field: F(field) + count for field, count in fields.items()}
+        if ProductActivity.objects.filter(product_id=product_id, day=day).update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                ProductActivity.objects.create(product_id=product_id, day=day, **fields)
+        except IntegrityError:
+            # Someone created the row in the meantime
+            ProductActivity.objects.filter(product_id=product_id, day=day).update(**updates)
+
+
+def compute_scores(now=None):
+    """Returns {product_id: popularity} from the activity and sales in the window."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    since = today - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+    weights = settings.POPULARITY_WEIGHTS
+    decay = math.log(2) / settings.POPULARITY_HALF_LIFE_DAYS
+
+    def weight_of(day):
+        return math.exp(-decay * max((today - day).days, 0))
+
+    scores = defaultdict(float)
+    for product_id, day, views, cart_adds in ProductActivity.objects.filter(day__gt=since).values_list(
+        'product_id', 'day', 'views', 'cart_adds',
+    ).iterator(chunk_size=5000):
+        scores[product_id] += (weights['view'] * views + weights['cart_add'] * cart_adds) * weight_of(day)
+
+    # Imported here: checkout depends on products, not the other way round
+    from checkout.models import OrderItem
+    sales = OrderItem.objects.filter(
+        product__isnull=False,
+        order__status__in=PAID_ORDER_STATUSES,
+        order__created_at__gt=now - timedelta(days=settings.POPULARITY_WINDOW_DAYS),
+    ).annotate(day=TruncDate('order__created_at')).values('product_id', 'day').annotate(quantity=Sum('quantity')).order_by()
+    for row in sales.iterator(chunk_size=5000):
+        scores[row['product_id']] += weights['sale'] * row['quantity'] * weight_of(row['day'])
+    return scores
+
+
+def update_popularity(batch_size=1000):
+    """
+    Recomputes and stores every product's popularity. Products that dropped
+    out of the window are reset to zero. Returns the number of products scored.
+    """
+    scores = compute_scores()
+    stale_ids = set(Product.objects.filter(popularity__gt=0).values_list('pk', flat=True)) - set(scores)
+
+    products = [Product(pk=pk, popularity=round(score, 4)) for pk, score in scores.items()]
+    products += [Product(pk=pk, popularity=0) for pk in stale_ids]
+    # bulk_update leaves updated_at alone, and rows of deleted products simply match nothing
+    with transaction.atomic():
+        Product.objects.bulk_update(products, ['popularity'], batch_size=batch_size)
+    # Popular blocks and sort orders changed: re-render cached pages and revalidate ETags
+    bump_catalog_version()
+    return len(scores)
@@ -0,0 +1,138 @@
+# products/related.py
+"""
+Precomputed related products.
+
+For every product we store a ranked list of same-category, in-stock
+candidates (closest price first, more viewed products winning ties).
+A change to a product's price, availability or category queues its
+category in StaleRelatedCategory, in the same transaction. The queued
+categories are rebuilt off the request path by
+`manage.py rebuild_related_products --stale` (run it with --loop as a
+worker, or from cron every few minutes); the plain command rebuilds every
+category. At request time we read the stored list with one primary-key
+lookup and show a random rotation of it, so the block still varies without
+ORDER BY RAND(). The rotation changes every ROTATION_SECONDS rather than on
+every view, so a repeat visit within it can be answered with a 304
+(product_detail's ETag includes current_rotation()).
+"""
+import bisect
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from ecomstore.upserts import bulk_upsert
+
+from .models import Product, RelatedProducts, StaleRelatedCategory
+
+# Candidates stored per product; RELATED_PRODUCTS_SHOWN of them are shown
+CANDIDATES = 20
+# How long one rotation of the related products is shown
+ROTATION_SECONDS = 60 * 10
+
+
+def _rank_candidates(product_id, price, pool, prices, limit):
+    """
+    Picks up to `limit` products from `pool` (in-stock products sorted by
+    price, with `prices` their prices in the same order) whose price is
+    closest to `price`, expanding outwards from where `price` would sit in
+    the pool.
+    """
+    low = bisect.bisect_left(prices, price)
+    left, right = low - 1, low
+    picked = []
+    while len(picked) < limit and (left >= 0 or right < len(pool)):
+        if right >= len(pool):
+            take_left = True
+        elif left < 0:
+            take_left = False
+        else:
+            left_gap = price - pool[left][1]
+            right_gap = pool[right][1] - price
+            take_left = left_gap < right_gap or (left_gap == right_gap and pool[left][2] >= pool[right][2])
+        if take_left:
+            candidate = pool[left]
+            left -= 1
+        else:
+            candidate = pool[right]
+            right += 1
+        if candidate[0] != product_id:
+            picked.append(candidate[0])
+    return picked
+
+
+def rebuild_categories(category_ids):
+    """Recomputes the related-product lists of every product in the given categories."""
+    for category_id in set(category_ids):
+        rows = list(Product.objects.filter(category_id=category_id).values_list(
+            'id', 'min_price', 'view_count', 'in_stock',
+        ))
+        pool = sorted(
+            ((pk, min_price or Decimal('0'), view_count) for pk, min_price, view_count, in_stock in rows if in_stock),
+            key=lambda entry: (entry[1], -entry[2], entry[0]),
+        )
+        prices = [entry[1] for entry in pool]
+        bulk_upsert(
+            RelatedProducts,
+            [
+                RelatedProducts(product_id=pk, candidate_ids=_rank_candidates(pk, min_price or Decimal('0'), pool, prices, CANDIDATES))
+                for pk, min_price, view_count, in_stock in rows
+            ],
+            unique_fields=['product'],
+            update_fields=['candidate_ids', 'updated_at'],
+            batch_size=500,
+        )
+
+
+def rebuild_all(progress=None):
+    category_ids = Product.objects.order_by().values_list('category_id', flat=True).distinct()
+    done = 0
+    for category_id in category_ids:
+        rebuild_categories([category_id])
+        done += 1
+        if progress:
+            progress(done)
+    return done
+
+
+def schedule_rebuild(*category_ids):
+    """Queues categories' lists for the next rebuild_stale(); rolled back along with the current transaction."""
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    if category_ids:
+        StaleRelatedCategory.objects.bulk_create(
+            [StaleRelatedCategory(category_id=category_id) for category_id in category_ids], ignore_conflicts=True,
+        )
+
+
+def rebuild_stale():
+    """Rebuilds the categories queued by schedule_rebuild(). Returns how many there were."""
+    category_ids = list(StaleRelatedCategory.objects.values_list('category_id', flat=True))
+    if category_ids:
+        # Dequeued before the catalog is read, so a change committed meanwhile queues its category again
+        StaleRelatedCategory.objects.filter(category_id__in=category_ids).delete()
+        rebuild_categories(category_ids)
+    return len(category_ids)
+
+
+def current_rotation():
+    """The number of the rotation in effect now."""
+    return int(time.time() // ROTATION_SECONDS)
+
+
+def pick_related(product, rotation=None, count=None):
+    """
+    Returns up to `count` in-stock related products: a random rotation of the
+    stored candidate list, the same one throughout `rotation` (by default the
+    current one), fetched with one lookup plus one query for the products.
+    """
+    count = count or settings.RELATED_PRODUCTS_SHOWN
+    if rotation is None:
+        rotation = current_rotation()
+    candidate_ids = RelatedProducts.objects.filter(product=product).values_list('candidate_ids', flat=True).first()
+    if not candidate_ids:
+        return []
+    start = random.Random(f'{product.pk}:{rotation}').randrange(len(candidate_ids))
+    picked = (candidate_ids[start:] + candidate_ids[:start])[:count]
+    products = Product.objects.filter(pk__in=picked, in_stock=True).in_bulk()
+    return [products[pk] for pk in picked if pk in products]
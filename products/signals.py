@@ -0,0 +1,147 @@
+# products/signals.py
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from ecomstore.page_cache import bump_catalog_version
+
+from . import facets, related, variant_matrix
+from .models import (
+    Category, Product, ProductVariant, ProductVariantAttribute, Review, Variation,
+    apply_review_changes, bump_cache_versions, refresh_variant_summaries,
+)
+
+
+def _refresh_facets_on_commit(product_id):
+    transaction.on_commit(lambda: facets.refresh_products([product_id]))
+
+
+def _invalidate_variant_matrix_on_commit(product_ids):
+    transaction.on_commit(lambda: variant_matrix.invalidate(product_ids))
+
+
+def _bump_catalog_version_on_commit():
+    # Cached catalog pages (ecomstore/page_cache.py) go stale with any catalog or stock change
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_product_summary(sender, instance, **kwargs):
+    """Keeps the denormalized price/stock summary on Product in sync with its variants."""
+    before = Product.objects.filter(pk=instance.product_id).values('category_id', 'in_stock', 'min_price').first()
+    after = refresh_variant_summaries([instance.product_id])[instance.product_id]
+    bump_cache_versions([instance.product_id])
+    _refresh_facets_on_commit(instance.product_id)
+    _bump_catalog_version_on_commit()
+    _invalidate_variant_matrix_on_commit([instance.product_id])
+
+    # Related-product lists only depend on availability and price
+    if before and (before['in_stock'], before['min_price']) != (after['in_stock'], after['min_price']):
+        related.schedule_rebuild(before['category_id'])
+
+
+@receiver(post_save, sender=ProductVariantAttribute)
+@receiver(post_delete, sender=ProductVariantAttribute)
+def refresh_attribute_facets(sender, instance, **kwargs):
+    product_id = ProductVariant.objects.filter(pk=instance.product_variant_id).values_list('product_id', flat=True).first()
+    if product_id:
+        _refresh_facets_on_commit(product_id)
+        _invalidate_variant_matrix_on_commit([product_id])
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    instance._previous_category_id = (
+        Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_product_facets(sender, instance, **kwargs):
+    # The product may have moved category or disappeared altogether
+    _refresh_facets_on_commit(instance.pk)
+    _bump_catalog_version_on_commit()
+
+
+@receiver(post_save, sender=Product)
+def queue_related_on_category_change(sender, instance, created, **kwargs):
+    # Price and availability changes come from the variants (refresh_product_summary);
+    # a new product has no variants yet
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if not created and previous_category_id != instance.category_id:
+        related.schedule_rebuild(previous_category_id, instance.category_id)
+
+
+@receiver(post_delete, sender=Product)
+def queue_related_on_delete(sender, instance, **kwargs):
+    # Out-of-stock products aren't anyone's candidates
+    if instance.in_stock:
+        related.schedule_rebuild(instance.category_id)
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def invalidate_facets(sender, instance, **kwargs):
+    transaction.on_commit(facets.invalidate)
+
+
+@receiver(post_save, sender=Variation)
+def invalidate_variation_matrices(sender, instance, created, **kwargs):
+    # Variation names are baked into the cached variant matrices
+    if not created:
+        product_ids = set(ProductVariantAttribute.objects.filter(variation=instance).values_list(
+            'product_variant__product_id', flat=True,
+        ))
+        _invalidate_variant_matrix_on_commit(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def bump_product_cache_version(sender, instance, created, **kwargs):
+    # A new product has no cached fragments yet
+    if not created:
+        bump_cache_versions([instance.pk])
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+def add_review_to_aggregates(sender, instance, **kwargs):
+    changes = [(instance.product_id, instance.rating, 1)]
+    previous = getattr(instance, '_previous_rating', None)
+    if previous:
+        if previous == (instance.product_id, instance.rating):
+            return
+        changes.append((*previous, -1))
+    apply_review_changes(changes)
+    bump_cache_versions({product_id for product_id, rating, sign in changes})
+    _bump_catalog_version_on_commit()
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    apply_review_changes([(instance.product_id, instance.rating, -1)])
+    bump_cache_versions([instance.product_id])
+    _bump_catalog_version_on_commit()
+
+
+@receiver(post_save, sender=Category)
+def bump_category_cache_versions(sender, instance, created, **kwargs):
+    # Cards show the category name
+    if not created:
+        Product.objects.filter(category=instance).update(cache_version=F('cache_version') + 1)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    _bump_catalog_version_on_commit()
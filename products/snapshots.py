@@ -0,0 +1,150 @@
+# products/snapshots.py
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class SharedSnapshot:
+    """
+    An in-memory structure derived from the database (facet bitmaps, prefix
+    index, ...) that every worker keeps locally and shares through the cache.
+
+    Readers only fetch a tiny version key per call and re-load the value
+    from the cache when another worker has published a new version. The
+    database is touched only when neither the cache nor the worker has a copy.
+    Writers apply incremental updates under a short cache lock; if the lock
+    can't be taken the snapshot is invalidated and rebuilt on the next read.
+
+    Snapshots built with `apply_delta` can also be patched with small deltas
+    (see patch()): the cache then holds a full copy plus the deltas published
+    since, and a worker that is behind applies only the deltas it missed to
+    its own copy. Every COMPACT_AFTER deltas a full copy is published again.
+    """
+    LOCK_TIMEOUT = 10
+    LOCK_WAIT = 2.0
+    COMPACT_AFTER = 100
+
+    def __init__(self, name, build, apply_delta=None):
+        self.name = name
+        self.build = build
+        self.apply_delta = apply_delta
+        self.version_key = f'snapshot:{name}:version'
+        self.data_key = f'snapshot:{name}:data'
+        self.lock_key = f'snapshot:{name}:lock'
+        # (id of the full copy, number of deltas applied on top of it)
+        self._version = None
+        self._value = None
+        self._local_lock = threading.Lock()
+
+    def _delta_key(self, base, sequence):
+        return f'snapshot:{self.name}:delta:{base}:{sequence}'
+
+    def _load(self, version):
+        """
+        Brings this worker's copy up to the published `version`, applying
+        only the deltas it missed when it can. Returns the value, or None if
+        the cache no longer has what it takes. Call with the local lock held.
+        """
+        base, sequence = version
+        if self._version is not None and self._version[0] == base and self._version[1] <= sequence:
+            value, applied = self._value, self._version[1]
+        else:
+            stored = cache.get(self.data_key)
+            if stored is None or stored[0] != base:
+                return None
+            value, applied = stored[1], 0
+        if applied < sequence:
+            keys = [self._delta_key(base, number) for number in range(applied + 1, sequence + 1)]
+            deltas = cache.get_many(keys)
+            if len(deltas) < len(keys):
+                return None
+            for key in keys:
+                self.apply_delta(value, deltas[key])
+        self._version, self._value = version, value
+        return value
+
+    def get(self):
+        version = cache.get(self.version_key)
+        if version is not None and version == self._version:
+            return self._value
+        with self._local_lock:
+            if version is not None:
+                value = self._load(version)
+                if value is not None:
+                    return value
+            return self.publish(self.build())
+
+    def peek(self):
+        """
+        Like get(), but never builds: returns the published value, the
+        worker's last known (possibly stale) value, or None.
+        """
+        version = cache.get(self.version_key)
+        if version is None or version == self._version:
+            return self._value
+        with self._local_lock:
+            value = self._load(version)
+        return self._value if value is None else value
+
+    def publish(self, value):
+        if self._version is not None:
+            base, sequence = self._version
+            cache.delete_many([self._delta_key(base, number) for number in range(1, sequence + 1)])
+        version = (uuid.uuid4().hex, 0)
+        cache.set(self.data_key, (version[0], value), None)
+        cache.set(self.version_key, version, None)
+        self._version, self._value = version, value
+        return value
+
+    def _locked(self):
+        """Takes the cache lock for a write; invalidates the snapshot and returns False if it can't."""
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not cache.add(self.lock_key, 1, self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                self.invalidate()
+                return False
+            time.sleep(0.02)
+        return True
+
+    def update(self, apply):
+        """
+        Applies `apply(value) -> new_value` to the current snapshot and
+        publishes the result. `apply` must not mutate its argument in place,
+        since other threads may be reading it.
+        """
+        if not self._locked():
+            return
+        try:
+            self.publish(apply(self.get()))
+        finally:
+            cache.delete(self.lock_key)
+
+    def patch(self, delta):
+        """
+        Applies `delta` to the current snapshot with `apply_delta(value, delta)`,
+        in place, and publishes just the delta. `apply_delta` must leave the
+        value readable by other threads at every step.
+        """
+        if not self._locked():
+            return
+        try:
+            value = self.get()
+            with self._local_lock:
+                self.apply_delta(value, delta)
+                base, sequence = self._version
+                if sequence >= self.COMPACT_AFTER:
+                    self.publish(value)
+                    return
+                version = (base, sequence + 1)
+                # The delta goes first, so whoever sees the new version can find it
+                cache.set(self._delta_key(*version), delta, None)
+                cache.set(self.version_key, version, None)
+                self._version = version
+        finally:
+            cache.delete(self.lock_key)
+
+    def invalidate(self):
+        cache.delete_many([self.version_key, self.data_key])
+        self._version = self._value = None
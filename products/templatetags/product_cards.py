@@ -0,0 +1,15 @@
+# products/templatetags/product_cards.py
+from django import template
+
+from ..card_cache import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """
+    {% product_cards products as cards %} gives [(product, card html)], with
+    the cards served from the fragment cache (see products/card_cache.py).
+    """
+    return render_cards(products, context.get('request'))
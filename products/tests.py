@@ -1,3 +1,1036 @@
-from django.test import TestCase
+# products/tests.py
+import csv
+import gzip
+import io
+from datetime import timedelta
+import json
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.http import QueryDict
+from django.middleware.csrf import _does_token_match
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from checkout.models import Order, OrderItem
+from ecomstore.page_cache import get_catalog_version
+from search import engine as search_engine
+
+from . import card_cache, copurchase, counters, facets, feeds, popularity, related, variant_matrix
+from .management.commands import import_catalog
+from .models import (
+    Category, CoPurchase, Product, ProductActivity, ProductVariant, ProductVariantAttribute, RelatedProducts, Review,
+    StaleRelatedCategory, Variation,
+)
+from .pagination import InvalidCursor, NEXT, PREVIOUS, encode_cursor, paginate_keyset
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        # Pairs of equal names, so pages have to break ties on the id
+        cls.products = [
+            Product.objects.create(category=cls.category, name=f'Product {number // 2}', slug=f'product-{number}')
+            for number in range(7)
+        ]
+
+    def _walk(self, ordering, page_size):
+        """Pages forwards to the end, then backwards to the start, returning both id sequences."""
+        queryset = Product.objects.all()
+        page = paginate_keyset(queryset, ordering, page_size=page_size)
+        forward = [product.pk for product in page]
+        while page.has_next:
+            page = paginate_keyset(queryset, ordering, page.next_cursor, page_size)
+            forward += [product.pk for product in page]
+        backward = [product.pk for product in page]
+        while page.has_previous:
+            page = paginate_keyset(queryset, ordering, page.previous_cursor, page_size)
+            backward = [product.pk for product in page] + backward
+        return forward, backward
+
+    def test_pages_forwards_and_backwards_across_ties(self):
+        expected = [product.pk for product in self.products]
+        self.assertEqual(self._walk(('name', 'id'), 2), (expected, expected))
+        self.assertEqual(self._walk(('name', 'id'), 3), (expected, expected))
+
+    def test_descending_ordering(self):
+        expected = [product.pk for product in sorted(self.products, key=lambda product: (product.name, product.pk), reverse=True)]
+        self.assertEqual(self._walk(('-name', '-id'), 2), (expected, expected))
+
+    def test_each_page_is_one_query(self):
+        page = paginate_keyset(Product.objects.all(), ('name', 'id'), page_size=3)
+        with self.assertNumQueries(1):
+            page = paginate_keyset(Product.objects.all(), ('name', 'id'), page.next_cursor, 3)
+        self.assertEqual(len(page), 3)
+        self.assertTrue(page.has_next and page.has_previous)
+
+    def test_garbage_cursors_are_invalid(self):
+        cursors = [
+            'not a cursor',
+            encode_cursor(['Product 1']),
+            encode_cursor(['Product 1', 'abc']),
+            encode_cursor(['Product 1', None]),
+            encode_cursor(['Product 1', [1]], PREVIOUS),
+            encode_cursor({'name': 'Product 1'}),
+            encode_cursor(['Product 1', 1], 'x'),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginate_keyset(Product.objects.all(), ('name', 'id'), cursor, 2)
+
+    def test_datetime_cursor_round_trips(self):
+        product = self.products[3]
+        page = paginate_keyset(
+            Product.objects.all(), ('-created_at', '-id'), encode_cursor([product.created_at, product.pk], NEXT), 10,
+        )
+        self.assertEqual([item.pk for item in page], [item.pk for item in reversed(self.products[:3])])
+
+
+class ProductListPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.create(category=category, name='Runner', slug='runner', in_stock=True)
+
+    def test_garbage_cursor_is_not_found(self):
+        client = Client(SERVER_NAME='localhost')
+        for cursor in ['garbage', encode_cursor(['x', 'abc']), encode_cursor([1.5, {}])]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(client.get('/products/products/', {'cursor': cursor}).status_code, 404)
+
+
+class ConditionalPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner = Product.objects.create(category=cls.category, name='Runner', slug='runner')
+        cls.variant = ProductVariant.objects.create(product=cls.runner, sku='RUN-40', price=10, stock=5)
+        cls.boot = Product.objects.create(category=cls.category, name='Boot', slug='boot')
+        ProductVariant.objects.create(product=cls.boot, sku='BOOT-40', price=30, stock=5)
+        cls.user = User.objects.create_user('ada', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(SERVER_NAME='localhost')
+        self.client.force_login(self.user)
+        # The ETag covers the CSRF cookie, which the first page sets
+        self.client.get('/products/products/')
+
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_repeat_visit_is_not_modified(self):
+        etag = self.get('/products/runner/').headers['ETag']
+        # Session and user, then the one validator lookup
+        with self.assertNumQueries(3):
+            response = self.get('/products/runner/', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_listing_revalidates_without_a_catalog_query(self):
+        etag = self.get('/products/products/').headers['ETag']
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get('/products/products/', etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.runner.description = 'Lighter'
+            self.runner.save()
+        self.assertEqual(self.get('/products/products/', etag).status_code, 200)
+
+    def test_reviews_stock_and_edits_change_the_page(self):
+        def stock():
+            self.variant.stock = 0
+            self.variant.save()
+
+        def edit():
+            self.runner.description = 'Lighter'
+            self.runner.save()
+
+        for change in [lambda: Review.objects.create(product=self.runner, user=self.user, rating=4), stock, edit]:
+            etag = self.get('/products/runner/').headers['ETag']
+            self.assertEqual(self.get('/products/runner/', etag).status_code, 304)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertEqual(self.get('/products/runner/', etag).status_code, 200)
+
+    def test_recently_viewed_is_part_of_the_page(self):
+        etag = self.get('/products/runner/').headers['ETag']
+        self.get('/products/boot/')
+        response = self.get('/products/runner/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({product.pk for product in response.context['recently_viewed_products']}, {self.runner.pk, self.boot.pk})
+        self.assertEqual(self.client.session['recently_viewed'], [self.boot.pk, self.runner.pk])
+
+    def test_related_rotation_is_part_of_the_page(self):
+        etag = self.get('/products/runner/').headers['ETag']
+        with mock.patch('products.related.current_rotation', return_value=related.current_rotation() + 1):
+            self.assertEqual(self.get('/products/runner/', etag).status_code, 200)
+
+
+class MaintainedFieldTests(TestCase):
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='Runner', slug='runner')
+        stale = Product.objects.get(pk=product.pk)
+        ProductVariant.objects.create(product=product, sku='RUN-40', price=10, stock=3)
+        Review.objects.create(product=product, user=User.objects.create_user('ada'), rating=4)
+        Product.objects.filter(pk=product.pk).update(popularity=2.5, view_count=7)
+
+        stale.name = 'Road Runner'
+        stale.save()
+        product.refresh_from_db()
+        self.assertEqual(
+            (product.name, product.in_stock, product.min_price, product.review_count, product.rating_avg, product.popularity, product.view_count),
+            ('Road Runner', True, 10, 1, 4, 2.5, 7),
+        )
+        # Bumped by the variant, the review and the save itself; never written back
+        self.assertEqual(product.cache_version, stale.cache_version + 3)
+
+
+class RelatedProductsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        cls.bags = Category.objects.create(name='Bags', slug='bags')
+        cls.products = {}
+        for price in (10, 20, 30, 45):
+            product = Product.objects.create(category=cls.shoes, name=f'Shoe {price}', slug=f'shoe-{price}')
+            ProductVariant.objects.create(product=product, sku=f'SHOE-{price}', price=price, stock=2)
+            cls.products[price] = product
+        cls.sold_out = Product.objects.create(category=cls.shoes, name='Sold out', slug='sold-out')
+        related.rebuild_categories([cls.shoes.pk])
+
+    def setUp(self):
+        StaleRelatedCategory.objects.all().delete()
+
+    def candidates(self, product):
+        return RelatedProducts.objects.get(product=product).candidate_ids
+
+    def test_closest_prices_first(self):
+        self.assertEqual(self.candidates(self.products[30]), [self.products[p].pk for p in (20, 45, 10)])
+        self.assertEqual(self.candidates(self.products[10]), [self.products[p].pk for p in (20, 30, 45)])
+        # Out-of-stock products get a list but are nobody's candidate
+        self.assertEqual(self.candidates(self.sold_out), [self.products[p].pk for p in (10, 20, 30, 45)])
+
+    def test_only_price_stock_and_category_changes_queue_a_rebuild(self):
+        product = self.products[20]
+        product.description = 'Now in suede'
+        product.save()
+        self.assertFalse(StaleRelatedCategory.objects.exists())
+
+        variant = product.variants.get()
+        variant.price = 50
+        variant.save()
+        self.assertEqual(list(StaleRelatedCategory.objects.values_list('category_id', flat=True)), [self.shoes.pk])
+
+        StaleRelatedCategory.objects.all().delete()
+        product.category = self.bags
+        product.save()
+        self.assertEqual(set(StaleRelatedCategory.objects.values_list('category_id', flat=True)), {self.shoes.pk, self.bags.pk})
+
+    def test_queued_categories_are_rebuilt_off_the_request_path(self):
+        variant = self.products[10].variants.get()
+        variant.stock = 0
+        variant.save()
+        # Nothing is recomputed until the worker runs
+        self.assertIn(self.products[10].pk, self.candidates(self.products[20]))
+        self.assertEqual(related.rebuild_stale(), 1)
+        self.assertNotIn(self.products[10].pk, self.candidates(self.products[20]))
+        self.assertEqual(related.rebuild_stale(), 0)
+
+    def test_rolled_back_changes_queue_nothing(self):
+        with transaction.atomic():
+            variant = self.products[10].variants.get()
+            variant.stock = 0
+            variant.save()
+            transaction.set_rollback(True)
+        self.assertFalse(StaleRelatedCategory.objects.exists())
+
+    def test_pick_related_is_two_queries(self):
+        with self.assertNumQueries(2):
+            picked = related.pick_related(self.products[20], rotation=0, count=2)
+        self.assertEqual(len(picked), 2)
+        self.assertEqual(picked, related.pick_related(self.products[20], rotation=0, count=2))
+
+
+class VariantSummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner = Product.objects.create(category=cls.category, name='Runner', slug='runner')
+
+    def summary(self):
+        self.runner.refresh_from_db()
+        return (self.runner.min_price, self.runner.max_price, self.runner.total_stock, self.runner.in_stock, self.runner.active_variant_count)
+
+    def test_variant_changes_refresh_the_summary(self):
+        self.assertEqual(self.summary(), (None, None, 0, False, 0))
+        small = ProductVariant.objects.create(product=self.runner, sku='RUN-40', price=10, stock=0)
+        self.assertEqual(self.summary(), (10, 10, 0, False, 1))
+        large = ProductVariant.objects.create(product=self.runner, sku='RUN-44', price=14, stock=3)
+        self.assertEqual(self.summary(), (10, 14, 3, True, 2))
+        large.stock = 0
+        large.save()
+        self.assertEqual(self.summary(), (10, 14, 0, False, 2))
+        # Inactive variants don't count
+        small.stock, small.is_active = 5, False
+        small.save()
+        self.assertEqual(self.summary(), (14, 14, 0, False, 1))
+        large.delete()
+        self.assertEqual(self.summary(), (None, None, 0, False, 0))
+
+    def _queries(self, url, client):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(url).status_code, 200)
+        return len(queries)
+
+    def _add_products(self, count):
+        for number in range(count):
+            product = Product.objects.create(category=self.category, name=f'Shoe {number}', slug=f'shoe-{Product.objects.count()}')
+            ProductVariant.objects.create(product=product, sku=f'SKU-{product.pk}-1', price=10 + number, stock=2)
+            ProductVariant.objects.create(product=product, sku=f'SKU-{product.pk}-2', price=20 + number, stock=0)
+
+    def test_listing_queries_dont_grow_with_the_page(self):
+        client = Client(SERVER_NAME='localhost')
+        self._add_products(2)
+        few = self._queries('/products/products/', client)
+        self._add_products(10)
+        self.assertEqual(self._queries('/products/products/', client), few)
+        self.assertContains(client.get('/products/products/'), 'Shoe 9')
+
+    def test_admin_changelist_queries_dont_grow_with_the_page(self):
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(User.objects.create_superuser('admin', password='secret'))
+        self._add_products(2)
+        few = self._queries('/admin/products/product/', client)
+        self._add_products(10)
+        self.assertEqual(self._queries('/admin/products/product/', client), few)
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Tops', slug='tops')
+        size = Variation.objects.create(name='Size')
+        color = Variation.objects.create(name='Color')
+
+        def product(name, *variants):
+            product = Product.objects.create(category=cls.category, name=name, slug=name.lower())
+            for number, (size_value, color_value, stock) in enumerate(variants):
+                variant = ProductVariant.objects.create(product=product, sku=f'{name}-{number}', price=10, stock=stock)
+                ProductVariantAttribute.objects.create(product_variant=variant, variation=size, attribute_value=size_value)
+                ProductVariantAttribute.objects.create(product_variant=variant, variation=color, attribute_value=color_value)
+            return product
+
+        cls.tee = product('Tee', ('S', 'Red', 2), ('M', 'Blue', 2))
+        cls.hoodie = product('Hoodie', ('M', 'Red', 1))
+        cls.socks = product('Socks', ('L', 'Blue', 0))
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, index, selected):
+        base = facets.base_bitmap(index)
+        return {
+            facet['name']: {option['value']: option['count'] for option in facet['options']}
+            for facet in facets.facet_counts(index, selected, base)
+        }
+
+    def test_filters_and_counts(self):
+        index = facets.get_index()
+        selected = facets.parse_filters(QueryDict('attr_size=M&attr_size=XXL&attr_color=Red&attr_fit=slim'), index)
+        self.assertEqual(selected, {'Size': {'M'}, 'Color': {'Red'}})
+        self.assertEqual(facets.bitmap_to_ids(facets.matching(index, selected, facets.base_bitmap(index))), [self.tee.pk, self.hoodie.pk])
+        # Each facet counts the products it would match given the other facets' filters; out-of-stock values are left out
+        self.assertEqual(self.counts(index, {'Size': {'S'}}), {'Size': {'S': 1, 'M': 2}, 'Color': {'Red': 1, 'Blue': 1}})
+
+    def test_stock_and_variant_changes_patch_the_index(self):
+        facets.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.filter(product=self.socks).update(stock=5)
+            self.socks.variants.get().save()
+            hoodie = self.hoodie.variants.get()
+            hoodie.is_active = False
+            hoodie.save()
+        index = facets.get_index()
+        self.assertEqual(self.counts(index, {}), {'Size': {'S': 1, 'M': 1, 'L': 1}, 'Color': {'Red': 1, 'Blue': 2}})
+        self.assertEqual(index, facets._build_index())
+
+    def test_filtered_listing_costs_no_extra_queries(self):
+        client = Client(SERVER_NAME='localhost')
+        facets.get_index()
+        with CaptureQueriesContext(connection) as unfiltered:
+            client.get('/products/products/')
+        with CaptureQueriesContext(connection) as filtered:
+            response = client.get('/products/products/', {'attr_color': 'Red', 'attr_size': 'M'})
+        self.assertEqual(len(filtered), len(unfiltered))
+        self.assertEqual({product.pk for product in response.context['products']}, {self.tee.pk, self.hoodie.pk})
+
+    def test_broad_filters_are_applied_to_the_rows_read(self):
+        client = Client(SERVER_NAME='localhost')
+        pages = []
+        query = {'attr_color': 'Red', 'page_size': 1}
+        with mock.patch('products.views.FACET_ID_LIST_LIMIT', 1), mock.patch('products.pagination.KEEP_BATCH_SIZE', 1):
+            with CaptureQueriesContext(connection) as queries:
+                while True:
+                    page = client.get('/products/products/', query).context['page']
+                    pages.append([product.pk for product in page])
+                    if not page.has_next:
+                        break
+                    query['cursor'] = page.next_cursor
+            previous = client.get('/products/products/', {**query, 'cursor': page.previous_cursor}).context['page']
+        self.assertEqual(pages, [[self.hoodie.pk], [self.tee.pk]])
+        self.assertEqual([product.pk for product in previous], [self.hoodie.pk])
+        self.assertFalse([query for query in queries if '"products_product"."id" IN' in query['sql']])
+
+    @override_settings(SEARCH_RESULTS_LIMIT=1)
+    def test_search_facets_cover_every_hit(self):
+        search_engine.rebuild_index()
+        response = Client(SERVER_NAME='localhost').get('/products/search/', {'q': 'tops', 'attr_size': 'S'})
+        self.assertEqual(response.context['products'], [self.tee])
+        counts = {facet['name']: {option['value']: option['count'] for option in facet['options']} for facet in response.context['facets']}
+        self.assertEqual(counts, {'Size': {'S': 1, 'M': 2}, 'Color': {'Red': 1, 'Blue': 1}})
+
+
+@override_settings(PRODUCT_VIEW_FLUSH_ON_REQUEST=False)
+class ViewCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner = Product.objects.create(category=category, name='Runner', slug='runner')
+        cls.boot = Product.objects.create(category=category, name='Boot', slug='boot')
+
+    def setUp(self):
+        cache.clear()
+        self.window = counters._current_window()
+
+    def at(self, window):
+        return mock.patch.object(counters, '_current_window', return_value=window)
+
+    def activity(self):
+        return set(ProductActivity.objects.values_list('product_id', 'views', 'cart_adds'))
+
+    def test_counts_are_buffered_then_flushed_in_one_update_per_product(self):
+        updated_at = self.runner.updated_at
+        with self.at(self.window), self.assertNumQueries(0):
+            for _ in range(3):
+                counters.record_view(self.runner.pk)
+            counters.record_cart_add(self.runner.pk, 2)
+            counters.record_view(self.boot.pk)
+
+        with self.at(self.window + 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counters.flush_views(), 4)
+        product_updates = [query for query in queries if query['sql'].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(product_updates), 2)
+        self.runner.refresh_from_db()
+        self.assertEqual((self.runner.view_count, self.runner.updated_at), (3, updated_at))
+        self.assertEqual(self.activity(), {(self.runner.pk, 3, 2), (self.boot.pk, 1, 0)})
+
+        # Flushed windows are gone
+        with self.at(self.window + 3):
+            self.assertEqual(counters.flush_views(), 0)
+        self.assertEqual(Product.objects.get(pk=self.runner.pk).view_count, 3)
+
+    def test_flush_command_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'PRODUCT_VIEW_FLUSH_ON_REQUEST'):
+            call_command('flush_product_views', stdout=io.StringIO())
+        with mock.patch('products.management.commands.flush_product_views.buffer_is_shared', return_value=True):
+            with self.at(self.window):
+                counters.record_view(self.runner.pk)
+            with self.at(self.window + 2):
+                call_command('flush_product_views', stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(pk=self.runner.pk).view_count, 1)
+
+    def test_the_last_closed_window_is_left_for_late_writers(self):
+        with self.at(self.window):
+            counters.record_view(self.runner.pk)
+        with self.at(self.window + 1):
+            self.assertEqual(counters.flush_views(), 0)
+            counters.record_view(self.runner.pk)
+        with self.at(self.window + 3):
+            self.assertEqual(counters.flush_views(), 2)
+
+    def test_one_flush_at_a_time(self):
+        with self.at(self.window):
+            counters.record_view(self.runner.pk)
+        cache.add(counters.LOCK_KEY, 1)
+        with self.at(self.window + 2):
+            self.assertIsNone(counters.flush_views())
+            cache.delete(counters.LOCK_KEY)
+            self.assertEqual(counters.flush_views(), 1)
+
+
+class VariantMatrixTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        cls.tee = Product.objects.create(category=category, name='Tee', slug='tee')
+        cls.size = Variation.objects.create(name='Size')
+        cls.color = Variation.objects.create(name='Color')
+        cls.variants = []
+        for size, color, price in [('M', 'Red', 10), ('L', 'Red', 12), ('M', 'Blue', 11)]:
+            variant = ProductVariant.objects.create(product=cls.tee, sku=f'TEE-{size}-{color}', price=price, stock=3)
+            ProductVariantAttribute.objects.create(product_variant=variant, variation=cls.size, attribute_value=size)
+            ProductVariantAttribute.objects.create(product_variant=variant, variation=cls.color, attribute_value=color)
+            cls.variants.append(variant)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matrix_is_two_queries_then_cached(self):
+        with self.assertNumQueries(2):
+            matrix = variant_matrix.get_variant_matrix(self.tee.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(variant_matrix.get_variant_matrix(self.tee.pk), matrix)
+        self.assertEqual(matrix['variation_options'], {'Color': ['Blue', 'Red'], 'Size': ['L', 'M']})
+        self.assertEqual(matrix['payload'], {
+            'combinations': {
+                'Color=Red|Size=M': {'id': self.variants[0].pk, 'price': '10.00', 'stock': 3},
+                'Color=Red|Size=L': {'id': self.variants[1].pk, 'price': '12.00', 'stock': 3},
+                'Color=Blue|Size=M': {'id': self.variants[2].pk, 'price': '11.00', 'stock': 3},
+            },
+            'default': 'Color=Red|Size=M',
+        })
+
+    def test_variant_attribute_and_variation_changes_invalidate_it(self):
+        def stock():
+            variant = self.variants[2]
+            variant.stock = 0
+            variant.save()
+
+        def attribute():
+            attribute = ProductVariantAttribute.objects.get(product_variant=self.variants[1], variation=self.size)
+            attribute.attribute_value = 'XL'
+            attribute.save()
+
+        def rename():
+            self.color.name = 'Colour'
+            self.color.save()
+
+        for change in [stock, attribute, rename]:
+            variant_matrix.get_variant_matrix(self.tee.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            with self.assertNumQueries(2):
+                matrix = variant_matrix.get_variant_matrix(self.tee.pk)
+        self.assertEqual(matrix['variation_options'], {'Colour': ['Blue', 'Red'], 'Size': ['M', 'XL']})
+        self.assertEqual(matrix['payload']['combinations']['Colour=Blue|Size=M']['stock'], 0)
+
+    def test_product_page_embeds_the_payload(self):
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(User.objects.create_user('ada'))
+        response = client.get('/products/tee/')
+        self.assertContains(response, '<script id="variant-data" type="application/json">')
+        self.assertContains(response, '"Color=Blue|Size=M": {"id": %d' % self.variants[2].pk)
+
+    def test_product_page_queries_dont_grow_with_the_variants(self):
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(User.objects.create_user('ada'))
+
+        def queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                client.get('/products/tee/')
+            return len(captured)
+
+        # The first visit also saves the recently viewed list in the session
+        client.get('/products/tee/')
+        few = queries()
+        for size in ['S', 'XL', 'XXL']:
+            variant = ProductVariant.objects.create(product=self.tee, sku=f'TEE-{size}', price=9, stock=1)
+            ProductVariantAttribute.objects.create(product_variant=variant, variation=self.size, attribute_value=size)
+        self.assertEqual(queries(), few)
+
+
+class CardCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.products = []
+        for name in ['Runner', 'Boot', 'Sandal']:
+            product = Product.objects.create(category=cls.category, name=name, slug=name.lower())
+            ProductVariant.objects.create(product=product, sku=f'SKU-{name}', price=10, stock=2)
+            cls.products.append(product)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        """Renders the cards of fresh instances; returns the names of the products whose card was rendered."""
+        products = list(Product.objects.filter(pk__in=[product.pk for product in self.products]).order_by('pk'))
+        with mock.patch.object(card_cache, 'render_to_string', wraps=card_cache.render_to_string) as render:
+            cards = card_cache.render_cards(products)
+        self.assertEqual([product.pk for product, html in cards], [product.pk for product in self.products])
+        return {call.args[1]['product'].name for call in render.call_args_list}
+
+    def test_a_page_of_cards_is_one_multi_get(self):
+        self.assertEqual(self.render(), {'Runner', 'Boot', 'Sandal'})
+        products = list(Product.objects.order_by('pk'))
+        with mock.patch.object(card_cache, 'cache', wraps=cache) as spy, self.assertNumQueries(0):
+            card_cache.render_cards(products)
+        spy.get_many.assert_called_once()
+        spy.set_many.assert_not_called()
+
+    def test_product_variant_review_and_category_changes_move_the_card(self):
+        runner, boot, sandal = self.products
+        self.render()
+
+        runner.description = 'Lighter'
+        runner.save()
+        self.assertEqual(self.render(), {'Runner'})
+
+        variant = boot.variants.get()
+        variant.stock = 0
+        variant.save()
+        self.assertEqual(self.render(), {'Boot'})
+
+        review = Review.objects.create(product=sandal, user=User.objects.create_user('ada'), rating=5)
+        self.assertEqual(self.render(), {'Sandal'})
+        review.delete()
+        self.assertEqual(self.render(), {'Sandal'})
+
+        self.category.name = 'Footwear'
+        self.category.save()
+        self.assertEqual(self.render(), {'Runner', 'Boot', 'Sandal'})
+
+    def test_each_visitor_gets_their_own_csrf_token(self):
+        first, second = RequestFactory().get('/'), RequestFactory().get('/')
+        card_cache.render_cards(self.products[:1], first)
+        [(product, html)] = card_cache.render_cards(self.products[:1], second)
+        self.assertNotIn(card_cache.CSRF_PLACEHOLDER, html)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html).group(1)
+        self.assertTrue(_does_token_match(token, second.META['CSRF_COOKIE']))
+
+
+class ReviewAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner = Product.objects.create(category=category, name='Runner', slug='runner', in_stock=True)
+        cls.boot = Product.objects.create(category=category, name='Boot', slug='boot', in_stock=True)
+        cls.users = [User.objects.create_user(f'user{number}') for number in range(4)]
+
+    def aggregates(self, product):
+        product.refresh_from_db()
+        return (
+            product.review_count, product.rating_sum, product.rating_avg,
+            [getattr(product, f'rating_{stars}_count') for stars in range(1, 6)],
+        )
+
+    def test_creates_edits_and_deletes_keep_the_aggregates(self):
+        reviews = [Review.objects.create(product=self.runner, user=user, rating=rating) for user, rating in zip(self.users, [5, 4, 4, 1])]
+        self.assertEqual(self.aggregates(self.runner), (4, 14, 3.5, [1, 0, 0, 2, 1]))
+
+        reviews[3].rating = 3
+        reviews[3].save()
+        self.assertEqual(self.aggregates(self.runner), (4, 16, 4.0, [0, 0, 1, 2, 1]))
+        # Moving a review to another product moves its rating too
+        reviews[0].product = self.boot
+        reviews[0].save()
+        self.assertEqual(self.aggregates(self.boot), (1, 5, 5.0, [0, 0, 0, 0, 1]))
+        reviews[1].delete()
+        self.assertEqual(self.aggregates(self.runner), (2, 7, 3.5, [0, 0, 1, 1, 0]))
+
+        with transaction.atomic():
+            Review.objects.create(product=self.runner, user=self.users[0], rating=1)
+            transaction.set_rollback(True)
+        self.assertEqual(self.aggregates(self.runner), (2, 7, 3.5, [0, 0, 1, 1, 0]))
+
+    def test_recompute_command_repairs_the_aggregates(self):
+        for user, rating in zip(self.users, [5, 2, 2]):
+            Review.objects.create(product=self.runner, user=user, rating=rating)
+        expected = self.aggregates(self.runner)
+        Product.objects.update(review_count=9, rating_sum=1, rating_avg=0.1, rating_2_count=0)
+        call_command('recompute_review_aggregates', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.aggregates(self.runner), expected)
+        self.assertEqual(self.aggregates(self.boot), (0, 0, 0, [0, 0, 0, 0, 0]))
+
+    def test_rating_sort_never_reads_the_reviews(self):
+        Review.objects.create(product=self.boot, user=self.users[0], rating=5)
+        Review.objects.create(product=self.runner, user=self.users[1], rating=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = Client(SERVER_NAME='localhost').get('/products/products/', {'sort': 'rating'})
+        self.assertEqual([product.pk for product in response.context['products']], [self.boot.pk, self.runner.pk])
+        self.assertFalse([query for query in queries if 'products_review' in query['sql']])
+
+
+@override_settings(REVIEWS_PAGE_SIZE=2)
+class ReviewPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner = Product.objects.create(category=category, name='Runner', slug='runner')
+        cls.reviews = [
+            Review.objects.create(product=cls.runner, user=User.objects.create_user(f'reviewer{number}'), rating=4, comment=f'Comment {number}')
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        self.client = Client(SERVER_NAME='localhost')
+        self.client.force_login(self.reviews[0].user)
+
+    def test_page_carries_the_first_reviews_and_scrolling_loads_the_rest(self):
+        response = self.client.get('/products/runner/')
+        newest_first = [review.pk for review in reversed(self.reviews)]
+        self.assertEqual([review.pk for review in response.context['reviews']], newest_first[:2])
+
+        page = response.context['reviews_page']
+        url = f'/products/runner/reviews/?cursor={page.next_cursor}'
+        comments = []
+        while url:
+            # The session (for the replica routing), the product id, then the reviews with their authors in one query
+            with self.assertNumQueries(3):
+                data = self.client.get(url).json()
+            comments += re.findall(r'Comment \d', data['html'])
+            url = data['next_url']
+        self.assertEqual(comments, ['Comment 2', 'Comment 1', 'Comment 0'])
+
+    def test_unknown_products_and_garbage_cursors_are_not_found(self):
+        self.assertEqual(self.client.get('/products/nothing/reviews/').status_code, 404)
+        self.assertEqual(self.client.get('/products/runner/reviews/', {'cursor': 'garbage'}).status_code, 404)
+
+
+class CatalogImportExportTests(TestCase):
+
+    CSV = (
+        'product_slug,product_name,description,category_slug,category_name,sku,price,stock,is_active,attributes\n'
+        'tee,Tee,Cotton,tops,Tops,TEE-M,10.00,3,1,Size=M;Color=Red\n'
+        'tee,Tee,Cotton,tops,Tops,TEE-L,12.00,0,1,Size=L;Color=Red\n'
+        'hoodie,Hoodie,,tops,Tops,HOOD-M,30.00,2,1,Size=M\n'
+        'cap,Cap,,hats,Hats,,,,,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        return path
+
+    def run_command(self, name, *args, **options):
+        stdout = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(name, *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def catalog(self):
+        return {
+            (sku, product, price, stock, tuple(sorted(ProductVariantAttribute.objects.filter(product_variant__sku=sku).values_list('variation__name', 'attribute_value'))))
+            for sku, product, price, stock in ProductVariant.objects.values_list('sku', 'product__slug', 'price', 'stock')
+        }
+
+    def test_import_upserts_without_model_signals(self):
+        saves = []
+        post_save.connect(lambda sender, **kwargs: saves.append(sender), weak=False, dispatch_uid='import_test')
+        self.addCleanup(post_save.disconnect, dispatch_uid='import_test')
+        self.run_command('import_catalog', self.write('catalog.csv', self.CSV), chunk_size=2)
+        self.assertEqual(saves, [])
+
+        self.assertEqual(self.catalog(), {
+            ('TEE-M', 'tee', 10, 3, (('Color', 'Red'), ('Size', 'M'))),
+            ('TEE-L', 'tee', 12, 0, (('Color', 'Red'), ('Size', 'L'))),
+            ('HOOD-M', 'hoodie', 30, 2, (('Size', 'M'),)),
+        })
+        self.assertEqual(set(Product.objects.values_list('slug', 'category__slug')), {('tee', 'tops'), ('hoodie', 'tops'), ('cap', 'hats')})
+        # The derived data the signals would have maintained
+        tee = Product.objects.get(slug='tee')
+        self.assertEqual((tee.min_price, tee.max_price, tee.total_stock, tee.in_stock), (10, 12, 3, True))
+        self.assertEqual(facets.get_index()['values']['Size']['M'], 1 << tee.pk | 1 << Product.objects.get(slug='hoodie').pk)
+        self.assertEqual(search_engine.search('hoodie')[0][0], Product.objects.get(slug='hoodie').pk)
+        # Related products are left to the worker
+        self.assertEqual(set(StaleRelatedCategory.objects.values_list('category_id', flat=True)), set(Category.objects.values_list('pk', flat=True)))
+        self.assertFalse(RelatedProducts.objects.exists())
+
+        # Importing again matches on slug and sku
+        self.run_command('import_catalog', self.write('update.csv', self.CSV.replace('TEE-L,12.00,0', 'TEE-L,11.00,5')))
+        self.assertEqual(ProductVariant.objects.count(), 3)
+        tee.refresh_from_db()
+        self.assertEqual((tee.min_price, tee.max_price, tee.total_stock), (10, 11, 8))
+
+    def test_export_round_trips(self):
+        self.run_command('import_catalog', self.write('catalog.csv', self.CSV))
+        for fmt in ['csv', 'jsonl']:
+            with self.subTest(fmt=fmt):
+                path = os.path.join(self.directory.name, f'export.{fmt}')
+                self.run_command('export_catalog', path, chunk_size=1)
+                before = self.catalog()
+                self.run_command('import_catalog', path, restart=True)
+                self.assertEqual(self.catalog(), before)
+        with open(path) as fh:
+            self.assertEqual(json.loads(fh.readline())['attributes'], {'Color': 'Red', 'Size': 'M'})
+
+    def test_interrupted_import_resumes_from_its_checkpoint(self):
+        path = self.write('catalog.csv', self.CSV)
+        chunks = []
+
+        def fail_second_chunk(rows):
+            chunks.append([row['product_slug'] for row in rows])
+            if len(chunks) == 2:
+                raise RuntimeError('Connection lost')
+            return import_chunk(rows)
+
+        import_chunk = import_catalog.import_chunk
+        with mock.patch.object(import_catalog, 'import_chunk', side_effect=fail_second_chunk), self.assertRaises(RuntimeError):
+            self.run_command('import_catalog', path, chunk_size=2)
+        with open(f'{path}.checkpoint') as fh:
+            self.assertEqual(json.load(fh)['rows'], 2)
+
+        with mock.patch.object(import_catalog, 'import_chunk', side_effect=fail_second_chunk):
+            output = self.run_command('import_catalog', path, chunk_size=2)
+        self.assertIn('Resuming after row 2.', output)
+        self.assertEqual(chunks, [['tee', 'tee'], ['hoodie', 'cap'], ['hoodie', 'cap']])
+        self.assertEqual(ProductVariant.objects.count(), 3)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_bad_rows_stop_the_import_with_their_line(self):
+        path = self.write('catalog.csv', self.CSV + 'sock,Sock,,tops,Tops,SOCK-1,cheap,1,1,\n')
+        with self.assertRaisesMessage(CommandError, 'Line 6: invalid price or stock'):
+            self.run_command('import_catalog', path, chunk_size=2)
+
+
+@override_settings(
+    POPULARITY_HALF_LIFE_DAYS=7, POPULARITY_WINDOW_DAYS=30,
+    POPULARITY_WEIGHTS={'view': 1, 'cart_add': 5, 'sale': 20},
+)
+class PopularityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner, cls.boot, cls.sandal = [
+            Product.objects.create(category=category, name=name, slug=name.lower(), in_stock=True) for name in ['Runner', 'Boot', 'Sandal']
+        ]
+
+    def setUp(self):
+        self.today = timezone.localdate()
+
+    def activity(self, product, days_ago, views=0, cart_adds=0):
+        ProductActivity.objects.create(product=product, day=self.today - timedelta(days=days_ago), views=views, cart_adds=cart_adds)
+
+    def sale(self, product, quantity, status='submitted'):
+        order = Order.objects.create(
+            first_name='Ada', last_name='Obi', email='ada@example.com', status=status, total_price=10,
+            shipping_address_line1='1 Marina', shipping_city='Lagos', shipping_state='Lagos', shipping_zip_code='1',
+            billing_address_line1='1 Marina', billing_city='Lagos', billing_state='Lagos', billing_zip_code='1',
+        )
+        OrderItem.objects.create(order=order, product=product, product_name=product.name, product_price=10, quantity=quantity)
+
+    def test_scores_decay_with_age(self):
+        self.activity(self.runner, 0, views=10, cart_adds=1)
+        # One half-life ago counts half; outside the window not at all
+        self.activity(self.boot, 7, views=10)
+        self.activity(self.boot, 31, views=1000)
+        self.sale(self.sandal, 2)
+        self.sale(self.sandal, 5, status='pending')
+        scores = popularity.compute_scores()
+        self.assertEqual(set(scores), {self.runner.pk, self.boot.pk, self.sandal.pk})
+        self.assertAlmostEqual(scores[self.runner.pk], 15)
+        self.assertAlmostEqual(scores[self.boot.pk], 5)
+        self.assertAlmostEqual(scores[self.sandal.pk], 40)
+
+    def test_update_stores_scores_and_resets_the_rest(self):
+        Product.objects.filter(pk=self.boot.pk).update(popularity=99)
+        self.activity(self.runner, 0, views=3)
+        self.sale(self.sandal, 1)
+        version = get_catalog_version()
+        self.assertEqual(popularity.update_popularity(), 2)
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'popularity')),
+            {self.runner.pk: 3, self.boot.pk: 0, self.sandal.pk: 20},
+        )
+        self.assertEqual(Product.objects.get(pk=self.runner.pk).updated_at, self.runner.updated_at)
+        self.assertNotEqual(get_catalog_version(), version)
+
+        response = Client(SERVER_NAME='localhost').get('/products/products/', {'sort': 'popular'})
+        self.assertEqual([product.pk for product in response.context['products']], [self.sandal.pk, self.runner.pk, self.boot.pk])
+
+    def test_update_queries_dont_grow_with_the_catalog(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                popularity.update_popularity()
+            return len(captured)
+
+        self.activity(self.runner, 0, views=1)
+        few = queries()
+        for product in [self.boot, self.sandal]:
+            self.activity(product, 1, views=2)
+            self.sale(product, 1)
+        self.assertEqual(queries(), few)
+
+
+class CoPurchaseDependencyTests(SimpleTestCase):
+
+    def test_command_explains_missing_dependencies(self):
+        with mock.patch.dict('sys.modules', {'scipy': None}), self.assertRaisesMessage(CommandError, 'pip install numpy scipy'):
+            call_command('compute_copurchases', stdout=io.StringIO())
+
+
+@skipUnless(find_spec('numpy') and find_spec('scipy'), "compute_copurchases needs numpy and scipy")
+class CoPurchaseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.shoe, cls.sock, cls.lace, cls.boot = [
+            Product.objects.create(category=category, name=name, slug=name.lower(), in_stock=True) for name in ['Shoe', 'Sock', 'Lace', 'Boot']
+        ]
+        cls.order(cls.shoe, cls.sock)
+        cls.order(cls.shoe, cls.sock, cls.lace, cls.sock)
+        cls.order(cls.shoe, cls.lace)
+        cls.order(cls.shoe, cls.boot, status='pending')
+
+    @staticmethod
+    def order(*products, status='submitted'):
+        order = Order.objects.create(
+            first_name='Ada', last_name='Obi', email='ada@example.com', status=status, total_price=10,
+            shipping_address_line1='1 Marina', shipping_city='Lagos', shipping_state='Lagos', shipping_zip_code='1',
+            billing_address_line1='1 Marina', billing_city='Lagos', billing_state='Lagos', billing_zip_code='1',
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, product_name=product.name, product_price=10, quantity=1)
+
+    def neighbors(self):
+        return dict(CoPurchase.objects.values_list('product_id', 'neighbor_ids'))
+
+    def test_neighbors_are_ranked_by_cosine_similarity(self):
+        self.assertEqual(copurchase.rebuild_copurchases(), 3)
+        # Shoe-Sock and Shoe-Lace are both 2 / sqrt(3 * 2); the lower id wins the tie. Pending orders don't count.
+        self.assertEqual(self.neighbors(), {
+            self.shoe.pk: [self.sock.pk, self.lace.pk],
+            self.sock.pk: [self.shoe.pk, self.lace.pk],
+            self.lace.pk: [self.shoe.pk, self.sock.pk],
+        })
+
+    def test_chunks_never_split_an_order(self):
+        copurchase.rebuild_copurchases()
+        expected = self.neighbors()
+        for chunk_size in [1, 2, 3]:
+            with self.subTest(chunk_size=chunk_size):
+                copurchase.rebuild_copurchases(chunk_size=chunk_size)
+                self.assertEqual(self.neighbors(), expected)
+
+    def test_command_replaces_stale_rows(self):
+        CoPurchase.objects.create(product=self.boot, neighbor_ids=[self.shoe.pk])
+        call_command('compute_copurchases', stdout=io.StringIO())
+        self.assertNotIn(self.boot.pk, self.neighbors())
+
+    def test_also_bought_is_two_queries(self):
+        copurchase.rebuild_copurchases()
+        Product.objects.filter(pk=self.lace.pk).update(in_stock=False)
+        with self.assertNumQueries(2):
+            self.assertEqual(copurchase.also_bought([self.shoe.pk]), [self.sock])
+        # A cart's lists are interleaved, never offering what is already in it
+        with self.assertNumQueries(2):
+            self.assertEqual(copurchase.also_bought([self.sock.pk, self.lace.pk]), [self.shoe])
+
+
+class FeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Tops', slug='tops')
+        color = Variation.objects.create(name='Color')
+        cls.products = []
+        for name in ['Tee', 'Hoodie', 'Cap']:
+            product = Product.objects.create(category=cls.category, name=name, slug=name.lower())
+            for number, value in enumerate(['Red', 'Blue']):
+                variant = ProductVariant.objects.create(product=product, sku=f'{name}-{value}', price=10 + number, stock=number)
+                ProductVariantAttribute.objects.create(product_variant=variant, variation=color, attribute_value=value)
+            cls.products.append(product)
+        ProductVariant.objects.filter(sku='Cap-Blue').update(is_active=False)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        overridden = override_settings(FEEDS_ROOT=self.root, FEEDS_URL='/media/feeds/', SITE_URL='https://shop.example', FEED_BLOCK_SIZE=2)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def read(self, name):
+        with gzip.open(os.path.join(self.root, name), 'rt', encoding='utf-8') as fh:
+            return fh.read()
+
+    def feed(self):
+        return {row['id']: row for row in csv.DictReader(io.StringIO(self.read('products.csv.gz')))}
+
+    def test_sitemaps_and_feeds(self):
+        blocks = {product.pk // 2 for product in self.products}
+        self.assertEqual(feeds.build_feeds(), {'rebuilt': len(blocks), 'unchanged': 0, 'removed': 0})
+
+        with open(os.path.join(self.root, 'sitemap.xml'), encoding='utf-8') as fh:
+            index = ElementTree.fromstring(fh.read())
+        self.assertEqual(len(index), len(blocks) + 1)
+        urls = [
+            url.findtext(f'{{{feeds.SITEMAP_NS}}}loc')
+            for block in blocks for url in ElementTree.fromstring(self.read(f'sitemap-products-{block}.xml.gz'))
+        ]
+        self.assertEqual(sorted(urls), ['https://shop.example/products/cap/', 'https://shop.example/products/hoodie/', 'https://shop.example/products/tee/'])
+
+        # The feeds are concatenated gzip members; they read back as one document
+        items = ElementTree.fromstring(self.read('products.xml.gz')).find('channel').findall('item')
+        self.assertEqual(len(items), 5)
+        rows = self.feed()
+        self.assertEqual(
+            {(row['id'], row['price'], row['availability'], row['color']) for row in rows.values() if row['item_group_id'] == str(self.products[0].pk)},
+            {('Tee-Red', '10.00 NGN', 'out_of_stock', 'Red'), ('Tee-Blue', '11.00 NGN', 'in_stock', 'Blue')},
+        )
+        self.assertNotIn('Cap-Blue', rows)
+
+    def test_only_changed_blocks_are_rebuilt(self):
+        blocks = {product.pk // 2 for product in self.products}
+        feeds.build_feeds()
+        self.assertEqual(feeds.build_feeds(), {'rebuilt': 0, 'unchanged': len(blocks), 'removed': 0})
+
+        variant = ProductVariant.objects.get(sku='Tee-Red')
+        variant.stock = 4
+        variant.save()
+        self.assertEqual(feeds.build_feeds()['rebuilt'], 1)
+        self.assertEqual(self.feed()['Tee-Red']['availability'], 'in_stock')
+
+        self.products[2].delete()
+        remaining = {product.pk // 2 for product in self.products[:2]}
+        stats = feeds.build_feeds()
+        self.assertEqual(stats['removed'], len(blocks - remaining))
+        self.assertNotIn('Cap-Red', self.feed())
+        self.assertEqual(feeds.build_feeds(full=True)['rebuilt'], len(remaining))
+
+    @override_settings(FEED_BLOCK_SIZE=1000)
+    def test_queries_dont_grow_with_the_catalog(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                feeds.build_feeds(full=True, chunk_size=1000)
+            return len(captured)
+
+        few = queries()
+        for number in range(5):
+            product = Product.objects.create(category=self.category, name=f'Sock {number}', slug=f'sock-{number}')
+            ProductVariant.objects.create(product=product, sku=f'SOCK-{number}', price=5, stock=1)
+        self.assertEqual(queries(), few)
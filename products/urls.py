@@ -8,6 +8,8 @@ urlpatterns = [
     path('', views.index, name='product_list'),  # Changed to index view
     path('products/', views.product_list, name='product_list_all'),  # New path for product_list
     path('search/', views.search_products, name='search_products'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
     path('category/<slug:category_slug>/', views.product_list, name='category_detail'),
     path('<slug:slug>/', views.product_detail, name='product_detail'),
+    path('<slug:slug>/reviews/', views.product_reviews, name='product_reviews'),
 ]
\ No newline at end of file
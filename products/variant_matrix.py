@@ -0,0 +1,74 @@
+# products/variant_matrix.py
+"""
+The "variant matrix" of a product: every active variant with its
+attributes, price and stock, loaded with two queries and cached until one
+of the product's variants (or their attributes) changes.
+
+It provides what product_detail needs to render the variant picker:
+`variation_options` ({'Size': ['L', 'M'], ...}) and a compact JSON payload
+mapping each attribute combination to its variant id, price and stock, so
+the browser can switch variants without any further requests.
+"""
+from django.core.cache import cache
+
+from .models import ProductVariant, ProductVariantAttribute
+
+CACHE_KEY = 'variant_matrix:{product_id}'
+# Also invalidated on every variant change
+CACHE_TIMEOUT = 60 * 60
+
+
+def combination_key(attributes):
+    """'Color=Red|Size=M' for {'Size': 'M', 'Color': 'Red'}; the JS builds the same key."""
+    return '|'.join(f'{name}={attributes[name]}' for name in sorted(attributes))
+
+
+def build_variant_matrix(product_id):
+    variants = list(
+        ProductVariant.objects.filter(product_id=product_id, is_active=True)
+        .order_by('id')
+        .values('id', 'price', 'stock', 'sku')
+    )
+    attributes = {variant['id']: {} for variant in variants}
+    for variant_id, name, value in ProductVariantAttribute.objects.filter(
+        product_variant__product_id=product_id,
+        product_variant__is_active=True,
+    ).values_list('product_variant_id', 'variation__name', 'attribute_value'):
+        attributes[variant_id][name] = value
+
+    variation_options = {}
+    combinations = {}
+    for variant in variants:
+        variant['attributes'] = attributes[variant['id']]
+        for name, value in variant['attributes'].items():
+            variation_options.setdefault(name, set()).add(value)
+        combinations[combination_key(variant['attributes'])] = {
+            'id': variant['id'],
+            'price': str(variant['price']),
+            'stock': variant['stock'],
+        }
+
+    default_variant = variants[0] if variants else None
+    return {
+        'variants': variants,
+        'variation_options': {name: sorted(values) for name, values in sorted(variation_options.items())},
+        'default_variant': default_variant,
+        # Embedded in the page with json_script for the client-side variant picker
+        'payload': {
+            'combinations': combinations,
+            'default': combination_key(default_variant['attributes']) if default_variant else None,
+        },
+    }
+
+
+def get_variant_matrix(product_id):
+    key = CACHE_KEY.format(product_id=product_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_variant_matrix(product_id)
+        cache.set(key, matrix, CACHE_TIMEOUT)
+    return matrix
+
+
+def invalidate(product_ids):
+    cache.delete_many([CACHE_KEY.format(product_id=product_id) for product_id in product_ids])
@@ -1,14 +1,43 @@
 # products/views.py
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from .models import Product, Category, Variation, ProductVariant, ProductVariantAttribute, Review
+from django.db import transaction
 from django.db.models import Q, Sum, Avg
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from ecomstore.conditional import not_modified, page_etag, with_validator
+from ecomstore.page_cache import cached_page, get_catalog_version
+from search import autocomplete, engine as search_engine
+from . import copurchase, facets, related
+from .counters import record_view
+from .variant_matrix import get_variant_matrix
+from .pagination import InvalidCursor, get_page_size, page_querystring, paginate_keyset, sort_querystring
 
+# Sort keys for catalog listings (?sort=); each must end with a unique column for keyset pagination
+PRODUCT_LIST_ORDERINGS = {
+    'name': ('name', 'id'),
+    'rating': ('-rating_avg', '-review_count', '-id'),
+    'popular': ('-popularity', '-id'),
+}
+DEFAULT_PRODUCT_SORT = 'name'
+PRODUCT_SORT_LABELS = {'name': 'Name', 'rating': 'Top rated', 'popular': 'Most popular'}
+
+# Facet filters matching at most this many products become an id list in the listing query
+FACET_ID_LIST_LIMIT = 1000
+
+# Reviews are shown newest first
+REVIEW_ORDERING = ('-created_at', '-id')
+
+@cached_page('products_index')
 def index(request):
-    featured_products = Product.objects.filter(variants__is_active=True, variants__stock__gt=0).distinct().order_by('-created_at')[:4]
-    popular_products = Product.objects.filter(variants__is_active=True, variants__stock__gt=0, view_count__gte=5).distinct().order_by('-view_count')[:4]
+    featured_products = Product.objects.filter(in_stock=True).select_related('category').order_by('-created_at')[:4]
+    # Top of the (in_stock, popularity, id) index; scores are refreshed by `manage.py compute_popularity`
+    popular_products = Product.objects.filter(in_stock=True, popularity__gt=0).select_related('category').order_by('-popularity', '-id')[:4]
     categories = Category.objects.all()
 
     context = {
@@ -20,8 +49,14 @@ def index(request):
     return render(request, 'index.html', context)
 
 def product_list(request, category_slug=None):
+    # Everything on the page changes with the catalog version; repeat visits get a 304 without a query
+    etag = page_etag(request, 'product_list', get_catalog_version(), request.get_full_path())
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
     category = None
-    products = Product.objects.filter(variants__is_active=True, variants__stock__gt=0).distinct().order_by('name')
+    products = Product.objects.filter(in_stock=True).select_related('category')
     categories = Category.objects.all()
 
     category_slug_from_query = request.GET.get('category')
@@ -32,39 +67,72 @@ def product_list(request, category_slug=None):
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
 
+    # Attribute facets are answered from the in-memory bitmap index, not by JOINs
+    facet_index = facets.get_index()
+    selected_facets = facets.parse_filters(request.GET, facet_index)
+    facet_base = facets.base_bitmap(facet_index, category)
+    keep = None
+    if selected_facets:
+        matching = facets.matching(facet_index, selected_facets, facet_base)
+        if matching.bit_count() <= FACET_ID_LIST_LIMIT:
+            products = products.filter(pk__in=facets.bitmap_to_ids(matching))
+        else:
+            # Too many ids to send to the database; filter the rows each page reads instead
+            keep = lambda product: facets.contains(matching, product.pk)
+
+    sort = request.GET.get('sort')
+    if sort not in PRODUCT_LIST_ORDERINGS:
+        sort = DEFAULT_PRODUCT_SORT
+
+    # Keyset pagination on the sort key: each page is one index range scan, however deep it is
+    try:
+        page = paginate_keyset(products, PRODUCT_LIST_ORDERINGS[sort], request.GET.get('cursor'), get_page_size(request), keep)
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+
     context = {
         'category': category,
-        'products': products,
+        'products': page.object_list,
+        'page': page,
+        'next_page_query': page_querystring(request, page.next_cursor) if page.has_next else None,
+        'previous_page_query': page_querystring(request, page.previous_cursor) if page.has_previous else None,
         'categories': categories,
+        'facets': facets.facet_counts(facet_index, selected_facets, facet_base),
+        'sort_options': [
+            {'label': label, 'query': sort_querystring(request, value), 'selected': value == sort}
+            for value, label in PRODUCT_SORT_LABELS.items()
+        ],
         'site_name': 'Modern Fashion',
         'page_title': 'All Products' if not category else category.name,
         'selected_category_slug': category_slug_from_query or category_slug
     }
-    return render(request, 'products/product_list.html', context)
+    return with_validator(render(request, 'products/product_list.html', context), etag)
 
 @login_required
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    product.view_count += 1
-    product.save()
-
-    variants = product.variants.filter(is_active=True).order_by('id')
+    # One small query for the validator: cache_version moves with stock, variants and reviews,
+    # the catalog version with the related and recently viewed products shown alongside.
+    # The session's recently viewed list is updated first, so a 304 still records the visit.
+    versions = Product.objects.filter(slug=slug).values_list('pk', 'updated_at', 'cache_version').first()
+    if versions is None:
+        raise Http404("Product not found.")
+    recently_viewed = _remember_viewed(request, versions[0])
+    rotation = related.current_rotation()
+    etag = page_etag(request, 'product_detail', *versions, get_catalog_version(), recently_viewed, rotation)
+    response = not_modified(request, etag)
+    if response is not None:
+        record_view(versions[0])
+        return response
 
-    variation_options = {}
-    product_variation_types = Variation.objects.filter(
-        productvariantattribute__product_variant__product=product
-    ).distinct()
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
+    # Buffered in the cache and flushed in batches (see products/counters.py)
+    record_view(product.pk)
 
-    for var_type in product_variation_types:
-        attribute_values = ProductVariantAttribute.objects.filter(
-            product_variant__product=product,
-            variation=var_type
-        ).values_list('attribute_value', flat=True).distinct().order_by('attribute_value')
-        variation_options[var_type.name] = list(attribute_values)
-
-    default_variant = None
-    if variants.exists():
-        default_variant = variants.first()
+    # All variants, attributes, prices and stock in two queries, cached per product
+    matrix = get_variant_matrix(product.pk)
+    variants = matrix['variants']
+    variation_options = matrix['variation_options']
+    default_variant = matrix['default_variant']
 
     # Handle review submission
     if request.method == 'POST':
@@ -77,6 +145,7 @@ def product_detail(request, slug):
                 'variants': variants,
                 'variation_options': variation_options,
                 'default_variant': default_variant,
+                'variant_payload': matrix['payload'],
                 'error': 'Please provide a rating.',
             })
 
@@ -90,6 +159,7 @@ def product_detail(request, slug):
                 'variants': variants,
                 'variation_options': variation_options,
                 'default_variant': default_variant,
+                'variant_payload': matrix['payload'],
                 'error': 'Invalid rating value.',
             })
 
@@ -99,63 +169,110 @@ def product_detail(request, slug):
                 'variants': variants,
                 'variation_options': variation_options,
                 'default_variant': default_variant,
+                'variant_payload': matrix['payload'],
                 'error': 'You have already submitted a review for this product.',
             })
 
-        review = Review(product=product, user=request.user, rating=rating, comment=comment)
-        review.save()
+        # The review and its effect on the product's stored aggregates commit together
+        with transaction.atomic():
+            Review.objects.create(product=product, user=request.user, rating=rating, comment=comment)
 
         return redirect('products:product_detail', slug=slug)
 
-    # Fetch reviews for display
-    reviews = product.reviews.all()
-    avg_rating = product.reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-    review_count = product.reviews.count()
-
-    # Fetch related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        variants__is_active=True,
-        variants__stock__gt=0
-    ).exclude(id=product.id).distinct().order_by('?')[:4]
-
-    # Track recently viewed products in session
-    if 'recently_viewed' not in request.session:
-        request.session['recently_viewed'] = []
-    recently_viewed = request.session['recently_viewed']
-    if product.id not in recently_viewed:
-        recently_viewed.insert(0, product.id)
-        if len(recently_viewed) > 4:
-            recently_viewed.pop()
-        request.session['recently_viewed'] = recently_viewed
+    # Only the first page of reviews is rendered; the rest is fetched from product_reviews.
+    # The rating summary is stored on the product itself.
+    reviews_page = _reviews_page(product.pk)
+
+    # Related products: the current rotation of the precomputed candidates (see products/related.py)
+    related_products = related.pick_related(product, rotation)
+    # "Customers also bought": precomputed from paid orders (see products/copurchase.py)
+    also_bought = copurchase.also_bought([product.pk], exclude=[other.pk for other in related_products])
 
     # Fetch recently viewed products
-    recently_viewed_products = Product.objects.filter(id__in=recently_viewed, variants__is_active=True, variants__stock__gt=0).distinct().order_by('-id')
+    recently_viewed_products = Product.objects.filter(id__in=recently_viewed, in_stock=True).order_by('-id')
 
     context = {
         'product': product,
         'variants': variants,
         'variation_options': variation_options,
         'default_variant': default_variant,
-        'reviews': reviews,
-        'avg_rating': avg_rating,
-        'review_count': review_count,
+        'variant_payload': matrix['payload'],
+        'reviews': reviews_page.object_list,
+        'reviews_page': reviews_page,
+        'avg_rating': product.rating_avg,
+        'review_count': product.review_count,
         'related_products': related_products,
+        'also_bought': also_bought,
         'recently_viewed_products': recently_viewed_products,
     }
-    return render(request, 'product_detail.html', context)
+    return with_validator(render(request, 'product_detail.html', context), etag)
+
+def _remember_viewed(request, product_id):
+    """Tracks recently viewed products in the session; returns the updated list of ids."""
+    recently_viewed = request.session.get('recently_viewed', [])
+    if product_id not in recently_viewed:
+        recently_viewed = [product_id, *recently_viewed][:4]
+        request.session['recently_viewed'] = recently_viewed
+    return recently_viewed
+
+def _reviews_page(product_id, cursor=None):
+    """A keyset page of a product's reviews, newest first, with their authors in the same query."""
+    reviews = Review.objects.filter(product_id=product_id).select_related('user')
+    return paginate_keyset(reviews, REVIEW_ORDERING, cursor, settings.REVIEWS_PAGE_SIZE)
+
+def product_reviews(request, slug):
+    """Further pages of a product's reviews for the detail page, as rendered HTML plus the next page's URL."""
+    product_id = Product.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    if product_id is None:
+        raise Http404("Product not found.")
+    try:
+        page = _reviews_page(product_id, request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('products:product_reviews', kwargs={'slug': slug})}?cursor={page.next_cursor}"
+    html = ''.join(render_to_string('products/_review.html', {'review': review}) for review in page.object_list)
+    return JsonResponse({'html': html, 'next_url': next_url})
 
 def search_products(request):
-    query = request.GET.get('q')
-    products = Product.objects.filter(variants__is_active=True, variants__stock__gt=0).distinct()
+    query = request.GET.get('q', '').strip()
+    products = []
+    facet_list = []
 
     if query:
-        products = products.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).distinct()
+        # Ranked lookup against the inverted index (see search/engine.py)
+        ranked = search_engine.rank(query)
+
+        # Facet counts cover every in-stock hit, not just the page shown; filters apply before the cut
+        facet_index = facets.get_index()
+        selected_facets = facets.parse_filters(request.GET, facet_index)
+        facet_base = facets.ids_to_bitmap(product_id for product_id, score in ranked) & facet_index['all']
+        facet_list = facets.facet_counts(facet_index, selected_facets, facet_base)
+        allowed = None
+        if selected_facets:
+            matching = facets.matching(facet_index, selected_facets, facet_base)
+            allowed = lambda product_id: facets.contains(matching, product_id)
+        ranked_ids = [product_id for product_id, score in search_engine.available(ranked, allowed=allowed)]
+
+        products_by_id = Product.objects.select_related('category').in_bulk(ranked_ids)
+        products = [products_by_id[pk] for pk in ranked_ids if pk in products_by_id]
+        if products:
+            # Frequent queries with results become search-as-you-type suggestions
+            autocomplete.record_search(query)
 
     context = {
         'query': query,
-        'products': products
+        'products': products,
+        'facets': facet_list,
     }
-    return render(request, 'products/search_results.html', context)
\ No newline at end of file
+    return render(request, 'products/search_results.html', context)
+
+def search_suggestions(request):
+    """Typeahead suggestions for the header search box, answered from the in-memory prefix index."""
+    query = request.GET.get('q', '')[:100]
+    response = JsonResponse({'query': query, 'suggestions': autocomplete.suggest(query)})
+    # Browsers reuse the answer when the user types the same prefix again
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
\ No newline at end of file
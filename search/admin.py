@@ -0,0 +1,17 @@
+# search/admin.py
+from django.contrib import admin
+from .models import SearchDocument, SearchQuery
+
+
+@admin.register(SearchDocument)
+class SearchDocumentAdmin(admin.ModelAdmin):
+    list_display = ('product', 'length', 'updated_at')
+    search_fields = ('product__name',)
+    raw_id_fields = ('product',)
+
+
+@admin.register(SearchQuery)
+class SearchQueryAdmin(admin.ModelAdmin):
+    list_display = ('query', 'count', 'last_searched_at')
+    search_fields = ('query',)
+    ordering = ('-count',)
@@ -0,0 +1,292 @@
+# search/autocomplete.py
+"""
+Search-as-you-type suggestions.
+
+Product names, category names and frequently searched queries are kept in an
+in-memory prefix index, a SharedSnapshot like the facet bitmaps:
+
+- `entries` maps ('product', id) / ('category', id) / ('query', text) to
+  (label, kind, score, url). Products score their popularity, categories the
+  popularity of their in-stock products, queries their search count times
+  QUERY_WEIGHT.
+- `terms` is a sorted list of (term, entry key), with one term per word
+  start of the normalised label, so "sh" finds "Running Shoes". A prefix
+  lookup is a bisect plus a scan of the matching run.
+- `heads` holds the ranked suggestions of every prefix of up to
+  HEAD_LENGTH characters, whose runs are too long to scan.
+
+Answering a suggestion never touches the database. Workers load the index
+at startup (ecomstore/wsgi.py), and catalog signals and imports patch the
+entries they change, sharing each change as a small delta (see
+SharedSnapshot.patch). Scores and popular queries are refreshed when
+`manage.py compute_popularity` (or `rebuild_search_index`) rebuilds it.
+"""
+import heapq
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q, Sum
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from products.models import Category, Product
+from products.snapshots import SharedSnapshot
+from .engine import TOKEN_RE
+from .models import SearchQuery
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = SearchQuery._meta.get_field('query').max_length
+
+WARM_LOCK_KEY = 'autocomplete:warming'
+
+# Prefixes up to this long have ranked suggestions; longer ones scan at most SCAN_LIMIT terms
+HEAD_LENGTH = 3
+SCAN_LIMIT = 5000
+
+# Queries searched this often within POPULARITY_WINDOW_DAYS are suggested, each search worth QUERY_WEIGHT points
+MIN_QUERY_COUNT = 3
+QUERY_WEIGHT = 2
+
+
+def normalize(text):
+    """Lowercase, accent-free words separated by single spaces."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(TOKEN_RE.findall(text))
+
+
+def _terms(label):
+    words = normalize(label).split()
+    return {' '.join(words[start:]) for start in range(len(words))}
+
+
+def _product_entries(products):
+    return {
+        ('product', pk): (name, 'product', popularity, reverse('products:product_detail', args=[slug]))
+        for pk, name, slug, popularity in products
+    }
+
+
+def _category_entries(categories):
+    return {
+        ('category', pk): (name, 'category', score or 0, reverse('products:category_detail', args=[slug]))
+        for pk, name, slug, score in categories
+    }
+
+
+def _query_entries():
+    since = timezone.now() - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+    queries = SearchQuery.objects.filter(count__gte=MIN_QUERY_COUNT, last_searched_at__gte=since)
+    search_url = reverse('products:search_products')
+    return {
+        ('query', query): (query, 'query', count * QUERY_WEIGHT, f"{search_url}?{urlencode({'q': query})}")
+        for query, count in queries.values_list('query', 'count').iterator(chunk_size=2000)
+    }
+
+
+def _products(**filters):
+    return Product.objects.filter(in_stock=True, **filters).values_list('pk', 'name', 'slug', 'popularity')
+
+
+def _categories(**filters):
+    return Category.objects.filter(**filters).annotate(
+        score=Sum('products__popularity', filter=Q(products__in_stock=True)),
+    ).values_list('pk', 'name', 'slug', 'score')
+
+
+def _rank(entries, keys, limit):
+    """The best `limit` entries among `keys`, one per label. Keys without an entry (any more) are skipped."""
+    scored = ((-entry[2], entry[0], key) for key in keys if (entry := entries.get(key)) is not None)
+    seen = set()
+    best = []
+    for score, label, key in heapq.nsmallest(limit * 2, scored):
+        label = label.lower()
+        if label not in seen:
+            seen.add(label)
+            best.append(key)
+            if len(best) == limit:
+                break
+    return best
+
+
+def _head_prefixes(term):
+    return (term[:length] for length in range(1, min(len(term), HEAD_LENGTH) + 1))
+
+
+def _index(entries):
+    terms = sorted((term, key) for key, entry in entries.items() for term in _terms(entry[0]))
+    candidates = defaultdict(set)
+    for term, key in terms:
+        for prefix in _head_prefixes(term):
+            candidates[prefix].add(key)
+    heads = {prefix: _rank(entries, keys, settings.AUTOCOMPLETE_RESULTS) for prefix, keys in candidates.items()}
+    return {'entries': entries, 'terms': terms, 'heads': heads}
+
+
+def _build_index():
+    entries = _product_entries(_products().iterator(chunk_size=2000))
+    entries.update(_category_entries(_categories()))
+    entries.update(_query_entries())
+    return _index(entries)
+
+
+def _matching(terms, prefix):
+    """The keys of every term starting with `prefix`."""
+    position = bisect_left(terms, (prefix,))
+    keys = set()
+    while position < len(terms) and terms[position][0].startswith(prefix):
+        keys.add(terms[position][1])
+        position += 1
+    return keys
+
+
+def _apply_patch(index, patch):
+    """
+    Replaces, in place, the entries of a patch's keys with its fresh entries
+    (keys missing from them are dropped). Only their terms are removed and
+    inserted, and only the heads of those terms' prefixes are re-ranked.
+    Readers may be using the index meanwhile, so entries are added before
+    anything refers to them and dropped only once nothing does.
+    """
+    keys, fresh = patch
+    entries, terms, heads = index['entries'], index['terms'], index['heads']
+    old_terms = {key: _terms(entries[key][0]) for key in keys if key in entries}
+    fresh_terms = {key: _terms(entry[0]) for key, entry in fresh.items()}
+    prefixes = set()
+
+    entries.update(fresh)
+    for key, key_terms in fresh_terms.items():
+        for term in key_terms - old_terms.get(key, set()):
+            insort(terms, (term, key))
+            prefixes.update(_head_prefixes(term))
+    for key, key_terms in old_terms.items():
+        for term in key_terms - fresh_terms.get(key, set()):
+            position = bisect_left(terms, (term, key))
+            if position < len(terms) and terms[position] == (term, key):
+                del terms[position]
+            prefixes.update(_head_prefixes(term))
+    # A new score or label can move an entry within heads whose terms didn't change
+    for key in old_terms.keys() & fresh_terms.keys():
+        for term in old_terms[key] & fresh_terms[key]:
+            prefixes.update(_head_prefixes(term))
+
+    for prefix in prefixes:
+        head = heads.get(prefix, [])
+        if keys.isdisjoint(head):
+            # Nothing in the head changed, so only the fresh entries can join it
+            candidates = set(head)
+            candidates.update(key for key, key_terms in fresh_terms.items() if any(term.startswith(prefix) for term in key_terms))
+        else:
+            candidates = _matching(terms, prefix)
+        if candidates:
+            heads[prefix] = _rank(entries, candidates, settings.AUTOCOMPLETE_RESULTS)
+        else:
+            heads.pop(prefix, None)
+
+    for key in old_terms.keys() - fresh.keys():
+        del entries[key]
+
+
+_snapshot = SharedSnapshot('autocomplete', _build_index, _apply_patch)
+
+
+def warm_index():
+    """Loads the index into this worker, building it if no worker has yet."""
+    return _snapshot.get()
+
+
+def rebuild_index():
+    return _snapshot.publish(_build_index())
+
+
+def _warm_in_background():
+    if not cache.add(WARM_LOCK_KEY, 1, 60):
+        return
+
+    def warm():
+        try:
+            warm_index()
+        except Exception:
+            logger.exception("Building the autocomplete index failed")
+        finally:
+            cache.delete(WARM_LOCK_KEY)
+            connections.close_all()
+
+    threading.Thread(target=warm, daemon=True).start()
+
+
+def suggest(query, limit=None):
+    """
+    Up to `limit` suggestions for what has been typed so far, best first, as
+    dicts with label, kind and url. Returns nothing (and starts building the
+    index in the background) while the index isn't loaded yet.
+    """
+    limit = min(limit or settings.AUTOCOMPLETE_RESULTS, settings.AUTOCOMPLETE_RESULTS)
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    index = _snapshot.peek()
+    if index is None:
+        _warm_in_background()
+        return []
+
+    if len(prefix) <= HEAD_LENGTH:
+        keys = index['heads'].get(prefix, [])[:limit]
+    else:
+        terms = index['terms']
+        position = bisect_left(terms, (prefix,))
+        end = min(len(terms), position + SCAN_LIMIT)
+        matches = set()
+        while position < end and terms[position][0].startswith(prefix):
+            matches.add(terms[position][1])
+            position += 1
+        keys = _rank(index['entries'], matches, limit)
+
+    # A patch being applied may have just dropped an entry
+    found = (index['entries'].get(key) for key in keys)
+    return [{'label': entry[0], 'kind': entry[1], 'url': entry[3]} for entry in found if entry is not None]
+
+
+def _patch(kind, ids, fresh):
+    """
+    Publishes the fresh entries of `ids` as a delta, so a change costs every
+    worker a few list inserts rather than a copy of the index.
+    """
+    _snapshot.patch(({(kind, pk) for pk in ids}, fresh))
+
+
+def refresh_products(product_ids):
+    """Re-reads the given products and patches their suggestions (out-of-stock and deleted ones are dropped)."""
+    product_ids = set(product_ids)
+    if product_ids:
+        _patch('product', product_ids, _product_entries(_products(pk__in=product_ids)))
+
+
+def refresh_categories(category_ids):
+    category_ids = set(category_ids)
+    if category_ids:
+        _patch('category', category_ids, _category_entries(_categories(pk__in=category_ids)))
+
+
+def record_search(query):
+    """Counts one search for `query`; frequent queries become suggestions at the next rebuild."""
+    query = normalize(query)
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        return
+    now = timezone.now()
+    if SearchQuery.objects.filter(query=query).update(count=F('count') + 1, last_searched_at=now):
+        return
+    try:
+        with transaction.atomic():
+            SearchQuery.objects.create(query=query, count=1, last_searched_at=now)
+    except IntegrityError:
+        # Someone created the row in the meantime
+        SearchQuery.objects.filter(query=query).update(count=F('count') + 1, last_searched_at=now)
@@ -0,0 +1,293 @@
+# search/engine.py
+"""
+A small inverted-index search engine for the product catalog.
+
+Products are tokenized (name, description, category name and variant
+attribute values) into SearchPosting rows keyed by term. Queries look up
+only the postings for their terms and rank the matching products with BM25.
+
+Postings are read in impact order (highest weighted frequency first)
+through the (term, frequency, product) index, and at most
+MAX_POSTINGS_PER_TERM of them per term, so a query costs the same on a
+large catalog as on a small one. A product beyond that cut for a common
+term is only missing that term's (small) contribution to its score. The
+document frequencies of cut terms are counted once and cached like the
+collection stats.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+
+from products.models import Product, ProductVariantAttribute
+from .models import SearchDocument, SearchPosting
+
+# How much each field contributes to a term's frequency (a simple BM25F).
+FIELD_WEIGHTS = {
+    'name': 3,
+    'category': 2,
+    'attributes': 2,
+    'description': 1,
+}
+
+# BM25 tuning constants (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Maximum number of index terms a trailing query prefix may expand to
+PREFIX_EXPANSION_LIMIT = 20
+
+# Postings read per query term, best first
+MAX_POSTINGS_PER_TERM = 1000
+
+STATS_CACHE_KEY = 'search:stats'
+DOCUMENT_FREQUENCY_CACHE_PREFIX = 'search:df:'
+STATS_CACHE_TIMEOUT = 300
+
+MAX_TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from in is it of on or that the this to with
+""".split())
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _stem(token):
+    """Very light English plural stemming so 'shoes' matches 'shoe'."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('sses', 'xes', 'ches', 'shes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercases, strips accents and splits text into stemmed index terms."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    return [
+        _stem(token)[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text)
+        if token not in STOP_WORDS
+    ]
+
+
+def _document_terms(product, attribute_values):
+    """Returns a Counter of weighted term frequencies for one product."""
+    terms = Counter()
+    fields = {
+        'name': [product.name],
+        'category': [product.category.name],
+        'attributes': attribute_values,
+        'description': [product.description],
+    }
+    for field, texts in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for text in texts:
+            for token in tokenize(text):
+                terms[token] += weight
+    return terms
+
+
+def index_products(product_ids):
+    """
+    (Re)builds the index entries of the given products in bulk: two reads,
+    one delete and two bulk writes, whatever the number of products.
+    Products that no longer exist are simply dropped from the index.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    products = Product.objects.filter(pk__in=product_ids).select_related('category').only(
+        'id', 'name', 'description', 'category__name',
+    )
+    attribute_values = defaultdict(list)
+    for product_id, value in ProductVariantAttribute.objects.filter(
+        product_variant__product_id__in=product_ids,
+        product_variant__is_active=True,
+    ).values_list('product_variant__product_id', 'attribute_value'):
+        attribute_values[product_id].append(value)
+
+    documents = []
+    postings = []
+    for product in products:
+        terms = _document_terms(product, attribute_values[product.pk])
+        documents.append(SearchDocument(product_id=product.pk, length=sum(terms.values())))
+        postings.extend(
+            SearchPosting(term=term, product_id=product.pk, frequency=frequency)
+            for term, frequency in terms.items()
+        )
+
+    with transaction.atomic():
+        SearchPosting.objects.filter(product_id__in=product_ids).delete()
+        SearchDocument.objects.filter(product_id__in=product_ids).delete()
+        SearchDocument.objects.bulk_create(documents)
+        SearchPosting.objects.bulk_create(postings, batch_size=1000)
+
+    cache.delete(STATS_CACHE_KEY)
+
+
+def rebuild_index(chunk_size=500, progress=None):
+    """Re-indexes the whole catalog in chunks of `chunk_size` products."""
+    product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    indexed = 0
+    chunk = []
+    for product_id in product_ids.iterator(chunk_size=chunk_size):
+        chunk.append(product_id)
+        if len(chunk) >= chunk_size:
+            index_products(chunk)
+            indexed += len(chunk)
+            chunk = []
+            if progress:
+                progress(indexed)
+    if chunk:
+        index_products(chunk)
+        indexed += len(chunk)
+        if progress:
+            progress(indexed)
+    return indexed
+
+
+def _collection_stats():
+    """Returns (document count, average document length), cached between index writes."""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        row = SearchDocument.objects.aggregate(count=Count('pk'), avg_length=Avg('length'))
+        stats = (row['count'] or 0, float(row['avg_length'] or 0.0))
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def _query_terms(query):
+    """
+    Returns the set of index terms to look up for a query. The last token is
+    also treated as a prefix (e.g. 'snea' -> 'sneaker'), capped to a handful
+    of index terms so a short prefix can't fan out across the whole index.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return set()
+    terms = set(tokens)
+    raw_last = TOKEN_RE.findall(unicodedata.normalize('NFKD', query).encode('ascii', 'ignore').decode('ascii').lower())
+    prefix = raw_last[-1] if raw_last else ''
+    if len(prefix) >= 2:
+        terms.update(
+            SearchPosting.objects.filter(term__startswith=prefix)
+            .order_by('term').values_list('term', flat=True).distinct()[:PREFIX_EXPANSION_LIMIT]
+        )
+    return terms
+
+
+def _top_postings(terms):
+    """
+    {term: [(product_id, frequency)]}: the first MAX_POSTINGS_PER_TERM + 1
+    postings of each term in impact order, so a cut term is recognisable by
+    its extra row. One UNION ALL query where the database can limit each
+    part, else one small query per term.
+    """
+    querysets = [
+        SearchPosting.objects.filter(term=term).order_by('-frequency', '-product_id')
+        .values_list('term', 'product_id', 'frequency')[:MAX_POSTINGS_PER_TERM + 1]
+        for term in sorted(terms)
+    ]
+    if connection.features.supports_slicing_ordering_in_compound and len(querysets) > 1:
+        rows = querysets[0].union(*querysets[1:], all=True)
+    else:
+        rows = (row for queryset in querysets for row in queryset)
+    postings = defaultdict(list)
+    for term, product_id, frequency in rows:
+        postings[term].append((product_id, frequency))
+    return postings
+
+
+def _document_frequencies(terms):
+    """{term: number of products containing it}, cached between searches."""
+    keys = {f'{DOCUMENT_FREQUENCY_CACHE_PREFIX}{term}': term for term in terms}
+    frequencies = {keys[key]: count for key, count in cache.get_many(list(keys)).items()}
+    missing = set(terms) - set(frequencies)
+    if missing:
+        counted = dict(
+            SearchPosting.objects.filter(term__in=missing).values('term').annotate(count=Count('pk'))
+            .order_by().values_list('term', 'count')
+        )
+        cache.set_many({f'{DOCUMENT_FREQUENCY_CACHE_PREFIX}{term}': counted.get(term, 0) for term in missing}, STATS_CACHE_TIMEOUT)
+        frequencies.update(counted)
+    return frequencies
+
+
+def rank(query):
+    """
+    Every product matching `query` as (product_id, score) tuples, best first,
+    whether or not it is in stock.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+
+    postings = _top_postings(terms)
+    if not postings:
+        return []
+    cut = {term for term, rows in postings.items() if len(rows) > MAX_POSTINGS_PER_TERM}
+    document_frequencies = {term: len(rows) for term, rows in postings.items()}
+    if cut:
+        document_frequencies.update(_document_frequencies(cut))
+        for term in cut:
+            del postings[term][MAX_POSTINGS_PER_TERM:]
+
+    doc_count, avg_length = _collection_stats()
+    candidate_ids = {product_id for rows in postings.values() for product_id, _ in rows}
+    lengths = dict(SearchDocument.objects.filter(product_id__in=candidate_ids).values_list('product_id', 'length'))
+    avg_length = avg_length or 1.0
+
+    scores = defaultdict(float)
+    for term, rows in postings.items():
+        df = max(document_frequencies[term], len(rows))
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        for product_id, frequency in rows:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(product_id, avg_length) / avg_length)
+            scores[product_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def available(ranked, limit=None, allowed=None):
+    """
+    The first `limit` in-stock entries of `ranked` (as returned by rank())
+    whose product id passes `allowed`, if given.
+    """
+    limit = limit or getattr(settings, 'SEARCH_RESULTS_LIMIT', 48)
+    if allowed is not None:
+        ranked = [item for item in ranked if allowed(item[0])]
+
+    # Only in-stock products are shown; check availability a slice at a time
+    # so out-of-stock matches near the top don't starve the result page.
+    results = []
+    window = limit * 2
+    for start in range(0, len(ranked), window):
+        chunk = ranked[start:start + window]
+        in_stock = set(Product.objects.filter(
+            pk__in=[product_id for product_id, _ in chunk], in_stock=True,
+        ).values_list('pk', flat=True))
+        results.extend(item for item in chunk if item[0] in in_stock)
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+def search(query, limit=None, allowed=None):
+    """
+    Returns up to `limit` in-stock product ids matching `query` (and passing
+    `allowed`, a predicate on product ids), best first, as a list of
+    (product_id, score) tuples.
+    """
+    return available(rank(query), limit, allowed)
@@ -0,0 +1,28 @@
+# search/management/commands/rebuild_search_index.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from search import autocomplete
+from search.engine import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the product search index from scratch, in bulk chunks, and the autocomplete index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of products indexed per batch (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(indexed):
+            self.stdout.write(f"Indexed {indexed} products...")
+
+        total = rebuild_index(chunk_size=options['chunk_size'], progress=progress)
+        autocomplete.rebuild_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {total} products in {elapsed:.1f}s."))
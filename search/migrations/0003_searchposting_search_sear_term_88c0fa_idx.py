@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_copurchase'),
+        ('search', '0002_searchquery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['term', 'frequency', 'product'], name='search_sear_term_88c0fa_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# search/models.py
+from django.db import models
+from products.models import Product
+
+
+class SearchDocument(models.Model):
+    """
+    One row per indexed product. Stores the weighted token count of the
+    product's text, which BM25 uses for document-length normalisation.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    length = models.PositiveIntegerField(default=0, help_text="Weighted number of tokens in the indexed text.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for product {self.product_id}"
+
+
+class SearchPosting(models.Model):
+    """
+    An entry of the inverted index: how often `term` occurs in a product
+    (weighted by the field it came from). The (term, product) unique index
+    doubles as the lookup index for exact and prefix term searches.
+    """
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_postings')
+    frequency = models.PositiveIntegerField(default=1, help_text="Weighted term frequency.")
+
+    class Meta:
+        unique_together = ('term', 'product')
+        indexes = [
+            # A term's postings in impact order, so a query can stop after the best ones
+            models.Index(fields=['term', 'frequency', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.frequency})"
+
+
+class SearchQuery(models.Model):
+    """
+    How often a (normalised) query was searched. Frequent recent queries are
+    offered as search-as-you-type suggestions (see search/autocomplete.py).
+    """
+    query = models.CharField(max_length=100, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    last_searched_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'search queries'
+
+    def __str__(self):
+        return f"{self.query} ({self.count})"
@@ -0,0 +1,58 @@
+# search/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ecomstore.commit_batches import CommitBatch
+from products.models import Category, Product, ProductVariant, ProductVariantAttribute
+from . import autocomplete
+from .engine import index_products
+
+
+def _reindex(product_ids):
+    index_products(product_ids)
+    autocomplete.refresh_products(product_ids)
+
+
+# Saving a product in the admin also saves every inline variant and attribute;
+# all of those signals collapse into a single re-index when the transaction commits.
+_reindex_batch = CommitBatch(_reindex)
+
+
+def schedule_reindex(product_id):
+    _reindex_batch.add(product_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reindex_product(sender, instance, **kwargs):
+    schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def reindex_variant_product(sender, instance, **kwargs):
+    schedule_reindex(instance.product_id)
+
+
+@receiver(post_save, sender=ProductVariantAttribute)
+@receiver(post_delete, sender=ProductVariantAttribute)
+def reindex_attribute_product(sender, instance, **kwargs):
+    product_id = ProductVariant.objects.filter(pk=instance.product_variant_id).values_list('product_id', flat=True).first()
+    if product_id:
+        schedule_reindex(product_id)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    # The category name is part of every product document in it
+    if not created:
+        product_ids = list(instance.products.values_list('pk', flat=True))
+        transaction.on_commit(lambda: index_products(product_ids))
+    transaction.on_commit(lambda: autocomplete.refresh_categories([instance.pk]))
+
+
+@receiver(post_delete, sender=Category)
+def drop_category_suggestion(sender, instance, **kwargs):
+    category_id = instance.pk
+    transaction.on_commit(lambda: autocomplete.refresh_categories([category_id]))
@@ -0,0 +1,178 @@
+# search/tests.py
+import io
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+
+from products import catalog_io
+from products.models import Category, Product, ProductVariant, ProductVariantAttribute, Variation
+from products.snapshots import SharedSnapshot
+
+from . import autocomplete, engine
+from .engine import rebuild_index, search, tokenize
+from .models import SearchPosting
+
+
+class TokenizeTests(SimpleTestCase):
+
+    def test_normalises_and_stems(self):
+        self.assertEqual(tokenize('Café SHOES, berries & Dresses'), ['cafe', 'shoe', 'berry', 'dress'])
+
+    def test_drops_stop_words_and_keeps_short_words(self):
+        self.assertEqual(tokenize('The bag of the year'), ['bag', 'year'])
+        self.assertEqual(tokenize('glass bus gas'), ['glass', 'bus', 'gas'])
+
+    def test_empty(self):
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(tokenize('!!!'), [])
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Footwear', slug='footwear')
+        cls.color = Variation.objects.create(name='Color')
+
+        def product(name, description='', color='Black'):
+            product = Product.objects.create(category=cls.category, name=name, slug=name.lower().replace(' ', '-'), description=description)
+            variant = ProductVariant.objects.create(product=product, sku=f'SKU-{product.slug}', price=10, stock=2)
+            ProductVariantAttribute.objects.create(product_variant=variant, variation=cls.color, attribute_value=color)
+            return product
+
+        cls.shoe = product('Red Running Shoe', color='Red')
+        cls.sock = product('Running Sock')
+        cls.boot = product('Leather Boot', description='Goes with any running outfit')
+        cls.sneaker = product('Canvas Sneaker')
+        rebuild_index()
+
+    def ids(self, query, **kwargs):
+        return [product_id for product_id, score in search(query, **kwargs)]
+
+    def test_bm25_ordering(self):
+        # Name matches outrank description matches; among those, the shorter document wins
+        self.assertEqual(self.ids('running'), [self.sock.pk, self.shoe.pk, self.boot.pk])
+        # Matching more of the query beats a shorter document
+        self.assertEqual(self.ids('red running')[0], self.shoe.pk)
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.ids('snea'), [self.sneaker.pk])
+        self.assertEqual(self.ids('leath boot'), [self.boot.pk])
+
+    def test_out_of_stock_products_are_hidden(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.filter(product=self.sock).update(stock=0)
+            Product.objects.filter(pk=self.sock.pk).update(in_stock=False)
+        self.assertEqual(self.ids('running'), [self.shoe.pk, self.boot.pk])
+
+    def test_postings_per_term_are_capped(self):
+        uncapped = search('running')
+        with mock.patch.object(engine, 'MAX_POSTINGS_PER_TERM', 2):
+            capped = search('running')
+        # The best postings are read, and the document frequency is still the real one
+        self.assertEqual(capped, uncapped[:2])
+
+    def test_product_saves_reindex_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker.name = 'Canvas Loafer'
+            self.sneaker.save()
+        self.assertEqual(self.ids('loafer'), [self.sneaker.pk])
+        self.assertEqual(self.ids('sneaker'), [])
+
+    def test_variant_saves_reindex_their_product(self):
+        variant = self.sock.variants.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.is_active = False
+            variant.save()
+        # Inactive variants' attributes aren't indexed
+        self.assertFalse(SearchPosting.objects.filter(product=self.sock, term='black').exists())
+
+    def test_attribute_saves_reindex_their_product(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariantAttribute.objects.filter(product_variant__product=self.boot).update(attribute_value='Olive')
+            attribute = ProductVariantAttribute.objects.get(product_variant__product=self.boot)
+            attribute.save()
+        self.assertEqual(self.ids('olive'), [self.boot.pk])
+
+    def test_one_reindex_per_commit(self):
+        with mock.patch('search.signals.index_products') as index_products, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.boot.save()
+                variant = self.boot.variants.get()
+                variant.save()
+                ProductVariantAttribute.objects.get(product_variant=variant).save()
+                self.sock.save()
+        index_products.assert_called_once_with({self.boot.pk, self.sock.pk})
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Footwear', slug='footwear')
+        cls.products = {}
+        for popularity, name in enumerate(['Running Shoe', 'Running Sock', 'Rain Boot', 'Slipper']):
+            product = Product.objects.create(category=cls.category, name=name, slug=name.lower().replace(' ', '-'), popularity=popularity)
+            ProductVariant.objects.create(product=product, sku=f'SKU-{product.slug}', price=10, stock=2)
+            cls.products[name] = product
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.rebuild_index()
+
+    def labels(self, query):
+        return [suggestion['label'] for suggestion in autocomplete.suggest(query)]
+
+    def test_patches_match_a_rebuild(self):
+        self.assertEqual(self.labels('r'), ['Rain Boot', 'Running Sock', 'Running Shoe'])
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe = self.products['Running Shoe']
+            shoe.name = 'Trail Shoe'
+            shoe.save()
+            ProductVariant.objects.get(product=self.products['Rain Boot']).delete()
+            self.products['Slipper'].delete()
+            product = Product.objects.create(category=self.category, name='Rubber Clog', slug='rubber-clog', popularity=9)
+            ProductVariant.objects.create(product=product, sku='SKU-clog', price=10, stock=2)
+            # Last, so the category's score counts the products' new stock
+            self.category.name = 'Shoes'
+            self.category.save()
+
+        self.assertEqual(self.labels('r'), ['Rubber Clog', 'Running Sock'])
+        self.assertEqual(self.labels('shoe'), ['Shoes', 'Trail Shoe'])
+        self.assertEqual(self.labels('slip'), [])
+        self.assertEqual(autocomplete.warm_index(), autocomplete._build_index())
+
+    def test_changes_are_shared_as_deltas(self):
+        snapshot = autocomplete._snapshot
+        stored = cache.get(snapshot.data_key)
+        # Another worker, holding its own copy
+        worker = SharedSnapshot('autocomplete', autocomplete._build_index, autocomplete._apply_patch)
+        worker.get()
+        shoe = self.products['Running Shoe']
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.name = 'Trail Shoe'
+            shoe.save()
+        # Only the delta was published; the other worker applies it to its copy
+        self.assertEqual(cache.get(snapshot.data_key), stored)
+        self.assertEqual(cache.get(snapshot.version_key), (stored[0], 1))
+        self.assertEqual(worker.get(), autocomplete._build_index())
+
+        with mock.patch.object(SharedSnapshot, 'COMPACT_AFTER', 1), self.captureOnCommitCallbacks(execute=True):
+            shoe.name = 'Road Shoe'
+            shoe.save()
+        # Past COMPACT_AFTER deltas a full copy is published again
+        self.assertNotEqual(cache.get(snapshot.data_key)[0], stored[0])
+        self.assertEqual(worker.get(), autocomplete._build_index())
+
+    def test_imports_refresh_suggestions(self):
+        csv = io.StringIO(
+            'product_slug,product_name,category_slug,category_name,sku,price,stock\n'
+            'rain-hat,Rain Hat,hats,Hats,HAT-1,12.00,4\n'
+        )
+        rows = [row for line, row in catalog_io.read_rows(csv, 'csv')]
+        product_ids, category_ids = catalog_io.import_chunk(rows)
+        self.assertEqual(self.labels('hat'), ['Rain Hat'])
+        catalog_io.finish_import(category_ids)
+        self.assertEqual(self.labels('hat'), ['Hats', 'Rain Hat'])